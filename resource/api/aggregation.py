@@ -0,0 +1,84 @@
+"""
+Aggregation of half-hourly readings to coarser resolutions.
+
+Readings are grouped by the calendar period (UTC) their interval starts in.
+Energy is summed over each period and the cumulative value is taken from the
+period's last reading. Because series are sorted by interval start, each period
+is a contiguous run of rows, so grouping is a vectorised search for the
+boundaries between runs followed by np.add.reduceat, with no per-row Python.
+"""
+
+import datetime
+
+import numpy as np
+
+from .series import Series, to_epoch
+
+RESOLUTIONS = ("halfhour", "hour", "day", "month", "year")
+
+_FIXED_SECONDS = {"halfhour": 1800, "hour": 3600, "day": 86400}
+_CALENDAR_UNITS = {"month": "M", "year": "Y"}
+
+
+def period_starts(epochs: np.ndarray, resolution: str) -> np.ndarray:
+    """
+    Return the start, in epoch seconds, of the period each timestamp falls in
+    """
+    if resolution in _FIXED_SECONDS:
+        return epochs - epochs % _FIXED_SECONDS[resolution]
+    unit = _CALENDAR_UNITS[resolution]
+    periods = np.asarray(epochs).astype("datetime64[s]").astype(f"datetime64[{unit}]")
+    return periods.astype("datetime64[s]").astype(np.int64)
+
+
+def period_ends(starts: np.ndarray, resolution: str) -> np.ndarray:
+    """
+    Return the end, in epoch seconds, of the periods starting at `starts`
+    """
+    if resolution in _FIXED_SECONDS:
+        return starts + _FIXED_SECONDS[resolution]
+    unit = _CALENDAR_UNITS[resolution]
+    periods = np.asarray(starts).astype("datetime64[s]").astype(f"datetime64[{unit}]")
+    return (periods + 1).astype("datetime64[s]").astype(np.int64)
+
+
+def group_bounds(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the first and last row of each run of equal keys in a sorted array
+    """
+    boundaries = np.flatnonzero(np.diff(keys)) + 1
+    first = np.concatenate([[0], boundaries])
+    last = np.concatenate([boundaries - 1, [len(keys) - 1]])
+    return first, last
+
+
+def resample(
+    series: Series,
+    resolution: str,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+) -> Series:
+    """
+    Aggregate a series to the given resolution. Each aggregated reading runs
+    from the start to the end of its period, clipped to [start, end) when
+    given, so the first and last cover only the part of the period requested.
+    """
+    if resolution == "halfhour" or len(series) == 0:
+        return series
+    keys = period_starts(series.start, resolution)
+    first, last = group_bounds(keys)
+    starts = keys[first]
+    ends = period_ends(starts, resolution)
+    if start is not None:
+        starts = np.maximum(starts, to_epoch(start))
+    if end is not None:
+        ends = np.minimum(ends, to_epoch(end))
+    return Series(
+        starts,
+        ends,
+        np.asarray(series.taken_at)[last],
+        np.add.reduceat(np.asarray(series.energy), first),
+        np.asarray(series.cumulative)[last],
+        series.type,
+        series.unit,
+    )
@@ -0,0 +1,112 @@
+"""
+Bitmap of the half-hour intervals that have a reading.
+
+Each series keeps one bit per half-hour from its first reading onwards, packed
+eight to a byte, set as readings are loaded or added. How many intervals in a
+range have readings is a popcount over the bytes the range spans, and the
+covered and missing ranges are found from the changes between set and unset
+bits, so neither reads the readings themselves.
+"""
+
+import numpy as np
+
+from .series import RawReader, Series, SeriesIndex
+
+INTERVAL = 1800
+
+
+class Availability(SeriesIndex):
+    """
+    Intervals with a reading in one series, bit i being the half-hour starting
+    at origin + i * INTERVAL, most significant bit first as np.packbits packs
+    """
+
+    def __init__(self, series: Series):
+        self.origin = 0
+        self.bits = np.zeros(0, dtype=np.uint8)
+        self._set(np.asarray(series.start))
+
+    def update(self, added: Series, raw: RawReader):
+        # Readings are only ever added or corrected, so bits are only set
+        self._set(np.asarray(added.start))
+
+    def _set(self, starts: np.ndarray):
+        if len(starts) == 0:
+            return
+        first = int(starts.min()) // INTERVAL * INTERVAL
+        if len(self.bits) == 0:
+            self.origin = first
+        elif first < self.origin:
+            # Grow by whole bytes at the front so existing bits keep their place
+            shift = -(-(self.origin - first) // (8 * INTERVAL))
+            self.origin -= shift * 8 * INTERVAL
+            self.bits = np.concatenate([np.zeros(shift, dtype=np.uint8), self.bits])
+        positions = (starts - self.origin) // INTERVAL
+        size = int(positions.max()) // 8 + 1
+        if size > len(self.bits):
+            self.bits = np.concatenate(
+                [self.bits, np.zeros(size - len(self.bits), dtype=np.uint8)]
+            )
+        np.bitwise_or.at(
+            self.bits, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8)
+        )
+
+    def _positions(self, start: int, end: int) -> tuple[int, int]:
+        """
+        Return the bits for [start, end), given on half-hours, clipped to the
+        bitmap
+        """
+        size = len(self.bits) * 8
+        lo = min(max((start - self.origin) // INTERVAL, 0), size)
+        hi = min(max((end - self.origin) // INTERVAL, 0), size)
+        return lo, hi
+
+    def count(self, start: int, end: int) -> int:
+        """
+        Return the number of intervals in [start, end) that have a reading
+        """
+        lo, hi = self._positions(start, end)
+        if hi <= lo:
+            return 0
+        first, last = lo // 8, (hi - 1) // 8
+        head = 0xFF >> (lo % 8)
+        tail = (0xFF << (7 - (hi - 1) % 8)) & 0xFF
+        if first == last:
+            return int(np.bitwise_count(self.bits[first] & head & tail))
+        return int(
+            np.bitwise_count(self.bits[first] & head)
+            + np.bitwise_count(self.bits[first + 1 : last]).sum()
+            + np.bitwise_count(self.bits[last] & tail)
+        )
+
+    def ranges(
+        self, start: int, end: int
+    ) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+        """
+        Return the ranges within [start, end) that are covered by readings and
+        those that are missing, as (start, end) epoch seconds
+        """
+        if end <= start:
+            return [], []
+        # Only the bits the bitmap holds are read, however wide the range
+        lo, hi = self._positions(start, end)
+        covered = []
+        if hi > lo:
+            unpacked = np.unpackbits(self.bits[lo // 8 : (hi - 1) // 8 + 1])
+            present = unpacked[lo % 8 : lo % 8 + hi - lo].astype(np.int8)
+            changes = np.diff(np.concatenate([[0], present, [0]]))
+            first = self.origin + lo * INTERVAL
+            firsts = (first + np.flatnonzero(changes == 1) * INTERVAL).tolist()
+            lasts = (first + np.flatnonzero(changes == -1) * INTERVAL).tolist()
+            covered = list(zip(firsts, lasts))
+        return covered, missing_ranges(covered, start, end)
+
+
+def missing_ranges(
+    covered: list[tuple[int, int]], start: int, end: int
+) -> list[tuple[int, int]]:
+    """
+    Return the ranges within [start, end) between sorted covered ranges
+    """
+    bounds = [start, *(bound for pair in covered for bound in pair), end]
+    return [(a, b) for a, b in zip(bounds[::2], bounds[1::2]) if a < b]
@@ -0,0 +1,80 @@
+"""
+Cost per reading of writing JSON meter data responses.
+
+Compares the response model path, where the endpoint returns a dict per reading
+that FastAPI checks against models.MeterData and serialises, with the bytes
+written straight from the reading arrays by api/formats.py, for a synthetic
+series of each size:
+
+    python -m api.benchmark --readings 1000 10000 100000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Callable
+
+from fastapi.routing import APIRoute, serialize_response
+
+from . import formats
+from .main import app
+from .series import Series
+from .synthetic import generate
+
+FIELDS = {
+    "location": {"lat": 51.5, "lng": -0.1},
+    "provenance": {"record": "x" * 5000},
+    "watermark": "watermark",
+}
+
+
+def response_model(data: Series) -> bytes:
+    """
+    Serialise meter data as FastAPI does for a dict returned by the endpoint
+    """
+    (route,) = [
+        r
+        for r in app.routes
+        if isinstance(r, APIRoute) and r.path == "/datasources/{id}/{measure}"
+    ]
+    return asyncio.run(
+        serialize_response(
+            field=route.response_field,
+            response_content={"data": data.to_readings(), **FIELDS},
+            exclude_none=route.response_model_exclude_none,
+            dump_json=True,
+        )
+    )
+
+
+def direct(data: Series) -> bytes:
+    return formats.json_meter_data(data, FIELDS)
+
+
+def per_reading(write: Callable[[Series], bytes], data: Series, repeat: int) -> float:
+    """
+    Return the fastest of repeat runs in microseconds per reading
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        write(data)
+        times.append(time.perf_counter() - started)
+    return min(times) / len(data) * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time JSON meter data responses per reading"
+    )
+    parser.add_argument("--readings", type=int, nargs="+", default=[1000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    _, _, series = next(generate(1, 1 + max(args.readings) // 17520))
+    print(f"{'readings':>10} {'model µs':>10} {'direct µs':>10} {'speedup':>8}")
+    for count in args.readings:
+        data = series.take(slice(0, count))
+        before = per_reading(response_model, data, args.repeat)
+        after = per_reading(direct, data, args.repeat)
+        print(f"{count:>10} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x")
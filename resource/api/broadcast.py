@@ -0,0 +1,155 @@
+"""
+In-process broadcast of readings as they are added to the reading store.
+
+Each (meter id, measure) with subscribers has one bounded queue of the batches
+of readings added to it, shared by all of its subscribers. Publishing appends
+to the queue and wakes the subscribers, each of which reads on from its own
+position, so a batch is held once however many clients are listening, and
+adding readings never waits for a client. A subscriber whose client reads so
+slowly that it falls more than the queue's capacity behind has missed readings
+and gets SubscriberLagged, so it can catch up with a `since` query instead.
+
+Readings added in this process are published as they are added. Readings
+written by other processes, such as api.ingest, are found by the store polling
+its database or files while a series has subscribers, see Indexes.subscribe.
+"""
+
+import asyncio
+import collections
+import threading
+
+from . import conf
+from .exceptions import SubscriberLagged
+from .series import Series
+
+
+class Topic:
+    """
+    Batches recently added to one series, numbered from 1 in the order added
+    """
+
+    def __init__(self, capacity: int):
+        self.batches: collections.deque[tuple[int, Series, str]] = collections.deque(
+            maxlen=capacity
+        )
+        self.sequence = 0
+        self.subscribers: set["Subscription"] = set()
+
+
+class Subscription:
+    """
+    One subscriber's position in a topic, used from its event loop
+    """
+
+    def __init__(self, broadcaster: "Broadcaster", key: tuple[str, str], topic: Topic):
+        self.broadcaster = broadcaster
+        self.key = key
+        self.topic = topic
+        self.position = topic.sequence
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc):
+        self.broadcaster.unsubscribe(self)
+
+    def wake(self):
+        """
+        Wake the subscriber, from any thread
+        """
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # The loop has closed and the subscription is being dropped
+            pass
+
+    def pending(self) -> list[tuple[Series, str]]:
+        """
+        Return the (readings, watermark) batches published since the last call
+
+        Raises:
+            SubscriberLagged: If batches were dropped before they were read
+        """
+        with self.broadcaster.lock:
+            topic = self.topic
+            oldest = topic.batches[0][0] if topic.batches else topic.sequence + 1
+            if oldest > self.position + 1:
+                raise SubscriberLagged(
+                    f"{topic.sequence - self.position} batches behind, "
+                    f"{len(topic.batches)} kept"
+                )
+            batches = [(s, w) for n, s, w in topic.batches if n > self.position]
+            self.position = topic.sequence
+        return batches
+
+    async def get(self, timeout: float) -> list[tuple[Series, str]]:
+        """
+        Wait up to timeout seconds for readings to be published, returning
+        the batches published or an empty list
+        """
+        self._event.clear()
+        if batches := self.pending():
+            return batches
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except TimeoutError:
+            return []
+        return self.pending()
+
+
+class Broadcaster:
+    """
+    Topics for the series with subscribers
+    """
+
+    def __init__(self, capacity: int = conf.BROADCAST_BUFFER):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self._topics: dict[tuple[str, str], Topic] = {}
+
+    def subscribed(self, meter_id: str, measure: str) -> bool:
+        return (meter_id, measure) in self._topics
+
+    def keys(self) -> list[tuple[str, str]]:
+        """
+        Return the (meter id, measure) of each series with subscribers
+        """
+        with self.lock:
+            return list(self._topics)
+
+    def publish(self, meter_id: str, measure: str, series: Series, watermark: str):
+        """
+        Queue readings added to a series, with the watermark after adding them
+        """
+        with self.lock:
+            topic = self._topics.get((meter_id, measure))
+            if topic is None:
+                return
+            topic.sequence += 1
+            topic.batches.append((topic.sequence, series, watermark))
+            subscribers = list(topic.subscribers)
+        for subscriber in subscribers:
+            subscriber.wake()
+
+    def subscribe(self, meter_id: str, measure: str) -> Subscription:
+        """
+        Subscribe to readings added to a series from now on. Must be called
+        from the event loop the subscriber waits on.
+        """
+        key = (meter_id, measure)
+        with self.lock:
+            topic = self._topics.setdefault(key, Topic(self.capacity))
+            subscription = Subscription(self, key, topic)
+            topic.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            topic = self._topics.get(subscription.key)
+            if topic is None:
+                return
+            topic.subscribers.discard(subscription)
+            if not topic.subscribers:
+                del self._topics[subscription.key]
@@ -0,0 +1,109 @@
+"""
+Emissions from meter readings and a half-hourly grid carbon intensity series.
+
+Intensity is held as columns, like readings, so emissions for a range are a
+vectorised join on interval start, a multiply, and a grouped sum.
+
+The sample intensity file, data/carbon_intensity.csv, is illustrative and
+covers the dates of the sample readings. Other sources can be added by
+subclassing IntensitySource and selecting them in get_intensity_source.
+"""
+
+import csv
+import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from . import conf
+from .aggregation import group_bounds, period_ends, period_starts
+from .logger import get_logger
+from .series import Series, parse_timestamp, to_epoch
+
+logger = get_logger()
+
+# Intensity is in grams of CO2 equivalent per kWh, emissions in grams
+INTENSITY_UNIT = "gCO2e/kWh"
+EMISSIONS_UNIT = "GRM"
+WH_PER_KWH = 1000.0
+
+
+class IntensitySource:
+    """
+    Half-hourly carbon intensity, as columns sorted by interval start
+    """
+
+    def __init__(self, start: np.ndarray, intensity: np.ndarray):
+        order = np.argsort(start, kind="stable")
+        self.start = start[order]
+        self.intensity = intensity[order]
+
+    def lookup(self, starts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the intensity for each interval start, and a mask of the starts
+        the source has a value for
+        """
+        if len(self.start) == 0:
+            return np.zeros(len(starts)), np.zeros(len(starts), dtype=bool)
+        index = np.searchsorted(self.start, starts)
+        index = np.minimum(index, len(self.start) - 1)
+        found = self.start[index] == starts
+        return np.where(found, self.intensity[index], 0.0), found
+
+
+def load_csv(path: str) -> IntensitySource:
+    """
+    Load a CSV file with `from` (ISO 8601 interval start) and `intensity`
+    (gCO2e/kWh) columns
+    """
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    source = IntensitySource(
+        np.array([to_epoch(parse_timestamp(r["from"])) for r in rows], dtype=np.int64),
+        np.array([float(r["intensity"]) for r in rows], dtype=np.float64),
+    )
+    logger.info(f"Loaded {len(rows)} carbon intensity values from {path}")
+    return source
+
+
+@lru_cache(maxsize=None)
+def get_intensity_source() -> IntensitySource:
+    return load_csv(conf.CARBON_INTENSITY_FILE)
+
+
+def emissions(
+    series: Series,
+    source: IntensitySource,
+    resolution: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> dict:
+    """
+    Multiply each reading's energy by the intensity of its interval and sum
+    energy and emissions by period. Readings without an intensity value are
+    left out of both sums and counted as unmatched.
+    """
+    intensity, found = source.lookup(np.asarray(series.start))
+    energy = np.where(found, series.energy, 0.0)
+    grams = energy / WH_PER_KWH * intensity
+    periods: list[dict] = []
+    if len(series):
+        keys = period_starts(np.asarray(series.start), resolution)
+        first, _ = group_bounds(keys)
+        starts = np.maximum(keys[first], to_epoch(start))
+        ends = np.minimum(period_ends(keys[first], resolution), to_epoch(end))
+        periods = [
+            {"from": a, "to": b, "energy": e, "emissions": g}
+            for a, b, e, g in zip(
+                starts.tolist(),
+                ends.tolist(),
+                np.add.reduceat(energy, first).tolist(),
+                np.add.reduceat(grams, first).tolist(),
+            )
+        ]
+    return {
+        "energy": float(energy.sum()),
+        "emissions": float(grams.sum()),
+        "unmatched": int(len(series) - found.sum()),
+        "periods": periods,
+    }
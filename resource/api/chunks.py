@@ -0,0 +1,230 @@
+"""
+Compressed, chunked in-memory storage for long reading series.
+
+A series is split into fixed-size chunks of consecutive readings. Within a
+chunk, timestamp columns are delta-of-delta encoded (regular half-hourly
+readings become runs of zeros) and value columns are XOR encoded against the
+previous value's bit pattern, then each column is zlib compressed. Every chunk
+keeps its first interval start and last interval end uncompressed, so a range
+query only decompresses the chunks it overlaps. Chunks can be written to files
+for the cold tier of tiered storage, see api/tiers.py.
+"""
+
+import datetime
+import json
+import zlib
+
+import numpy as np
+
+from .series import Series, to_epoch
+
+TIMESTAMP_COLUMNS = ("start", "end", "taken_at")
+VALUE_COLUMNS = ("energy", "cumulative")
+
+
+def _narrowest_int(values: np.ndarray) -> np.ndarray:
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if values.size == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return values.astype(dtype)
+    return values
+
+
+def encode_timestamps(values: np.ndarray) -> tuple[int, int, str, bytes]:
+    """
+    Delta-of-delta encode epoch seconds, returning the first value, first delta,
+    dtype of the encoded deltas and their compressed bytes.
+    """
+    first = int(values[0])
+    first_delta = int(values[1] - values[0]) if len(values) > 1 else 0
+    deltas = _narrowest_int(np.diff(values.astype(np.int64), n=2))
+    return first, first_delta, deltas.dtype.str, zlib.compress(deltas.tobytes())
+
+
+def decode_timestamps(
+    first: int, first_delta: int, dtype: str, data: bytes, count: int
+) -> np.ndarray:
+    values = np.empty(count, dtype=np.int64)
+    values[0] = first
+    if count > 1:
+        deltas = np.full(count - 1, first_delta, dtype=np.int64)
+        deltas[1:] += np.cumsum(
+            np.frombuffer(zlib.decompress(data), dtype=dtype), dtype=np.int64
+        )
+        values[1:] = first + np.cumsum(deltas)
+    return values
+
+
+def encode_values(values: np.ndarray) -> bytes:
+    """
+    XOR each float64 with the previous one's bit pattern. Slowly changing values
+    share their sign, exponent and leading mantissa bits, leaving mostly zero
+    bytes to compress.
+    """
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.uint64)
+    xored = bits.copy()
+    xored[1:] ^= bits[:-1]
+    return zlib.compress(xored.tobytes())
+
+
+def decode_values(data: bytes) -> np.ndarray:
+    xored = np.frombuffer(zlib.decompress(data), dtype=np.uint64)
+    return np.bitwise_xor.accumulate(xored).view(np.float64)
+
+
+class Chunk:
+    """
+    A compressed run of consecutive readings with an uncompressed time header
+    """
+
+    def __init__(self, series: Series):
+        self.count = len(series)
+        self.min_start = int(series.start[0])
+        self.max_end = int(series.end.max())
+        self.timestamps = {
+            column: encode_timestamps(getattr(series, column))
+            for column in TIMESTAMP_COLUMNS
+        }
+        self.values = {
+            column: encode_values(getattr(series, column)) for column in VALUE_COLUMNS
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(encoded[3]) for encoded in self.timestamps.values()) + sum(
+            len(data) for data in self.values.values()
+        )
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialise the chunk: a JSON header line, then the compressed columns
+        """
+        header = {
+            "count": self.count,
+            "minStart": self.min_start,
+            "maxEnd": self.max_end,
+            "timestamps": {
+                column: [first, delta, dtype, len(data)]
+                for column, (first, delta, dtype, data) in self.timestamps.items()
+            },
+            "values": {column: len(data) for column, data in self.values.items()},
+        }
+        payloads = [data for *_, data in self.timestamps.values()]
+        payloads += list(self.values.values())
+        return json.dumps(header).encode() + b"\n" + b"".join(payloads)
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> "Chunk":
+        line, _, payload = content.partition(b"\n")
+        header = json.loads(line)
+        chunk = cls.__new__(cls)
+        chunk.count = header["count"]
+        chunk.min_start = header["minStart"]
+        chunk.max_end = header["maxEnd"]
+        offset = 0
+
+        def take(length: int) -> bytes:
+            nonlocal offset
+            offset += length
+            return payload[offset - length : offset]
+
+        chunk.timestamps = {
+            column: (first, delta, dtype, take(length))
+            for column, (first, delta, dtype, length) in header["timestamps"].items()
+        }
+        chunk.values = {
+            column: take(length) for column, length in header["values"].items()
+        }
+        return chunk
+
+    def decode(self, type: str, unit: str) -> Series:
+        columns = {
+            column: decode_timestamps(*encoded, self.count)
+            for column, encoded in self.timestamps.items()
+        }
+        columns.update(
+            {column: decode_values(data) for column, data in self.values.items()}
+        )
+        return Series(**columns, type=type, unit=unit)
+
+
+class ChunkedSeries:
+    """
+    A series held as compressed chunks, answering the same range queries as
+    Series by decompressing only the chunks that overlap the range.
+    """
+
+    def __init__(self, chunks: list[Chunk], type: str, unit: str, chunk_size: int):
+        self.chunks = chunks
+        self.type = type
+        self.unit = unit
+        self.chunk_size = chunk_size
+        self._index()
+
+    def _index(self):
+        self.min_starts = np.array([c.min_start for c in self.chunks], dtype=np.int64)
+        # Running maximum keeps the array sorted for searchsorted
+        self.max_ends = np.maximum.accumulate(
+            np.array([c.max_end for c in self.chunks], dtype=np.int64)
+        )
+
+    @classmethod
+    def from_series(cls, series: Series, chunk_size: int) -> "ChunkedSeries":
+        return cls(cls._chunk(series, chunk_size), series.type, series.unit, chunk_size)
+
+    @staticmethod
+    def _chunk(series: Series, chunk_size: int) -> list[Chunk]:
+        return [
+            Chunk(series.take(slice(i, i + chunk_size)))
+            for i in range(0, len(series), chunk_size)
+        ]
+
+    def __len__(self) -> int:
+        return sum(chunk.count for chunk in self.chunks)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(chunk.nbytes for chunk in self.chunks)
+
+    def _decode(self, lo: int, hi: int) -> Series:
+        if lo >= hi:
+            return Series.empty(self.type, self.unit)
+        return Series.join(
+            [chunk.decode(self.type, self.unit) for chunk in self.chunks[lo:hi]]
+        )
+
+    def to_series(self) -> Series:
+        return self._decode(0, len(self.chunks))
+
+    def between(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        limit: int | None = None,
+    ) -> Series:
+        """
+        Decompress the chunks overlapping [start, end) and slice the result
+        """
+        lo = int(np.searchsorted(self.max_ends, to_epoch(start), side="right"))
+        hi = int(np.searchsorted(self.min_starts, to_epoch(end), side="left"))
+        if limit is not None and hi > lo:
+            # Chunks after the first start in range, but concat can leave them
+            # part full, so read only as many as hold the limit by their counts
+            counts = [chunk.count for chunk in self.chunks[lo + 1 : hi]]
+            hi = min(hi, lo + 2 + int(np.searchsorted(np.cumsum(counts), limit)))
+        return self._decode(lo, hi).between(start, end, limit)
+
+    def concat(self, other: Series) -> "ChunkedSeries":
+        """
+        Merge readings into the series. Only chunks from the first one the new
+        readings touch onwards are re-encoded, so appending recent readings
+        costs one chunk rather than the whole history.
+        """
+        if len(other) == 0:
+            return self
+        first = int(
+            np.searchsorted(self.max_ends, int(other.start.min()), side="right")
+        )
+        tail = self._decode(first, len(self.chunks)).concat(other)
+        chunks = self.chunks[:first] + self._chunk(tail, self.chunk_size)
+        return ChunkedSeries(chunks, self.type, self.unit, self.chunk_size)
@@ -0,0 +1,108 @@
+"""
+Columnar on-disk format for meter readings.
+
+Each series is a directory, {root}/{meter_id}/{measure}, holding one .npy file
+per column plus a small meta.json with the reading type and unit. Columns are
+opened with mmap_mode="r" so every worker process maps the same pages, and
+slicing a series is zero-copy.
+
+Convert a JSON readings file with:
+
+    python -m api.columnar data/sample_data.json data/columnar METER_ID import export
+"""
+
+import argparse
+import json
+import os
+from typing import Iterator
+
+import numpy as np
+
+from .series import Series
+
+META_FILE = "meta.json"
+
+
+def series_path(root: str, meter_id: str, measure: str) -> str:
+    return os.path.join(root, meter_id, measure)
+
+
+def write_series(series: Series, path: str):
+    """
+    Write a series to a directory, replacing any columns already there
+    """
+    os.makedirs(path, exist_ok=True)
+    for column in Series.COLUMNS:
+        # Write then rename so readers never map a partially written file
+        tmp = os.path.join(path, f".{column}.npy")
+        np.save(tmp, np.ascontiguousarray(getattr(series, column)))
+        os.replace(tmp, os.path.join(path, f"{column}.npy"))
+    write_meta(path, series.type, series.unit)
+
+
+def write_meta(path: str, type: str, unit: str):
+    """
+    Write meta.json last, after the columns, so a reader that sees it change
+    sees the new columns
+    """
+    tmp = os.path.join(path, f".{META_FILE}")
+    with open(tmp, "w") as f:
+        json.dump({"type": type, "unitCode": unit}, f)
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+
+def signature(path: str) -> tuple[int, int] | None:
+    """
+    Return the meta.json modification time and start column size of a series
+    directory, which change when the series is written, or None if missing
+    """
+    try:
+        meta = os.stat(os.path.join(path, META_FILE))
+        start = os.stat(os.path.join(path, "start.npy"))
+    except FileNotFoundError:
+        return None
+    return meta.st_mtime_ns, start.st_size
+
+
+def read_series(path: str) -> Series:
+    """
+    Open a series directory with each column memory mapped
+    """
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    columns = [
+        np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r")
+        for column in Series.COLUMNS
+    ]
+    return Series(*columns, meta["type"], meta["unitCode"])
+
+
+def read_all(root: str) -> Iterator[tuple[tuple[str, str], Series]]:
+    """
+    Yield ((meter id, measure), series) for every series under root
+    """
+    for meter_id in sorted(os.listdir(root)):
+        meter_path = os.path.join(root, meter_id)
+        if not os.path.isdir(meter_path):
+            continue
+        for measure in sorted(os.listdir(meter_path)):
+            path = os.path.join(meter_path, measure)
+            if os.path.isfile(os.path.join(path, META_FILE)):
+                yield (meter_id, measure), read_series(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a JSON readings file to the columnar format"
+    )
+    parser.add_argument("source", help="JSON list of readings")
+    parser.add_argument("root", help="Columnar readings directory")
+    parser.add_argument("meter_id")
+    parser.add_argument("measures", nargs="+")
+    args = parser.parse_args()
+
+    with open(args.source) as f:
+        series = Series.from_readings(json.load(f))
+    for measure in args.measures:
+        write_series(series, series_path(args.root, args.meter_id, measure))
+    print(f"Wrote {len(series)} readings for {args.meter_id} to {args.root}")
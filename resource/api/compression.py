@@ -0,0 +1,178 @@
+"""
+Compressed meter data responses.
+
+A meter data response is its readings followed by a small tail holding the
+location and a provenance record signed for each request. The readings are
+compressed on their own with the encoding the client asked for and flushed to a
+byte boundary without ending the stream, and kept in a bounded LRU cache keyed
+on the slice of readings and its ETag. Each response is then the cached prefix
+followed by the tail in stored (uncompressed) blocks and the end of the stream,
+which is valid gzip, brotli or zstd, so repeated requests for a slice skip both
+serialising and compressing the readings. The tail is mostly the signature and
+certificates in the provenance record, which would not compress much anyway.
+"""
+
+import collections
+import struct
+import threading
+import zlib
+from functools import lru_cache
+
+import brotli
+import zstandard
+
+from . import conf
+
+# In order of preference when the client accepts several equally
+ENCODINGS = ("zstd", "br", "gzip")
+# Compression level of each encoding, paid once per cached slice
+LEVELS = {"zstd": 6, "br": 6, "gzip": 6}
+# Largest stored block of each format
+STORED_BLOCK = {"gzip": 0xFFFF, "br": 0xFFFF, "zstd": 0x8000}
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """
+    Return the supported encoding an Accept-Encoding header prefers, or None
+    """
+    best, best_q = None, 0.0
+    for part in (accept_encoding or "").split(","):
+        name, *params = (p.strip() for p in part.split(";"))
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        candidates = ENCODINGS if name == "*" else (name.lower(),)
+        for encoding in candidates:
+            if encoding not in ENCODINGS or q <= 0:
+                continue
+            if q > best_q or (
+                q == best_q and ENCODINGS.index(encoding) < ENCODINGS.index(best)
+            ):
+                best, best_q = encoding, q
+    return best
+
+
+class Prefix:
+    """
+    The start of a compressed stream, ending on a byte boundary
+    """
+
+    def __init__(self, encoding: str, data: bytes):
+        self.encoding = encoding
+        self.length = len(data)
+        self.crc = zlib.crc32(data)
+        if encoding == "gzip":
+            compressor = zlib.compressobj(LEVELS[encoding], zlib.DEFLATED, 31)
+            self.content = compressor.compress(data) + compressor.flush(
+                zlib.Z_SYNC_FLUSH
+            )
+        elif encoding == "br":
+            compressor = brotli.Compressor(quality=LEVELS[encoding])
+            self.content = compressor.process(data) + compressor.flush()
+        else:
+            compressor = zstandard.ZstdCompressor(LEVELS[encoding]).compressobj()
+            self.content = compressor.compress(data) + compressor.flush(
+                zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            )
+
+    def __len__(self) -> int:
+        return len(self.content)
+
+    def finish(self, tail: bytes) -> bytes:
+        """
+        Return the whole stream, with tail appended uncompressed
+        """
+        if not self.content:
+            # zstd writes nothing, not even the frame header, for no data
+            return zstandard.ZstdCompressor(LEVELS[self.encoding]).compress(tail)
+        size = STORED_BLOCK[self.encoding]
+        chunks = [tail[i : i + size] for i in range(0, len(tail), size)] or [b""]
+        parts = [self.content]
+        for i, chunk in enumerate(chunks):
+            last = i == len(chunks) - 1
+            if self.encoding == "gzip":
+                # BFINAL and BTYPE 00, padded to the byte, then LEN and NLEN
+                parts.append(
+                    struct.pack("<BHH", last, len(chunk), ~len(chunk) & 0xFFFF)
+                )
+            elif self.encoding == "br":
+                # ISLAST 0, MNIBBLES 0 (4 nibbles), MLEN - 1, ISUNCOMPRESSED 1
+                if chunk:
+                    parts.append(
+                        ((len(chunk) - 1) << 3 | 1 << 19).to_bytes(3, "little")
+                    )
+            else:
+                # Last_Block, Block_Type 0 (raw) and Block_Size
+                parts.append((last | len(chunk) << 3).to_bytes(3, "little"))
+            parts.append(chunk)
+        if self.encoding == "gzip":
+            parts.append(
+                struct.pack(
+                    "<II",
+                    zlib.crc32(tail, self.crc),
+                    (self.length + len(tail)) & 0xFFFFFFFF,
+                )
+            )
+        elif self.encoding == "br":
+            # ISLAST 1 and ISLASTEMPTY 1
+            parts.append(b"\x03")
+        return b"".join(parts)
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    """
+    Compress a whole body, for responses that are not cached
+    """
+    return Prefix(encoding, data).finish(b"")
+
+
+class SliceCache:
+    """
+    Compressed prefixes of recent responses, each with a dict of what else
+    the response needs from its readings, least recently used dropped first
+    when the prefixes hold more than max_bytes
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: collections.OrderedDict[tuple, tuple[Prefix, dict]] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> tuple[Prefix, dict] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, prefix: Prefix, extra: dict):
+        if len(prefix) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key)[0])
+            self._entries[key] = (prefix, extra)
+            self.size += len(prefix)
+            while self.size > self.max_bytes:
+                _, (dropped, _) = self._entries.popitem(last=False)
+                self.size -= len(dropped)
+
+
+@lru_cache(maxsize=None)
+def get_slice_cache() -> SliceCache:
+    return SliceCache(conf.COMPRESSION_CACHE_BYTES)
@@ -34,3 +34,59 @@ SCHEME_BASE_URL = os.environ.get(
     "SCHEME_BASE_URL",
     "https://registry.core.sandbox.trust.ib1.org/scheme/perseus",
 )
+
+# Meter readings served by the datasources endpoints
+DEMO_METER_ID = os.environ.get("DEMO_METER_ID", "S018011012261305588165")
+DEMO_MEASURES = ["import", "export"]
+READINGS_FILE = os.environ.get("READINGS_FILE", f"{ROOT_DIR}/data/sample_data.json")
+# json: load READINGS_FILE for the demo meter
+# columnar: memory map every series under READINGS_DIR, see api/columnar.py
+# sqlite: query READINGS_DATABASE on demand, see api/sqlite_store.py
+READINGS_BACKEND = os.environ.get("READINGS_BACKEND", "json")
+READINGS_DIR = os.environ.get("READINGS_DIR", f"{ROOT_DIR}/data/columnar")
+READINGS_DATABASE = os.environ.get("READINGS_DATABASE", f"{ROOT_DIR}/data/readings.db")
+# Hold json readings compressed in chunks of this many readings, 0 to disable
+READINGS_CHUNK_SIZE = int(os.environ.get("READINGS_CHUNK_SIZE", "0"))
+# Keep READINGS_HOT_DAYS of json or columnar readings in memory and older months
+# in files under READINGS_TIER_DIR, if set, see api/tiers.py
+READINGS_TIER_DIR = os.environ.get("READINGS_TIER_DIR", "")
+READINGS_HOT_DAYS = int(os.environ.get("READINGS_HOT_DAYS", "90"))
+READINGS_PROMOTED_BYTES = int(os.environ.get("READINGS_PROMOTED_BYTES", str(64 << 20)))
+# Half-hourly grid carbon intensity (gCO2e/kWh) used for emissions
+CARBON_INTENSITY_FILE = os.environ.get(
+    "CARBON_INTENSITY_FILE", f"{ROOT_DIR}/data/carbon_intensity.csv"
+)
+# Time-of-use bands as name=HH:MM-HH:MM ranges (UTC), see api/timeofuse.py
+TIME_OF_USE_BANDS = os.environ.get(
+    "TIME_OF_USE_BANDS", "overnight=00:00-07:00,peak=16:00-19:00"
+)
+TIME_OF_USE_DEFAULT_BAND = os.environ.get("TIME_OF_USE_DEFAULT_BAND", "off-peak")
+# Meters and the accounts allowed to read them, see api/registry.py
+METER_REGISTRY_FILE = os.environ.get(
+    "METER_REGISTRY_FILE", f"{ROOT_DIR}/data/meters.json"
+)
+# Batches of added readings held for subscribers to new readings, see
+# api/broadcast.py, and how often the event stream sends a keepalive comment
+# and a signed provenance frame for the readings sent since the last one
+BROADCAST_BUFFER = int(os.environ.get("BROADCAST_BUFFER", "256"))
+# How often stores check for readings written by other processes, such as
+# api.ingest, while a series has subscribers
+EVENTS_POLL_SECONDS = float(os.environ.get("EVENTS_POLL_SECONDS", "1"))
+EVENTS_KEEPALIVE_SECONDS = float(os.environ.get("EVENTS_KEEPALIVE_SECONDS", "15"))
+EVENTS_PROVENANCE_SECONDS = float(os.environ.get("EVENTS_PROVENANCE_SECONDS", "60"))
+# Set by the Lambda runtime, where background work is frozen between
+# invocations and each instance has its own disk
+LAMBDA = "AWS_LAMBDA_FUNCTION_NAME" in os.environ
+# Export job files and state, shared by the worker processes, see api/exports.py.
+# With no workers, jobs are written within the request. Exports are refused on
+# Lambda.
+EXPORTS_DIR = os.environ.get("EXPORTS_DIR", f"{ROOT_DIR}/output/exports")
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "1"))
+# A queued or running job not heard from for this long is run again
+EXPORT_STALE_SECONDS = float(os.environ.get("EXPORT_STALE_SECONDS", "300"))
+# Bytes of compressed meter data kept for repeated requests, see api/compression.py
+COMPRESSION_CACHE_BYTES = int(os.environ.get("COMPRESSION_CACHE_BYTES", str(64 << 20)))
+# Worker processes for multi-meter aggregations, and how many more meters may
+# wait for them before requests are turned away, see api/pool.py
+AGGREGATION_WORKERS = int(os.environ.get("AGGREGATION_WORKERS", "2"))
+AGGREGATION_QUEUE = int(os.environ.get("AGGREGATION_QUEUE", "32"))
@@ -58,3 +58,25 @@ class AccessTokenCertificateError(AccessTokenValidatorError):
 
 class AccessTokenDecodingError(AccessTokenValidatorError):
     pass
+
+
+class IngestError(Exception):
+    """
+    Readings rejected by bulk ingestion
+    """
+
+
+class SubscriberLagged(Exception):
+    """
+    A subscriber to new readings fell too far behind and missed some
+    """
+
+
+class PoolBusy(Exception):
+    """
+    The aggregation pool has no room for more work
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
@@ -0,0 +1,231 @@
+"""
+Export jobs writing long ranges of meter data to files.
+
+A job is submitted with a meter, measure, date range and format, and written by
+a background worker to a file under EXPORTS_DIR, a month of readings at a time
+so memory use does not grow with the range. With no workers the job is written
+before submit returns. The job's state is kept in a JSON file beside it, so any
+worker process sharing the directory can report on it and serve the download.
+Jobs are identified by a digest of what was asked for and the ETag of the
+range, see api/sync.py, so the same request for unchanged data returns the
+existing job rather than writing the file again. A running job records a
+heartbeat as it writes each month, and a queued or running job without one for
+EXPORT_STALE_SECONDS, as when its process died, is run again.
+
+The provenance record for the transfer is signed when the file is complete and
+kept with the job.
+
+Exports are refused on Lambda, where a background job would be frozen between
+invocations, a job written within the request would hit the API Gateway
+timeout, and the files would stay on the instance that wrote them.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable
+
+from . import conf, formats, provenance
+from .logger import get_logger
+from .series import Series, date_range, from_epoch, to_epoch
+from .sqlite_store import SqliteStore
+from .store import ReadingStore
+
+logger = get_logger()
+
+# Readings read and written at a time
+CHUNK_SECONDS = 31 * 86400
+MEDIA_TYPES = {"csv": formats.CSV, "parquet": formats.PARQUET}
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETE = "complete"
+FAILED = "failed"
+
+
+class CsvWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "w")
+        self.file.write(formats.CSV_HEADER)
+
+    def write(self, chunk: Series):
+        self.file.write(formats.csv_lines(chunk))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """
+    Writes each chunk as a row group, taking the schema from the first
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = None
+
+    def write(self, chunk: Series):
+        import pyarrow.parquet as pq
+
+        table = formats.arrow_table(chunk)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "parquet": ParquetWriter}
+
+
+def _part(path: str) -> str:
+    # Unique to the writer, so concurrent writes of a job never share a file
+    return f"{path}.{os.urandom(4).hex()}.part"
+
+
+def stale(job: dict) -> bool:
+    """
+    Return True if a queued or running job has not saved its state for
+    EXPORT_STALE_SECONDS
+    """
+    return (
+        job["status"] in (QUEUED, RUNNING)
+        and time.time() - job.get("heartbeat", 0) > conf.EXPORT_STALE_SECONDS
+    )
+
+
+def job_key(account: str, request: dict, etag: str) -> str:
+    key = json.dumps([account, request, etag], sort_keys=True)
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+class Exports:
+    """
+    Export jobs in a directory, written by a pool of background workers, or
+    within submit if there are none
+    """
+
+    def __init__(self, directory: str, workers: int = 1):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.executor = None
+        if workers:
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix="export")
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def get(self, key: str) -> dict | None:
+        """
+        Return the state of a job, or None if there is no such job
+        """
+        try:
+            with open(self._path(key, "json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save(self, job: dict):
+        # Replace the state in one step so it is never read half written, from
+        # a file of its own as another process may be saving the same job
+        path = self._path(job["jobId"], "json")
+        part = _part(path)
+        with open(part, "w") as f:
+            json.dump({**job, "heartbeat": time.time()}, f)
+        os.replace(part, path)
+
+    def file(self, job: dict) -> str:
+        return self._path(job["jobId"], job["format"])
+
+    def submit(
+        self,
+        readings: ReadingStore | SqliteStore,
+        account: str,
+        meter_id: str,
+        measure: str,
+        from_date: datetime.date,
+        to_date: datetime.date,
+        format: str,
+        sign: Callable[[bool], dict],
+    ) -> dict:
+        """
+        Queue a job, or return the existing job for the same request. `sign`
+        returns the provenance record for the export, given whether the range
+        has a reading for every interval.
+        """
+        request = {
+            "id": meter_id,
+            "measure": measure,
+            "from": from_date.isoformat(),
+            "to": to_date.isoformat(),
+            "format": format,
+        }
+        start, end = date_range(from_date, to_date)
+        key = job_key(account, request, readings.etag(meter_id, measure, start, end))
+        job = self.get(key)
+        if job is not None and job["status"] != FAILED and not stale(job):
+            return job
+        job = {
+            "jobId": key,
+            "account": account,
+            **request,
+            "status": QUEUED,
+            "submitted": provenance.to_iso(datetime.datetime.now(datetime.UTC)),
+        }
+        self._save(job)
+        if self.executor is None:
+            self._run(job, readings, start, end, sign)
+            return self.get(key) or job
+        self.executor.submit(self._run, job, readings, start, end, sign)
+        return job
+
+    def _run(
+        self,
+        job: dict,
+        readings: ReadingStore | SqliteStore,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        sign: Callable[[bool], dict],
+    ):
+        self._save({**job, "status": RUNNING})
+        meter_id, measure = job["id"], job["measure"]
+        path = self.file(job)
+        part = _part(path)
+        rows = 0
+        try:
+            writer = WRITERS[job["format"]](part)
+            try:
+                for first in range(to_epoch(start), to_epoch(end), CHUNK_SECONDS):
+                    last = min(first + CHUNK_SECONDS, to_epoch(end))
+                    chunk = readings.between(
+                        meter_id, measure, from_epoch(first), from_epoch(last)
+                    )
+                    writer.write(chunk)
+                    rows += len(chunk)
+                    self._save({**job, "status": RUNNING})
+            finally:
+                writer.close()
+            os.replace(part, path)
+            record = sign(readings.complete(meter_id, measure, start, end))
+        except Exception as e:
+            logger.exception(f"Export {job['jobId']} failed")
+            if os.path.exists(part):
+                os.remove(part)
+            self._save({**job, "status": FAILED, "error": str(e)})
+            return
+        logger.info(f"Export {job['jobId']} wrote {rows} readings to {path}")
+        self._save({**job, "status": COMPLETE, "rows": rows, "provenance": record})
+
+
+@lru_cache(maxsize=None)
+def get_exports() -> Exports:
+    """
+    Return the export jobs of this process, creating EXPORTS_DIR on first use
+    """
+    return Exports(conf.EXPORTS_DIR, conf.EXPORT_WORKERS)
@@ -0,0 +1,258 @@
+"""
+Alternative response formats for meter data.
+
+JSON meter data is written straight to bytes from the reading arrays too,
+rather than through a dict per reading and the MeterData response model. The
+readings were checked when they were loaded, so checking each one again on
+every response would only add cost; the response model still documents the
+shape in the OpenAPI schema. See `python -m api.benchmark` for the cost per
+reading of each.
+
+Besides JSON, meter data can be sent as an Arrow IPC stream, CSV or
+MessagePack. Each is written straight from the reading arrays, without a dict
+per reading. Arrow and MessagePack carry everything else in the response, such
+as location and provenance, in the body: Arrow in the schema metadata, and
+MessagePack beside the reading columns. CSV carries them in response headers.
+"""
+
+import base64
+import json
+from typing import Iterator
+
+import msgpack
+import numpy as np
+import orjson
+
+from .series import Series, format_timestamps
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+EVENT_STREAM = "text/event-stream"
+CSV = "text/csv"
+PARQUET = "application/vnd.apache.parquet"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/vnd.msgpack"
+# Formats of meter data written from the reading arrays, by media type
+COLUMNAR = (ARROW_STREAM, CSV, MSGPACK)
+CSV_HEADER = "from,to,takenAt,energy,cumulative\n"
+
+
+def _ranges(accept: str | None) -> list[tuple[str, float]]:
+    """
+    Return the (media range, q) of each part of an Accept header, in order
+    """
+    ranges = []
+    for part in (accept or "").split(","):
+        media_range, *params = (p.strip() for p in part.split(";"))
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_range:
+            ranges.append((media_range.lower(), q))
+    return ranges
+
+
+def _quality(ranges: list[tuple[str, float]], media_type: str) -> tuple[float, int]:
+    """
+    Return the q of the most specific media range matching a media type, and
+    the position of that range, or q 0 if none match
+    """
+    best, best_q, best_position = -1, 0.0, len(ranges)
+    for position, (media_range, q) in enumerate(ranges):
+        if media_range == media_type:
+            specificity = 2
+        elif media_range == f"{media_type.split('/')[0]}/*":
+            specificity = 1
+        elif media_range == "*/*":
+            specificity = 0
+        else:
+            continue
+        if specificity > best:
+            best, best_q, best_position = specificity, q, position
+    return best_q, best_position
+
+
+def negotiate(
+    accept: str | None, media_types: tuple[str, ...], default: str = JSON
+) -> str | None:
+    """
+    Return the one of media_types an Accept header ranks highest by q, then by
+    the order listed, or None if it ranks the default as high or accepts none
+    of them
+    """
+    ranges = _ranges(accept)
+    if not ranges:
+        return None
+    default_q, default_position = _quality(ranges, default)
+    best = None
+    best_q, best_position = default_q, default_position
+    for media_type in media_types:
+        q, position = _quality(ranges, media_type)
+        if q > 0 and (q, -position) > (best_q, -best_position):
+            best, best_q, best_position = media_type, q, position
+    return best
+
+
+def json_bytes(value) -> bytes:
+    """
+    Encode a value as compact JSON
+    """
+    return orjson.dumps(value)
+
+
+def _numbers(values: np.ndarray) -> list[str]:
+    # repr is the shortest form that reads back the same, as in JSON
+    numbers = list(map(repr, values.tolist()))
+    for i in np.flatnonzero(~np.isfinite(values)).tolist():
+        numbers[i] = "null"
+    return numbers
+
+
+def reading_rows(series: Series) -> list[str]:
+    """
+    Return each reading as a JSON object in the shape of models.Reading
+    """
+    unit = json_bytes(series.unit).decode()
+    head = '{"type":' + json_bytes(series.type).decode() + ',"from":"'
+    return [
+        f'{head}{start}","to":"{end}","takenAt":"{taken_at}",'
+        f'"energy":{{"value":{energy},"unitCode":{unit}}},'
+        f'"cumulative":{{"value":{cumulative},"unitCode":{unit}}}}}'
+        for start, end, taken_at, energy, cumulative in zip(
+            format_timestamps(series.start),
+            format_timestamps(series.end),
+            format_timestamps(series.taken_at),
+            _numbers(series.energy),
+            _numbers(series.cumulative),
+        )
+    ]
+
+
+def json_readings(series: Series) -> bytes:
+    """
+    Return the readings as a JSON array, the data of models.MeterData
+    """
+    return ("[" + ",".join(reading_rows(series)) + "]").encode()
+
+
+def json_meter_data(series: Series, fields: dict) -> bytes:
+    """
+    Return a meter data response, the readings followed by fields such as
+    location and provenance
+    """
+    return b'{"data":' + json_readings(series) + json_tail(fields)
+
+
+def json_tail(fields: dict) -> bytes:
+    """
+    Return the end of a meter data response after its readings
+    """
+    return b"," + json_bytes(fields)[1:] if fields else b"}"
+
+
+def ndjson(header: dict, series: Series, batch_size: int = 1000) -> Iterator[bytes]:
+    """
+    Yield newline delimited JSON: a leading frame holding everything in the
+    response except the readings, then one reading per line. Readings are
+    formatted in batches as they are sent, so memory use and time to first
+    byte do not grow with the size of the range.
+    """
+    yield json_bytes(header) + b"\n"
+    for i in range(0, len(series), batch_size):
+        rows = reading_rows(series.take(slice(i, i + batch_size)))
+        yield ("\n".join(rows) + "\n").encode()
+
+
+def csv_lines(series: Series) -> str:
+    """
+    Return the readings as CSV rows under CSV_HEADER, the format read by
+    api.ingest
+    """
+    columns = zip(
+        format_timestamps(series.start),
+        format_timestamps(series.end),
+        format_timestamps(series.taken_at),
+        map(str, series.energy.tolist()),
+        map(str, series.cumulative.tolist()),
+    )
+    return "".join(",".join(row) + "\n" for row in columns)
+
+
+def arrow_table(series: Series, metadata: dict | None = None):
+    """
+    Return the readings as a pyarrow Table with UTC timestamp columns, the
+    type and unit held in the schema metadata along with any other metadata,
+    JSON encoded
+    """
+    import pyarrow as pa
+
+    timestamp = pa.timestamp("s", tz="UTC")
+    return pa.table(
+        {
+            "from": pa.array(series.start, timestamp),
+            "to": pa.array(series.end, timestamp),
+            "takenAt": pa.array(series.taken_at, timestamp),
+            "energy": pa.array(series.energy, pa.float64()),
+            "cumulative": pa.array(series.cumulative, pa.float64()),
+        },
+        metadata={
+            "type": series.type,
+            "unitCode": series.unit,
+            **{key: json.dumps(value) for key, value in (metadata or {}).items()},
+        },
+    )
+
+
+def arrow_stream(series: Series, metadata: dict) -> bytes:
+    """
+    Return the readings as an Arrow IPC stream, with metadata in the schema
+    """
+    import pyarrow as pa
+
+    table = arrow_table(series, metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def msgpack_columns(series: Series, fields: dict) -> bytes:
+    """
+    Return the readings as a MessagePack map of columns, timestamps in epoch
+    seconds, alongside the other fields of the response
+    """
+    return msgpack.packb(
+        {
+            "type": series.type,
+            "unitCode": series.unit,
+            "from": series.start.tolist(),
+            "to": series.end.tolist(),
+            "takenAt": series.taken_at.tolist(),
+            "energy": series.energy.tolist(),
+            "cumulative": series.cumulative.tolist(),
+            **fields,
+        }
+    )
+
+
+def encode_header(value) -> str:
+    """
+    Encode a value as base64url JSON without padding, to send in a header
+    """
+    payload = json.dumps(value, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def event(name: str, data: dict, id: str | None = None) -> bytes:
+    """
+    Format a server-sent event with JSON data
+    """
+    lines = [f"event: {name}"]
+    if id is not None:
+        lines.append(f"id: {id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return ("\n".join(lines) + "\n\n").encode()
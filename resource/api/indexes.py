@@ -0,0 +1,289 @@
+"""
+Indexes derived from each reading series.
+
+Reading stores mix in Indexes to keep, per (meter id, measure), the derived
+indexes listed in INDEXES. An index is built from the full series on first use,
+or when the series is loaded, and updated as readings are added after that.
+Added readings are then published to any subscribers, see api/broadcast.py.
+Indexes are built, updated and read under a lock, as requests are answered
+from a pool of threads. While a series has subscribers, a thread polls the
+store for readings written by other processes, which stores implement in poll.
+The SQLite store keeps no indexes, answering the same queries with SQL
+aggregates instead, see api/sqlite_store.py.
+"""
+
+import datetime
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from . import conf
+from .availability import INTERVAL, Availability
+from .broadcast import Broadcaster, Subscription
+from .logger import get_logger
+from .rollups import Pyramid
+from .series import RawReader, Series, SeriesIndex, from_epoch, to_epoch
+from .sync import Versions
+from .timeofuse import Bands, interval_codes
+from .totals import PrefixSums
+
+logger = get_logger()
+
+
+class Indexes(ABC):
+    """
+    Mixin for reading stores, which must implement series and between
+    """
+
+    INDEXES: dict[str, type[SeriesIndex]] = {
+        "rollups": Pyramid,
+        "totals": PrefixSums,
+        "availability": Availability,
+        "versions": Versions,
+    }
+
+    def __init__(self):
+        self._indexes: dict[tuple[str, str, str], SeriesIndex] = {}
+        # Reentrant, as an index being updated reads the series through the
+        # store
+        self._lock = threading.RLock()
+        self.broadcaster = Broadcaster()
+        self._poll_lock = threading.Lock()
+        self._poller: threading.Thread | None = None
+
+    @abstractmethod
+    def series(self, meter_id: str, measure: str) -> Series: ...
+
+    @abstractmethod
+    def between(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        limit: int | None = None,
+    ) -> Series: ...
+
+    def watch(self, meter_id: str, measure: str):
+        """
+        Note where a series stands as it gains its first subscriber, so poll
+        publishes only readings written after it
+        """
+
+    def poll(self):
+        """
+        Publish the readings written to watched series by other processes
+        since they were watched or last polled
+        """
+
+    def subscribe(self, meter_id: str, measure: str) -> Subscription:
+        """
+        Subscribe to readings added to a series, see Broadcaster.subscribe,
+        polling for readings written by other processes while there are
+        subscribers
+        """
+        with self._poll_lock:
+            if not self.broadcaster.subscribed(meter_id, measure):
+                self.watch(meter_id, measure)
+            subscription = self.broadcaster.subscribe(meter_id, measure)
+            if self._poller is None:
+                self._poller = threading.Thread(
+                    target=self._poll_while_subscribed, daemon=True
+                )
+                self._poller.start()
+        return subscription
+
+    def _poll_while_subscribed(self):
+        while True:
+            time.sleep(conf.EVENTS_POLL_SECONDS)
+            # The lock guards only the poller starting and stopping, as
+            # subscribe takes it on the event loop and a poll can be slow
+            with self._poll_lock:
+                if not self.broadcaster.keys():
+                    self._poller = None
+                    return
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Polling for new readings failed")
+
+    def raw_reader(self, meter_id: str, measure: str) -> RawReader:
+        return lambda start, end: self.between(
+            meter_id, measure, from_epoch(start), from_epoch(end)
+        )
+
+    def index(self, name: str, meter_id: str, measure: str) -> SeriesIndex:
+        key = (name, meter_id, measure)
+        with self._lock:
+            if key not in self._indexes:
+                self._indexes[key] = self.INDEXES[name](self.series(meter_id, measure))
+            return self._indexes[key]
+
+    def build_indexes(self, meter_id: str, measure: str):
+        series = self.series(meter_id, measure)
+        with self._lock:
+            for name, index in self.INDEXES.items():
+                self._indexes[(name, meter_id, measure)] = index(series)
+
+    def update_indexes(self, meter_id: str, measure: str, added: Series):
+        raw = self.raw_reader(meter_id, measure)
+        with self._lock:
+            for name in self.INDEXES:
+                index = self._indexes.get((name, meter_id, measure))
+                if index is not None:
+                    index.update(added, raw)
+        if self.broadcaster.subscribed(meter_id, measure):
+            self.broadcaster.publish(
+                meter_id, measure, added, self.watermark(meter_id, measure)
+            )
+
+    def aggregate(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        resolution: str,
+    ) -> Series:
+        """
+        Return readings within [start, end) aggregated to a resolution
+        """
+        with self._lock:
+            pyramid = self.index("rollups", meter_id, measure)
+            assert isinstance(pyramid, Pyramid)
+            return pyramid.resample(
+                resolution, start, end, self.raw_reader(meter_id, measure)
+            )
+
+    def total(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> dict:
+        """
+        Return the energy used within [start, end), see PrefixSums.total
+        """
+        with self._lock:
+            sums = self.index("totals", meter_id, measure)
+            assert isinstance(sums, PrefixSums)
+            return sums.total(to_epoch(start), to_epoch(end))
+
+    def time_of_use(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        resolution: str,
+        bands: Bands,
+    ) -> list[dict]:
+        """
+        Return energy within [start, end) totalled by period, time-of-use band
+        and day type, see Bands.totals
+        """
+        series = self.between(meter_id, measure, start, end)
+        return bands.totals(
+            series,
+            interval_codes(series.start),
+            resolution,
+            to_epoch(start),
+            to_epoch(end),
+        )
+
+    def availability(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> dict:
+        """
+        Return the covered and missing ranges within [start, end), which must
+        be on half-hours
+        """
+        start_epoch, end_epoch = to_epoch(start), to_epoch(end)
+        with self._lock:
+            bitmap = self.index("availability", meter_id, measure)
+            assert isinstance(bitmap, Availability)
+            covered, missing = bitmap.ranges(start_epoch, end_epoch)
+            intervals = bitmap.count(start_epoch, end_epoch)
+        return {
+            "intervals": intervals,
+            "expectedIntervals": max(end_epoch - start_epoch, 0) // INTERVAL,
+            "covered": covered,
+            "missing": missing,
+        }
+
+    def complete(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> bool:
+        """
+        Return True if every half-hour within [start, end) has a reading
+        """
+        start_epoch, end_epoch = to_epoch(start), to_epoch(end)
+        expected = max(end_epoch - start_epoch, 0) // INTERVAL
+        with self._lock:
+            bitmap = self.index("availability", meter_id, measure)
+            assert isinstance(bitmap, Availability)
+            return bitmap.count(start_epoch, end_epoch) == expected
+
+    def versions(self, meter_id: str, measure: str) -> Versions:
+        versions = self.index("versions", meter_id, measure)
+        assert isinstance(versions, Versions)
+        return versions
+
+    def watermark(self, meter_id: str, measure: str) -> str:
+        """
+        Return the watermark of the series as it is now, see api/sync.py
+        """
+        with self._lock:
+            return self.versions(meter_id, measure).watermark()
+
+    def etag(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> str:
+        """
+        Return an ETag that changes when readings within [start, end) change
+        """
+        with self._lock:
+            versions = self.versions(meter_id, measure)
+            return versions.etag(to_epoch(start), to_epoch(end))
+
+    def changes(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        watermark: str,
+    ) -> Series:
+        """
+        Return the readings within [start, end) added or corrected after a
+        watermark, or all of them if the watermark is from another generation.
+
+        Raises:
+            ValueError: If the watermark is invalid
+        """
+        with self._lock:
+            starts = self.versions(meter_id, measure).changed(
+                watermark, to_epoch(start), to_epoch(end)
+            )
+        if starts is None:
+            return self.between(meter_id, measure, start, end)
+        if len(starts) == 0:
+            return self.between(meter_id, measure, start, start)
+        # Read only from the first changed reading
+        data = self.between(meter_id, measure, from_epoch(int(starts[0])), end)
+        return data.take(np.isin(data.start, starts))
@@ -0,0 +1,353 @@
+"""
+Streaming bulk ingestion of meter readings.
+
+Readings are read from CSV or JSON lines files in batches of a bounded number
+of rows, so memory use does not grow with the size of the file. Each batch is
+turned into columns and checked with vectorised comparisons: intervals must
+run forward without overlapping, from the last reading already stored onwards,
+and cumulative values must not decrease. Missing or decreasing cumulative
+values are recomputed from the last good value plus the energy used since.
+Batches are then written to a reading store as they arrive.
+
+CSV files have a header naming the columns from, to, takenAt, energy and
+optionally cumulative. JSON lines files hold one reading per line in the shape
+served by the API. Load a file with:
+
+    python -m api.ingest readings.csv METER_ID import
+    python -m api.ingest readings.jsonl METER_ID import --backend columnar
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import shutil
+import time
+from typing import BinaryIO, Iterable, Iterator
+
+import numpy as np
+
+from . import conf
+from .columnar import META_FILE, read_series, series_path, write_meta
+from .exceptions import IngestError
+from .logger import get_logger
+from .series import Series, parse_timestamp, to_epoch
+from .sqlite_store import SqliteStore
+
+logger = get_logger()
+
+BATCH_SIZE = 100_000
+
+
+def parse_epochs(values: list[str]) -> np.ndarray:
+    """
+    Parse ISO 8601 timestamps to epoch seconds, in one vectorised conversion
+    when they are all UTC with a Z suffix
+    """
+    strings = np.array(values)
+    if strings.size and np.char.endswith(strings, "Z").all():
+        try:
+            return np.char.rstrip(strings, "Z").astype("datetime64[s]").astype(np.int64)
+        except ValueError:
+            pass
+    return np.array([to_epoch(parse_timestamp(v)) for v in values], dtype=np.int64)
+
+
+def _values(values: Iterable[str | float | None]) -> np.ndarray:
+    return np.array(
+        [np.nan if v is None or v == "" else v for v in values], dtype=np.float64
+    )
+
+
+def _batches(rows: Iterator, batch_size: int) -> Iterator[list]:
+    while batch := list(itertools.islice(rows, batch_size)):
+        yield batch
+
+
+def read_csv(path: str, batch_size: int = BATCH_SIZE) -> Iterator[Series]:
+    """
+    Yield the readings in a CSV file as series of at most batch_size rows.
+    Empty cumulative values are read as NaN.
+    """
+    with open(path, newline="") as f:
+        for rows in _batches(csv.DictReader(f), batch_size):
+            yield Series(
+                parse_epochs([r["from"] for r in rows]),
+                parse_epochs([r["to"] for r in rows]),
+                parse_epochs([r.get("takenAt") or r["to"] for r in rows]),
+                _values(r["energy"] for r in rows),
+                _values(r.get("cumulative") for r in rows),
+            )
+
+
+def read_jsonl(path: str, batch_size: int = BATCH_SIZE) -> Iterator[Series]:
+    """
+    Yield the readings in a JSON lines file as series of at most batch_size
+    rows. Readings without a cumulative value are read as NaN.
+    """
+    with open(path) as f:
+        lines = (line for line in f if line.strip())
+        for batch in _batches(lines, batch_size):
+            rows = [json.loads(line) for line in batch]
+            yield Series(
+                parse_epochs([r["from"] for r in rows]),
+                parse_epochs([r["to"] for r in rows]),
+                parse_epochs([r.get("takenAt") or r["to"] for r in rows]),
+                _values(r["energy"]["value"] for r in rows),
+                _values((r.get("cumulative") or {}).get("value") for r in rows),
+                rows[0].get("type", "Electricity"),
+                rows[0]["energy"].get("unitCode", "WHR"),
+            )
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+class Validator:
+    """
+    Checks batches of readings in file order, carrying the last interval and
+    cumulative value from one batch to the next, starting from the last
+    reading already stored if given
+    """
+
+    def __init__(self, last: Series | None = None):
+        self.rows = 0
+        self.gaps = 0
+        self.recomputed = 0
+        self.last_end: int | None = None
+        # Highest cumulative value accepted so far
+        self.cumulative = -np.inf
+        # Energy used so far, and the difference between the last good
+        # cumulative value and it
+        self.energy = 0.0
+        self.offset = 0.0
+        if last is not None and len(last):
+            self.last_end = int(last.end[-1])
+            self.cumulative = self.offset = float(last.cumulative[-1])
+
+    def _error(self, rows: np.ndarray, message: str):
+        raise IngestError(f"Row {self.rows + int(rows[0]) + 1}: {message}")
+
+    def _recompute(
+        self, given: np.ndarray, used: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the cumulative values of a batch, each missing value or one
+        below a value written before it recomputed from the energy used since
+        the last good value, and which were recomputed
+        """
+        cumulative = np.empty(len(given))
+        bad = np.zeros(len(given), dtype=bool)
+        highest, offset = self.cumulative, self.offset
+        for i, (value, total) in enumerate(zip(given.tolist(), used.tolist())):
+            if math.isnan(value) or value < highest:
+                bad[i] = True
+                value = total + offset
+            else:
+                offset = value - total
+            cumulative[i] = value
+            highest = max(highest, value)
+        return cumulative, bad
+
+    def check(self, batch: Series) -> Series:
+        """
+        Validate a batch, returning it with any missing or decreasing
+        cumulative values recomputed. Raises IngestError for readings that
+        cannot be loaded.
+        """
+        start, end, energy = batch.start, batch.end, batch.energy
+        if len(bad := np.flatnonzero(end <= start)):
+            self._error(bad, "interval does not end after it starts")
+        if len(bad := np.flatnonzero(~np.isfinite(energy))):
+            self._error(bad, "energy is not a number")
+        previous_end = np.concatenate(
+            [[start[0] if self.last_end is None else self.last_end], end[:-1]]
+        )
+        if len(bad := np.flatnonzero(start < previous_end)):
+            self._error(bad, "interval starts before the previous one ends")
+        self.gaps += int(np.count_nonzero(start > previous_end))
+
+        # A value is bad if it is missing or below one written before it
+        given = batch.cumulative
+        known = np.where(np.isnan(given), -np.inf, given)
+        highest = np.maximum.accumulate(np.concatenate([[self.cumulative], known]))
+        bad = np.isnan(given) | (given < highest[:-1])
+        used = self.energy + np.cumsum(energy)
+        cumulative = given
+        if bad.any():
+            # Carry forward the offset of the last good value before each row
+            good = np.where(bad, -1, np.arange(len(batch)))
+            last_good = np.maximum.accumulate(good)
+            offsets = np.where(
+                last_good >= 0, (given - used)[np.maximum(last_good, 0)], self.offset
+            )
+            cumulative = np.where(bad, used + offsets, given)
+            # A given value above those given before it can still be below a
+            # recomputed one, so check it against the values written, row by
+            # row if any is
+            written = np.maximum.accumulate(
+                np.concatenate([[self.cumulative], cumulative])
+            )
+            if (~bad & (given < written[:-1])).any():
+                cumulative, bad = self._recompute(given, used)
+            self.recomputed += int(bad.sum())
+        self.offset = float(cumulative[-1] - used[-1])
+        self.energy = float(used[-1])
+        self.cumulative = max(self.cumulative, float(cumulative[-1]))
+        self.last_end = int(end[-1])
+        self.rows += len(batch)
+        return Series(
+            start, end, batch.taken_at, energy, cumulative, batch.type, batch.unit
+        )
+
+
+class SqliteWriter:
+    """
+    Writes each batch to a SQLite readings database as it arrives
+    """
+
+    def __init__(self, path: str, meter_id: str, measure: str):
+        self.store = SqliteStore(path)
+        self.meter_id = meter_id
+        self.measure = measure
+
+    def last(self) -> Series:
+        return self.store.latest(self.meter_id, self.measure)
+
+    def write(self, batch: Series):
+        self.store.add(self.meter_id, self.measure, batch)
+
+    def close(self):
+        pass
+
+
+class ColumnarWriter:
+    """
+    Appends each batch to a file per column beside the series as it arrives.
+    On close the columns of any existing series are copied to new files with
+    the batches after them, through memory maps rather than the heap, and
+    replace the old ones.
+    """
+
+    def __init__(self, root: str, meter_id: str, measure: str):
+        self.path = series_path(root, meter_id, measure)
+        self.stored: Series | None = None
+        if os.path.isfile(os.path.join(self.path, META_FILE)):
+            self.stored = read_series(self.path)
+        self.count = 0
+        self.dtypes: dict[str, np.dtype] = {}
+        self.meta = None
+        if self.stored is not None:
+            self.meta = (self.stored.type, self.stored.unit)
+        self._parts: dict[str, BinaryIO] = {}
+
+    def last(self) -> Series | None:
+        if self.stored is None:
+            return None
+        return self.stored.take(slice(len(self.stored) - 1, None))
+
+    def _part(self, column: str) -> str:
+        return os.path.join(self.path, f".{column}.part")
+
+    def write(self, batch: Series):
+        if not self._parts:
+            os.makedirs(self.path, exist_ok=True)
+            self._parts = {
+                column: open(self._part(column), "wb", buffering=0)
+                for column in Series.COLUMNS
+            }
+            self.meta = self.meta or (batch.type, batch.unit)
+        for column, f in self._parts.items():
+            values = getattr(batch, column)
+            self.dtypes.setdefault(column, values.dtype)
+            f.write(np.ascontiguousarray(values, self.dtypes[column]).tobytes())
+        self.count += len(batch)
+
+    def close(self):
+        if not self._parts:
+            return
+        stored = len(self.stored) if self.stored is not None else 0
+        for column, f in self._parts.items():
+            f.close()
+            # Write then rename so readers never map a partially written file
+            tmp = os.path.join(self.path, f".{column}.npy")
+            out = np.lib.format.open_memmap(
+                tmp, mode="w+", dtype=self.dtypes[column], shape=(stored + self.count,)
+            )
+            if self.stored is not None:
+                out[:stored] = getattr(self.stored, column)
+            out.flush()
+            offset = out.offset
+            del out
+            with open(self._part(column), "rb") as part, open(tmp, "r+b") as f:
+                f.seek(offset + stored * self.dtypes[column].itemsize)
+                shutil.copyfileobj(part, f)
+            os.replace(tmp, os.path.join(self.path, f"{column}.npy"))
+            os.remove(self._part(column))
+        write_meta(self.path, *self.meta)
+
+
+WRITERS = {"sqlite": SqliteWriter, "columnar": ColumnarWriter}
+
+
+def ingest(
+    batches: Iterable[Series], writer: SqliteWriter | ColumnarWriter
+) -> tuple[Validator, float]:
+    """
+    Validate and write each batch, returning the validator, holding the counts
+    of rows, gaps and recomputed values, and the time taken in seconds
+    """
+    validator = Validator(writer.last())
+    started = time.perf_counter()
+    for batch in batches:
+        writer.write(validator.check(batch))
+        logger.info(f"Ingested {validator.rows} readings")
+    writer.close()
+    return validator, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load a CSV or JSON lines readings file into a reading store"
+    )
+    parser.add_argument("source", help="CSV or JSON lines file of readings")
+    parser.add_argument("meter_id")
+    parser.add_argument("measure")
+    parser.add_argument(
+        "--format",
+        choices=READERS,
+        help="Format of the source, by default from its extension",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=WRITERS,
+        default=conf.READINGS_BACKEND if conf.READINGS_BACKEND in WRITERS else "sqlite",
+    )
+    parser.add_argument(
+        "--target",
+        help="SQLite database or columnar directory, by default READINGS_DATABASE "
+        "or READINGS_DIR",
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    source_format = args.format or (
+        "jsonl" if args.source.endswith((".jsonl", ".ndjson")) else "csv"
+    )
+    batches = READERS[source_format](args.source, args.batch_size)
+    target = args.target or (
+        conf.READINGS_DATABASE if args.backend == "sqlite" else conf.READINGS_DIR
+    )
+    writer = WRITERS[args.backend](target, args.meter_id, args.measure)
+    try:
+        validator, elapsed = ingest(batches, writer)
+    except IngestError as e:
+        parser.exit(1, f"{args.source}: {e}\n")
+    print(
+        f"Wrote {validator.rows} readings for {args.meter_id} {args.measure} to "
+        f"{target} in {elapsed:.1f}s ({validator.rows / max(elapsed, 1e-9):,.0f} "
+        f"rows/s), {validator.gaps} gaps, {validator.recomputed} cumulative "
+        "values recomputed"
+    )
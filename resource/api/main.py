@@ -1,28 +1,51 @@
-import json
+import asyncio
 import datetime
-from typing import Annotated
+import math
+import time
+from typing import Annotated, AsyncIterator, Literal
 
 # import x509
 
-from fastapi import FastAPI, HTTPException, Depends, Header, Query
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.openapi.utils import get_openapi
+from fastapi.responses import FileResponse, StreamingResponse
 from starlette.requests import Request
 from ib1 import directory
 from mangum import Mangum
 
 from . import models
 from . import auth
+from . import carbon
+from . import compression
 from . import conf
+from . import exports
+from . import formats
+from . import pagination
+from . import pool
 from . import provenance
-from .exceptions import CertificateError, AccessTokenValidatorError
+from . import registry
+from . import series
+from . import statistics
+from . import store
+from . import sync
+from . import timeofuse
+from . import totals
+from .exceptions import (
+    CertificateError,
+    AccessTokenValidatorError,
+    PoolBusy,
+    SubscriberLagged,
+)
 from .logger import get_logger
 
 
-DEMO_METER_ID = "S018011012261305588165"
-DEMO_DATA_SOURCE_LOCATION = "SW8"
 logger = get_logger()
 
+# Meter data responses depend on the format and encoding negotiated
+VARY = "Accept, Accept-Encoding"
+
 
 security = HTTPBearer(auto_error=False)
 
@@ -92,6 +115,72 @@ def require_mtls_and_token(
     return decoded, headers, cert
 
 
+def authorise_meter(auth_result: tuple[dict, dict, object], id: str):
+    """
+    Raise 404 unless the meter is registered to the token's account
+    """
+    decoded, _, _ = auth_result
+    if not registry.get_registry().authorised(decoded["sub"], id):
+        raise HTTPException(status_code=404, detail="Meter not found")
+
+
+def get_readings(
+    auth_result: tuple[dict, dict, object], id: str, measure: str
+) -> store.ReadingStore | store.SqliteStore:
+    """
+    Return the reading store if the account may read the meter and the store
+    holds the measure, or raise 404
+    """
+    authorise_meter(auth_result, id)
+    readings = store.get_store()
+    if not readings.has_series(id, measure):
+        raise HTTPException(status_code=404, detail="Measure not found")
+    return readings
+
+
+def provenance_context(auth_result: tuple[dict, dict, object], path: str) -> dict:
+    """
+    Return the arguments describing the permission and the transfer request
+    shared by every provenance record
+    """
+    decoded, headers, cert = auth_result
+    permission_granted = datetime.datetime.now(datetime.timezone.utc)
+    permission_expires = datetime.datetime.now(
+        datetime.timezone.utc
+    ) + datetime.timedelta(days=365)
+    return {
+        "permission_expires": permission_expires,
+        "permission_granted": permission_granted,
+        "account": decoded["sub"],
+        "service_url": f"https://{conf.API_DOMAIN}{path}",
+        "fapi_id": headers["x-fapi-interaction-id"],
+        "cap_member": directory.extensions.decode_application(cert),
+    }
+
+
+def create_provenance_record(
+    auth_result: tuple[dict, dict, object],
+    path: str,
+    measure: str,
+    from_date: datetime.date,
+    to_date: datetime.date,
+    parameters: dict | None = None,
+    complete: bool = False,
+) -> dict:
+    """
+    Create a new provenance record for data about to be sent to the CAP.
+    `complete` is True if there is a reading for every interval in the range.
+    """
+    return provenance.create_provenance_records(
+        from_date=from_date,
+        to_date=to_date,
+        **provenance_context(auth_result, path),
+        measure=measure,
+        parameters=parameters,
+        complete=complete,
+    )
+
+
 app = FastAPI(
     docs_url="/api-docs",
     title="Perseus Energy Demo Resource API",
@@ -102,7 +191,21 @@ app = FastAPI(
 @app.get("/", response_model=dict)
 def root():
     return {
-        "urls": ["/datasources", "/datasources/{id}/{measure}"],
+        "urls": [
+            "/datasources",
+            "/datasources/batch",
+            "/datasources/aggregate",
+            "/datasources/{id}/availability",
+            "/datasources/{id}/{measure}",
+            "/datasources/{id}/{measure}/total",
+            "/datasources/{id}/{measure}/emissions",
+            "/datasources/{id}/{measure}/statistics",
+            "/datasources/{id}/{measure}/events",
+            "/exports",
+            "/exports/{job_id}",
+            "/exports/{job_id}/file",
+            "/status",
+        ],
         "documentation": {
             "swagger_ui": "/docs",
             "redoc": "/redoc",
@@ -111,58 +214,974 @@ def root():
     }
 
 
+@app.get("/status", response_model=dict)
+def status(
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    Hit rates of the reading store's tiers, if it has them, and of the cache
+    of compressed meter data
+    """
+    readings = store.get_store()
+    tiers = readings.tiers if isinstance(readings, store.ReadingStore) else None
+    cache = compression.get_slice_cache()
+    lookups = cache.hits + cache.misses
+    return {
+        "readingTiers": tiers.stats() if tiers else None,
+        "compressionCache": {
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "hitRate": cache.hits / lookups if lookups else None,
+            "entries": len(cache),
+            "bytes": cache.size,
+        },
+    }
+
+
 @app.get("/datasources", response_model=models.Datasources)
 def datasources(
     auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
 ) -> dict:
-    return {
-        "data": [
+    decoded, _, _ = auth_result
+    return {"data": registry.get_registry().datasources(decoded["sub"])}
+
+
+@app.post(
+    "/datasources/batch",
+    response_model=models.BatchMeterData,
+    response_model_exclude_none=True,
+)
+def batch(
+    request: models.BatchRequest,
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    Meter data for several meters and measures over one date range, attested
+    by a single provenance record with a transfer step per series
+    """
+    pairs = [(s.id, s.measure) for s in request.series]
+    if len(set(pairs)) != len(pairs):
+        raise HTTPException(status_code=400, detail="series must not repeat")
+    stores = [get_readings(auth_result, id, measure) for id, measure in pairs]
+    start, end = series.date_range(request.from_date, request.to_date)
+    data = []
+    transfers = []
+    for readings, (id, measure) in zip(stores, pairs):
+        data.append(
             {
-                "id": DEMO_METER_ID,
-                "type": "electricity",
-                "location": {"ukPostcodeOutcode": DEMO_DATA_SOURCE_LOCATION},
-                "availableMeasures": ["import", "export"],
+                "id": id,
+                "measure": measure,
+                "data": readings.between(id, measure, start, end).to_readings(),
+                "location": registry.get_registry().location(id),
             }
-        ]
+        )
+        transfers.append((id, measure, readings.complete(id, measure, start, end)))
+    record = provenance.create_batch_provenance_records(
+        from_date=request.from_date,
+        to_date=request.to_date,
+        **provenance_context(auth_result, "/datasources/batch"),
+        series=transfers,
+    )
+    decoded, _, _ = auth_result
+    logger.info("Returning %d series and provenance for %s", len(data), decoded["sub"])
+    return {"data": data, "provenance": record}
+
+
+@app.post(
+    "/datasources/aggregate",
+    response_model=models.AggregateData,
+    response_model_exclude_none=True,
+    responses={
+        503: {
+            "description": "The aggregation workers are busy, retry after the "
+            "number of seconds in Retry-After"
+        }
+    },
+)
+async def aggregate_meters(
+    request: models.AggregateRequest,
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    Resampled readings, statistics or emissions for several meters and
+    measures over one date range, aggregated by meter in worker processes,
+    with totals for each measure and a single provenance record
+    """
+    pairs = [(s.id, s.measure) for s in request.series]
+    if len(set(pairs)) != len(pairs):
+        raise HTTPException(status_code=400, detail="series must not repeat")
+    percentiles = tuple(request.percentiles or statistics.PERCENTILES)
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise HTTPException(
+            status_code=400, detail="percentiles must be between 0 and 100"
+        )
+    if request.aggregation == "resample" and request.resolution == "halfhour":
+        raise HTTPException(
+            status_code=400,
+            detail="resample requires a resolution of hour or longer",
+        )
+    # The store may be loaded on first use, so off the event loop
+    for id, measure in pairs:
+        await run_in_threadpool(get_readings, auth_result, id, measure)
+    start, end = series.date_range(request.from_date, request.to_date)
+    by_meter: dict[str, list[str]] = {}
+    for id, measure in pairs:
+        by_meter.setdefault(id, []).append(measure)
+    try:
+        futures = pool.get_pool().submit(
+            pool.aggregate_meter,
+            [
+                (
+                    id,
+                    measures,
+                    start,
+                    end,
+                    request.aggregation,
+                    request.resolution,
+                    percentiles,
+                )
+                for id, measures in by_meter.items()
+            ],
+        )
+    except PoolBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    meters = await asyncio.gather(*map(asyncio.wrap_future, futures))
+
+    results = {}
+    totals: dict[str, dict] = {}
+    for id, meter in zip(by_meter, meters):
+        for result in meter:
+            results[id, result["measure"]] = result
+            total = totals.setdefault(
+                result["measure"],
+                {
+                    "measure": result["measure"],
+                    "series": 0,
+                    "energy": {"value": 0.0, "unitCode": result["unit"]},
+                },
+            )
+            total["series"] += 1
+            total["energy"]["value"] += result["energy"]
+            if request.aggregation == "emissions":
+                grams = total.setdefault(
+                    "emissions", {"value": 0.0, "unitCode": carbon.EMISSIONS_UNIT}
+                )
+                grams["value"] += result["result"]["emissions"]
+    data = []
+    for id, measure in pairs:
+        result = results[id, measure]
+        item = {
+            "id": id,
+            "measure": measure,
+            "location": registry.get_registry().location(id),
+        }
+        if request.aggregation == "resample":
+            item["readings"] = result["result"].to_readings()
+        elif request.aggregation == "statistics":
+            item["statistics"] = statistics_result(
+                result["result"], result["unit"], start, end
+            )
+        else:
+            item["emissions"] = emissions_result(
+                result["result"], result["unit"], start, end
+            )
+        data.append(item)
+    if request.aggregation == "resample":
+        parameters = {"resolution": request.resolution}
+    elif request.aggregation == "statistics":
+        parameters = {"aggregation": "statistics"}
+    else:
+        parameters = {"aggregation": "emissions", "resolution": request.resolution}
+    record = await asyncio.to_thread(
+        provenance.create_batch_provenance_records,
+        from_date=request.from_date,
+        to_date=request.to_date,
+        **provenance_context(auth_result, "/datasources/aggregate"),
+        series=[(id, m, results[id, m]["complete"]) for id, m in pairs],
+        parameters=parameters,
+    )
+    decoded, _, _ = auth_result
+    logger.info(
+        "Returning %s of %d series and provenance for %s",
+        request.aggregation,
+        len(data),
+        decoded["sub"],
+    )
+    return {
+        "from": start,
+        "to": end,
+        "aggregation": request.aggregation,
+        "data": data,
+        "totals": list(totals.values()),
+        "provenance": record,
     }
 
 
-@app.get("/datasources/{id}/{measure}", response_model=models.MeterData)
+# Registered before /datasources/{id}/{measure} so it is not taken as a measure
+@app.get("/datasources/{id}/availability", response_model=models.Availability)
+def availability(
+    id: str,
+    from_date: datetime.date = Query(alias="from"),
+    to_date: datetime.date = Query(alias="to"),
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    The ranges with and without readings for each measure of a data source
+    """
+    authorise_meter(auth_result, id)
+    if to_date <= from_date:
+        raise HTTPException(status_code=400, detail="to must be after from")
+    readings = store.get_store()
+    start, end = series.date_range(from_date, to_date)
+    measures = []
+    for measure in readings.measures(id):
+        result = readings.availability(id, measure, start, end)
+        measures.append(
+            {
+                "measure": measure,
+                "intervals": result["intervals"],
+                "expectedIntervals": result["expectedIntervals"],
+                "covered": [
+                    {"from": series.from_epoch(a), "to": series.from_epoch(b)}
+                    for a, b in result["covered"]
+                ],
+                "missing": [
+                    {"from": series.from_epoch(a), "to": series.from_epoch(b)}
+                    for a, b in result["missing"]
+                ],
+            }
+        )
+    return {"id": id, "from": start, "to": end, "measures": measures}
+
+
+@app.get(
+    "/datasources/{id}/{measure}",
+    response_model=models.MeterData | models.TimeOfUseData,
+    response_model_exclude_none=True,
+    responses={
+        200: {
+            "content": {
+                formats.NDJSON: {
+                    "description": "A leading frame with location, provenance "
+                    "and watermark, then one reading per line"
+                },
+                formats.ARROW_STREAM: {
+                    "description": "Reading columns, with location, provenance "
+                    "and watermark as JSON in the schema metadata"
+                },
+                formats.CSV: {
+                    "description": "Readings, with provenance and location as "
+                    "base64url JSON in the Provenance and Meter-Location headers"
+                },
+                formats.MSGPACK: {
+                    "description": "A map of reading columns, timestamps in epoch "
+                    "seconds, with location, provenance and watermark"
+                },
+            }
+        }
+    },
+)
 def consumption(
     id: str,
     measure: str,
+    response: Response,
     from_date: datetime.date = Query(alias="from"),
     to_date: datetime.date = Query(alias="to"),
+    stream: bool = Query(
+        False, description="Stream readings as newline delimited JSON"
+    ),
+    limit: int | None = Query(
+        None,
+        ge=1,
+        le=pagination.MAX_LIMIT,
+        description="Maximum number of readings to return",
+    ),
+    cursor: str | None = Query(
+        None, description="nextCursor from the previous page of results"
+    ),
+    resolution: Literal["halfhour", "hour", "day", "month", "year"] = Query(
+        "halfhour",
+        description="Aggregate readings to this resolution, summing energy and "
+        "taking the cumulative value at the end of each period",
+    ),
+    bands: bool = Query(
+        False,
+        description="Total energy in time-of-use bands, on weekdays and weekends, "
+        "for each day or month of resolution",
+    ),
+    since: str | None = Query(
+        None,
+        description="watermark from an earlier response, to return only the "
+        "readings added or corrected after it",
+    ),
+    accept: Annotated[str | None, Header()] = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
     auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
 ):
-    if id != DEMO_METER_ID:
-        raise HTTPException(status_code=404, detail="Meter not found")
-    decoded, headers, cert = auth_result
-    # Create a new provenance record
-    permission_granted = datetime.datetime.now(datetime.timezone.utc)
-    permission_expires = datetime.datetime.now(
-        datetime.timezone.utc
-    ) + datetime.timedelta(days=365)
-    record = provenance.create_provenance_records(
-        from_date=from_date,
-        to_date=to_date,
-        permission_expires=permission_expires,
-        permission_granted=permission_granted,
-        account=decoded["sub"],
-        service_url=f"https://{conf.API_DOMAIN}/datasources/{id}/{measure}",
-        fapi_id=headers["x-fapi-interaction-id"],
-        cap_member=directory.extensions.decode_application(cert),
-    )
-    with open(f"{conf.ROOT_DIR}/data/sample_data.json") as f:
-        data = json.load(f)
+    readings = get_readings(auth_result, id, measure)
+    if limit and resolution != "halfhour":
+        raise HTTPException(
+            status_code=400, detail="limit cannot be combined with resolution"
+        )
+    if cursor and not limit:
+        raise HTTPException(status_code=400, detail="cursor requires limit")
+    if since and (limit or resolution != "halfhour" or bands):
+        raise HTTPException(
+            status_code=400,
+            detail="since cannot be combined with limit, resolution or bands",
+        )
+    if bands:
+        if resolution not in timeofuse.RESOLUTIONS:
+            raise HTTPException(
+                status_code=400, detail="bands requires a resolution of day or month"
+            )
+        if stream:
+            raise HTTPException(
+                status_code=400, detail="stream cannot be combined with bands"
+            )
+        return time_of_use(
+            readings, auth_result, id, measure, from_date, to_date, resolution
+        )
+    media_type = formats.negotiate(accept, (formats.NDJSON, *formats.COLUMNAR))
+    streaming = stream or media_type == formats.NDJSON
+    if streaming:
+        media_type = None
+    encoding = None if streaming else compression.negotiate(accept_encoding)
+    # Answer polls for a range that has not changed without reading it. Each
+    # format and encoding of the range has its own ETag.
+    start, end = series.date_range(from_date, to_date)
+    etag = sync.representation_etag(
+        readings.etag(id, measure, start, end),
+        formats.NDJSON if streaming else media_type or formats.JSON,
+        encoding,
+    )
+    if sync.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Vary": VARY})
+    response.headers["ETag"] = etag
+    response.headers["Vary"] = VARY
+    decoded, _, _ = auth_result
+    if cursor:
+        try:
+            after = pagination.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        start = max(start, series.from_epoch(after + 1))
+    watermark = readings.watermark(id, measure)
+    cache = compression.get_slice_cache()
+    key = cached = None
+    if encoding and not streaming and not media_type:
+        # The ETag covers the range, so a changed slice is looked up afresh
+        key = (
+            id,
+            measure,
+            etag,
+            start,
+            end,
+            limit,
+            cursor,
+            resolution,
+            since,
+        )
+        cached = cache.get(key)
+    if cached:
+        prefix, selected = cached
+    else:
+        data, selected = select_readings(
+            readings, id, measure, start, end, limit, cursor, resolution, since
+        )
+    record = create_provenance_record(
+        auth_result,
+        f"/datasources/{id}/{measure}",
+        measure,
+        from_date,
+        to_date,
+        selected["parameters"],
+        complete=readings.complete(id, measure, *series.date_range(from_date, to_date)),
+    )
+    fields = {
+        "location": registry.get_registry().location(id),
+        "provenance": record,
+        "watermark": watermark,
+    }
+    if selected["nextCursor"]:
+        fields["nextCursor"] = selected["nextCursor"]
+    if streaming:
+        logger.info("Streaming data and provenance for %s", decoded["sub"])
+        return StreamingResponse(
+            formats.ndjson(fields, data),
+            media_type=formats.NDJSON,
+            headers={"ETag": etag, "Vary": VARY},
+        )
+    if media_type:
+        logger.info(
+            "Returning %s data and provenance for %s", media_type, decoded["sub"]
+        )
+        return columnar_response(media_type, data, fields, etag, encoding)
     logger.info("Returning data and provenance for %s", decoded["sub"])
+    if not key:
+        return json_response(formats.json_meter_data(data, fields), etag)
+    if not cached:
+        prefix = compression.Prefix(encoding, b'{"data":' + formats.json_readings(data))
+        cache.put(key, prefix, selected)
+    return json_response(
+        prefix.finish(formats.json_tail(fields)), etag, prefix.encoding
+    )
+
+
+def select_readings(
+    readings: store.ReadingStore | store.SqliteStore,
+    id: str,
+    measure: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    limit: int | None,
+    cursor: str | None,
+    resolution: str,
+    since: str | None,
+) -> tuple[series.Series, dict]:
+    """
+    Return the readings a meter data request asks for, with the parameters
+    of the transfer for its provenance record and the cursor of the next page
+    """
+    next_cursor = None
+    parameters = None
+    if since:
+        try:
+            data = readings.changes(id, measure, start, end, since)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # The transfer covers only the readings changed since the watermark
+        parameters = {"since": since}
+        if len(data):
+            parameters["from"] = provenance.to_iso(series.from_epoch(data.start[0]))
+            parameters["to"] = provenance.to_iso(series.from_epoch(data.end[-1]))
+    elif resolution != "halfhour":
+        data = readings.aggregate(id, measure, start, end, resolution)
+        parameters = {"resolution": resolution}
+    else:
+        # Fetch one reading past the limit to find out if there is another page
+        data = readings.between(
+            id, measure, start, end, limit=limit + 1 if limit else None
+        )
+    if limit:
+        if len(data) > limit:
+            data = data.take(slice(0, limit))
+            next_cursor = pagination.encode_cursor(int(data.start[-1]))
+        # Each page is attested on its own, the transfer covering its readings
+        parameters = {"limit": limit}
+        if cursor:
+            parameters["cursor"] = cursor
+        if len(data):
+            parameters["from"] = provenance.to_iso(series.from_epoch(data.start[0]))
+            parameters["to"] = provenance.to_iso(series.from_epoch(data.end[-1]))
+    return data, {"parameters": parameters, "nextCursor": next_cursor}
+
+
+def json_response(content: bytes, etag: str, encoding: str | None = None) -> Response:
+    """
+    Meter data written by api/formats.py, which FastAPI sends as it is rather
+    than checking it against the response model
+    """
+    headers = {"ETag": etag, "Vary": VARY}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content, media_type=formats.JSON, headers=headers)
+
+
+def columnar_response(
+    media_type: str,
+    data: series.Series,
+    fields: dict,
+    etag: str,
+    encoding: str | None = None,
+) -> Response:
+    """
+    Meter data as an Arrow IPC stream, CSV or MessagePack, see api/formats.py,
+    compressed with encoding if given
+    """
+    headers = {"ETag": etag, "Vary": VARY}
+    if media_type == formats.ARROW_STREAM:
+        content = formats.arrow_stream(data, fields)
+    elif media_type == formats.MSGPACK:
+        content = formats.msgpack_columns(data, fields)
+    else:
+        content = (formats.CSV_HEADER + formats.csv_lines(data)).encode()
+        headers.update(
+            {
+                "Provenance": formats.encode_header(fields["provenance"]),
+                "Meter-Location": formats.encode_header(fields["location"]),
+                "Watermark": fields["watermark"],
+            }
+        )
+        if "nextCursor" in fields:
+            headers["Next-Cursor"] = fields["nextCursor"]
+    if encoding:
+        content = compression.compress(encoding, content)
+        headers["Content-Encoding"] = encoding
+    return Response(content, media_type=media_type, headers=headers)
+
+
+def time_of_use(
+    readings: store.ReadingStore | store.SqliteStore,
+    auth_result: tuple[dict, dict, object],
+    id: str,
+    measure: str,
+    from_date: datetime.date,
+    to_date: datetime.date,
+    resolution: str,
+) -> dict:
+    """
+    Meter data totalled by time-of-use band and day type for each period
+    """
+    bands = timeofuse.get_bands()
+    start, end = series.date_range(from_date, to_date)
+    data = readings.time_of_use(id, measure, start, end, resolution, bands)
+    record = create_provenance_record(
+        auth_result,
+        f"/datasources/{id}/{measure}",
+        measure,
+        from_date,
+        to_date,
+        {"resolution": resolution, "bands": bands.spec},
+        complete=readings.complete(id, measure, start, end),
+    )
     return {
-        "data": data,
-        "location": {"ukPostcodeOutcode": DEMO_DATA_SOURCE_LOCATION},
+        "data": [
+            {
+                "from": series.from_epoch(row["from"]),
+                "to": series.from_epoch(row["to"]),
+                "band": row["band"],
+                "dayType": row["dayType"],
+                "energy": {"value": row["energy"], "unitCode": row["unit"]},
+                "intervals": row["intervals"],
+            }
+            for row in data
+        ],
+        "location": registry.get_registry().location(id),
+        "provenance": record,
+    }
+
+
+@app.get("/datasources/{id}/{measure}/total", response_model=models.EnergyTotal)
+def total(
+    id: str,
+    measure: str,
+    from_datetime: datetime.datetime = Query(
+        alias="from", description="Start of the range, on a half-hour"
+    ),
+    to_datetime: datetime.datetime = Query(
+        alias="to", description="End of the range, on a half-hour"
+    ),
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    Total energy over a half-hour aligned range, with any gaps in the readings
+    """
+    readings = get_readings(auth_result, id, measure)
+    start = series.to_epoch(from_datetime)
+    end = series.to_epoch(to_datetime)
+    if start % totals.INTERVAL or end % totals.INTERVAL:
+        raise HTTPException(
+            status_code=400, detail="from and to must be on a half-hour"
+        )
+    if end < start:
+        raise HTTPException(status_code=400, detail="to must not be before from")
+    result = readings.total(
+        id, measure, series.from_epoch(start), series.from_epoch(end)
+    )
+    record = create_provenance_record(
+        auth_result,
+        f"/datasources/{id}/{measure}/total",
+        measure,
+        series.from_epoch(start),
+        series.from_epoch(end),
+        {"aggregation": "total"},
+        complete=result["intervals"] == result["expectedIntervals"],
+    )
+    return {
+        "from": series.from_epoch(start),
+        "to": series.from_epoch(end),
+        "energy": {"value": result["energy"], "unitCode": result["unit"]},
+        "intervals": result["intervals"],
+        "expectedIntervals": result["expectedIntervals"],
+        "gaps": [
+            {"from": series.from_epoch(a), "to": series.from_epoch(b)}
+            for a, b in result["gaps"]
+        ],
+        "location": registry.get_registry().location(id),
+        "provenance": record,
+    }
+
+
+@app.get("/datasources/{id}/{measure}/emissions", response_model=models.Emissions)
+def emissions(
+    id: str,
+    measure: str,
+    from_date: datetime.date = Query(alias="from"),
+    to_date: datetime.date = Query(alias="to"),
+    resolution: Literal["halfhour", "hour", "day", "month", "year"] = Query(
+        "day", description="Sum energy and emissions over periods of this length"
+    ),
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    Energy and carbon emissions over a date range, each reading weighted by
+    the grid carbon intensity of its half-hour
+    """
+    readings = get_readings(auth_result, id, measure)
+    start, end = series.date_range(from_date, to_date)
+    data = readings.between(id, measure, start, end)
+    result = carbon.emissions(
+        data, carbon.get_intensity_source(), resolution, start, end
+    )
+    record = create_provenance_record(
+        auth_result,
+        f"/datasources/{id}/{measure}/emissions",
+        measure,
+        from_date,
+        to_date,
+        {"aggregation": "emissions", "resolution": resolution},
+        complete=readings.complete(id, measure, start, end),
+    )
+    return {
+        **emissions_result(result, data.unit, start, end),
+        "location": registry.get_registry().location(id),
         "provenance": record,
     }
 
 
+def emissions_result(
+    result: dict, unit: str, start: datetime.datetime, end: datetime.datetime
+) -> dict:
+    """
+    Energy and emissions from carbon.emissions in the shape of the response
+    """
+
+    def energy(value: float) -> dict:
+        return {"value": value, "unitCode": unit}
+
+    def grams(value: float) -> dict:
+        return {"value": value, "unitCode": carbon.EMISSIONS_UNIT}
+
+    return {
+        "from": start,
+        "to": end,
+        "energy": energy(result["energy"]),
+        "emissions": grams(result["emissions"]),
+        "unmatchedIntervals": result["unmatched"],
+        "data": [
+            {
+                "from": series.from_epoch(period["from"]),
+                "to": series.from_epoch(period["to"]),
+                "energy": energy(period["energy"]),
+                "emissions": grams(period["emissions"]),
+            }
+            for period in result["periods"]
+        ],
+    }
+
+
+@app.get("/datasources/{id}/{measure}/statistics", response_model=models.Statistics)
+def load_profile(
+    id: str,
+    measure: str,
+    from_date: datetime.date = Query(alias="from"),
+    to_date: datetime.date = Query(alias="to"),
+    percentiles: list[float] = Query(
+        list(statistics.PERCENTILES),
+        description="Percentiles of half-hourly energy to return, 0 to 100",
+    ),
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    Load-profile statistics over a date range: peak half-hour with its time,
+    baseload, mean, percentiles and the average energy at each time of day
+    """
+    readings = get_readings(auth_result, id, measure)
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise HTTPException(
+            status_code=400, detail="percentiles must be between 0 and 100"
+        )
+    start, end = series.date_range(from_date, to_date)
+    data = readings.between(id, measure, start, end)
+    result = statistics.load_profile(data, tuple(percentiles))
+    record = create_provenance_record(
+        auth_result,
+        f"/datasources/{id}/{measure}/statistics",
+        measure,
+        from_date,
+        to_date,
+        {"aggregation": "statistics"},
+        complete=readings.complete(id, measure, start, end),
+    )
+    return {
+        **statistics_result(result, data.unit, start, end),
+        "location": registry.get_registry().location(id),
+        "provenance": record,
+    }
+
+
+def statistics_result(
+    result: dict, unit: str, start: datetime.datetime, end: datetime.datetime
+) -> dict:
+    """
+    Statistics from statistics.load_profile in the shape of the response
+    """
+
+    def energy(value: float | None) -> dict | None:
+        return None if value is None else {"value": value, "unitCode": unit}
+
+    peak = result["peak"]
+    if peak is not None:
+        peak = {
+            "from": series.from_epoch(peak["from"]),
+            "to": series.from_epoch(peak["to"]),
+            "energy": energy(peak["energy"]),
+        }
+    return {
+        "from": start,
+        "to": end,
+        "intervals": result["intervals"],
+        "peak": peak,
+        "baseload": energy(result["baseload"]),
+        "mean": energy(result["mean"]),
+        "percentiles": [
+            {"percentile": p, "energy": energy(value)}
+            for p, value in result["percentiles"]
+        ],
+        "profile": [
+            {
+                "time": f"{offset // 3600:02d}:{offset % 3600 // 60:02d}",
+                "energy": energy(value),
+                "intervals": count,
+            }
+            for offset, value, count in result["profile"]
+        ],
+    }
+
+
+async def event_stream(
+    readings: store.ReadingStore | store.SqliteStore,
+    auth_result: tuple[dict, dict, object],
+    id: str,
+    measure: str,
+) -> AsyncIterator[bytes]:
+    """
+    Yield server-sent events: a readings event for each batch of readings
+    added, with the watermark after it as the event id, and every
+    EVENTS_PROVENANCE_SECONDS a provenance event attesting the readings sent
+    since the last one. Ends when the client falls too far behind, with a
+    lagged event holding the last watermark sent, or when the token expires.
+    """
+    decoded, _, _ = auth_result
+    path = f"/datasources/{id}/{measure}/events"
+    loop = asyncio.get_running_loop()
+    with readings.subscribe(id, measure) as subscription:
+        watermark = readings.watermark(id, measure)
+        yield formats.event("subscribed", {"watermark": watermark}, id=watermark)
+        # Range and first watermark of the readings sent since the last
+        # provenance event
+        unattested: tuple[int, int, str] | None = None
+        next_provenance = loop.time() + conf.EVENTS_PROVENANCE_SECONDS
+        while time.time() < decoded.get("exp", math.inf):
+            timeout = min(
+                conf.EVENTS_KEEPALIVE_SECONDS, max(next_provenance - loop.time(), 0)
+            )
+            try:
+                batches = await subscription.get(timeout)
+            except SubscriberLagged as e:
+                logger.warning("Dropping subscriber %s: %s", decoded["sub"], e)
+                yield formats.event("lagged", {"watermark": watermark})
+                return
+            for data, added in batches:
+                yield formats.event("readings", {"data": data.to_readings()}, id=added)
+                first, last = int(data.start.min()), int(data.end.max())
+                if unattested is not None:
+                    first = min(first, unattested[0])
+                    last = max(last, unattested[1])
+                unattested = (first, last, unattested[2] if unattested else watermark)
+                watermark = added
+            if not batches:
+                yield b": keepalive\n\n"
+            if loop.time() < next_provenance:
+                continue
+            next_provenance = loop.time() + conf.EVENTS_PROVENANCE_SECONDS
+            if unattested is None:
+                continue
+            first, last, since = unattested
+            unattested = None
+            # Signing is CPU bound, so is kept off the event loop
+            record = await asyncio.to_thread(
+                create_provenance_record,
+                auth_result,
+                path,
+                measure,
+                series.from_epoch(first),
+                series.from_epoch(last),
+                {"since": since, "watermark": watermark},
+                readings.complete(
+                    id, measure, series.from_epoch(first), series.from_epoch(last)
+                ),
+            )
+            yield formats.event("provenance", {"provenance": record}, id=watermark)
+
+
+@app.get(
+    "/datasources/{id}/{measure}/events",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {
+                formats.EVENT_STREAM: {
+                    "description": "readings events as readings are added, and "
+                    "periodic provenance events attesting them"
+                }
+            }
+        }
+    },
+)
+def events(
+    id: str,
+    measure: str,
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    Subscribe to readings as they are added to a data source
+    """
+    readings = get_readings(auth_result, id, measure)
+    decoded, _, _ = auth_result
+    logger.info("Subscribing %s to %s %s", decoded["sub"], id, measure)
+    return StreamingResponse(
+        event_stream(readings, auth_result, id, measure),
+        media_type=formats.EVENT_STREAM,
+        # Stop nginx buffering events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def exports_available():
+    """
+    Refuse export requests on Lambda, see api/exports.py
+    """
+    if conf.LAMBDA:
+        raise HTTPException(
+            status_code=501, detail="Exports are not available on Lambda"
+        )
+
+
+def export_status(job: dict) -> dict:
+    if job["status"] == exports.COMPLETE:
+        return {**job, "download": f"/exports/{job['jobId']}/file"}
+    return job
+
+
+def get_export(auth_result: tuple[dict, dict, object], job_id: str) -> dict:
+    """
+    Return an export job submitted by the token's account, or raise 404
+    """
+    decoded, _, _ = auth_result
+    job = exports.get_exports().get(job_id)
+    if job is None or job["account"] != decoded["sub"]:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+
+@app.post(
+    "/exports",
+    status_code=202,
+    dependencies=[Depends(exports_available)],
+    response_model=models.ExportJob,
+    response_model_exclude_none=True,
+)
+def submit_export(
+    request: models.ExportRequest,
+    response: Response,
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    Export a long range of meter data to a file in the background. Poll the
+    job at the Location returned until it is complete, then download it.
+    """
+    readings = get_readings(auth_result, request.id, request.measure)
+    if request.to_date <= request.from_date:
+        raise HTTPException(status_code=400, detail="to must be after from")
+
+    def sign(complete: bool) -> dict:
+        return create_provenance_record(
+            auth_result,
+            "/exports",
+            request.measure,
+            request.from_date,
+            request.to_date,
+            {"id": request.id, "format": request.format},
+            complete=complete,
+        )
+
+    decoded, _, _ = auth_result
+    job = exports.get_exports().submit(
+        readings,
+        decoded["sub"],
+        request.id,
+        request.measure,
+        request.from_date,
+        request.to_date,
+        request.format,
+        sign,
+    )
+    logger.info("Export %s %s for %s", job["jobId"], job["status"], decoded["sub"])
+    response.headers["Location"] = f"/exports/{job['jobId']}"
+    return export_status(job)
+
+
+@app.get(
+    "/exports/{job_id}",
+    dependencies=[Depends(exports_available)],
+    response_model=models.ExportJob,
+    response_model_exclude_none=True,
+)
+def export(
+    job_id: str,
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    The status of an export job, with its provenance record once complete
+    """
+    return export_status(get_export(auth_result, job_id))
+
+
+@app.get(
+    "/exports/{job_id}/file",
+    dependencies=[Depends(exports_available)],
+    response_class=FileResponse,
+    responses={
+        200: {
+            "content": {media_type: {} for media_type in exports.MEDIA_TYPES.values()}
+        }
+    },
+)
+def export_file(
+    job_id: str,
+    auth_result: tuple[dict, dict, object] = Depends(require_mtls_and_token),
+):
+    """
+    Download the file written by a complete export job
+    """
+    job = get_export(auth_result, job_id)
+    if job["status"] != exports.COMPLETE:
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    return FileResponse(
+        exports.get_exports().file(job),
+        media_type=exports.MEDIA_TYPES[job["format"]],
+        filename=f"{job['id']}-{job['measure']}-{job['from']}-{job['to']}."
+        f"{job['format']}",
+    )
+
+
 def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
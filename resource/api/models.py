@@ -1,6 +1,10 @@
 import datetime
+from typing import Literal
 from pydantic import BaseModel, Field
 
+# Most series a batch request may ask for
+MAX_BATCH_SERIES = 100
+
 
 class Consumption(BaseModel):
     value: float
@@ -16,6 +20,186 @@ class Reading(BaseModel):
     cumulative: Consumption
 
 
+class Period(BaseModel):
+    from_date: datetime.datetime = Field(alias="from")
+    to_date: datetime.datetime = Field(alias="to")
+
+
+class EnergyTotal(BaseModel):
+    from_date: datetime.datetime = Field(alias="from")
+    to_date: datetime.datetime = Field(alias="to")
+    energy: Consumption
+    intervals: int
+    expectedIntervals: int
+    gaps: list[Period]
+    location: dict
+    provenance: dict
+
+
+class EmissionsPeriod(BaseModel):
+    from_date: datetime.datetime = Field(alias="from")
+    to_date: datetime.datetime = Field(alias="to")
+    energy: Consumption
+    emissions: Consumption
+
+
+class SeriesEmissions(BaseModel):
+    from_date: datetime.datetime = Field(alias="from")
+    to_date: datetime.datetime = Field(alias="to")
+    energy: Consumption
+    emissions: Consumption
+    unmatchedIntervals: int
+    data: list[EmissionsPeriod]
+
+
+class Emissions(SeriesEmissions):
+    location: dict
+    provenance: dict
+
+
+class Peak(BaseModel):
+    from_date: datetime.datetime = Field(alias="from")
+    to_date: datetime.datetime = Field(alias="to")
+    energy: Consumption
+
+
+class Percentile(BaseModel):
+    percentile: float
+    energy: Consumption
+
+
+class ProfileInterval(BaseModel):
+    time: str
+    energy: Consumption
+    intervals: int
+
+
+class SeriesStatistics(BaseModel):
+    from_date: datetime.datetime = Field(alias="from")
+    to_date: datetime.datetime = Field(alias="to")
+    intervals: int
+    peak: Peak | None
+    baseload: Consumption | None
+    mean: Consumption | None
+    percentiles: list[Percentile]
+    profile: list[ProfileInterval]
+
+
+class Statistics(SeriesStatistics):
+    location: dict
+    provenance: dict
+
+
+class BandTotal(BaseModel):
+    from_date: datetime.datetime = Field(alias="from")
+    to_date: datetime.datetime = Field(alias="to")
+    band: str
+    dayType: Literal["weekday", "weekend"]
+    energy: Consumption
+    intervals: int
+
+
+class TimeOfUseData(BaseModel):
+    data: list[BandTotal]
+    location: dict
+    provenance: dict
+
+
+class MeasureAvailability(BaseModel):
+    measure: str
+    intervals: int
+    expectedIntervals: int
+    covered: list[Period]
+    missing: list[Period]
+
+
+class Availability(BaseModel):
+    id: str
+    from_date: datetime.datetime = Field(alias="from")
+    to_date: datetime.datetime = Field(alias="to")
+    measures: list[MeasureAvailability]
+
+
+class SeriesReference(BaseModel):
+    id: str
+    measure: str
+
+
+class BatchRequest(BaseModel):
+    from_date: datetime.date = Field(alias="from")
+    to_date: datetime.date = Field(alias="to")
+    series: list[SeriesReference] = Field(min_length=1, max_length=MAX_BATCH_SERIES)
+
+
+class AggregateRequest(BaseModel):
+    from_date: datetime.date = Field(alias="from")
+    to_date: datetime.date = Field(alias="to")
+    series: list[SeriesReference] = Field(min_length=1, max_length=MAX_BATCH_SERIES)
+    aggregation: Literal["resample", "statistics", "emissions"]
+    resolution: Literal["halfhour", "hour", "day", "month", "year"] = "day"
+    percentiles: list[float] | None = None
+
+
+class ExportRequest(BaseModel):
+    id: str
+    measure: str
+    from_date: datetime.date = Field(alias="from")
+    to_date: datetime.date = Field(alias="to")
+    format: Literal["csv", "parquet"] = "csv"
+
+
+class ExportJob(BaseModel):
+    jobId: str
+    id: str
+    measure: str
+    from_date: datetime.date = Field(alias="from")
+    to_date: datetime.date = Field(alias="to")
+    format: str
+    status: Literal["queued", "running", "complete", "failed"]
+    submitted: str
+    rows: int | None = None
+    error: str | None = None
+    download: str | None = None
+    provenance: dict | None = None
+
+
+class SeriesData(BaseModel):
+    id: str
+    measure: str
+    data: list[Reading]
+    location: dict
+
+
+class BatchMeterData(BaseModel):
+    data: list[SeriesData]
+    provenance: dict
+
+
+class SeriesAggregate(BaseModel):
+    id: str
+    measure: str
+    location: dict
+    readings: list[Reading] | None = None
+    statistics: SeriesStatistics | None = None
+    emissions: SeriesEmissions | None = None
+
+
+class MeasureTotal(BaseModel):
+    measure: str
+    series: int
+    energy: Consumption
+    emissions: Consumption | None = None
+
+
+class AggregateData(BaseModel):
+    from_date: datetime.datetime = Field(alias="from")
+    to_date: datetime.datetime = Field(alias="to")
+    aggregation: str
+    data: list[SeriesAggregate]
+    totals: list[MeasureTotal]
+    provenance: dict
+
+
 class Datasource(BaseModel):
     id: str
     type: str
@@ -31,6 +215,8 @@ class MeterData(BaseModel):
     data: list[Reading]
     location: dict
     provenance: dict
+    nextCursor: str | None = None
+    watermark: str | None = None
     model_config = {
         "json_schema_extra": {
             "examples": [
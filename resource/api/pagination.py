@@ -0,0 +1,44 @@
+"""
+Opaque keyset cursors for paging through meter data.
+
+A cursor records the interval start of the last reading on a page, so the next
+page is a seek to the first reading after it rather than an offset scan.
+"""
+
+import base64
+import datetime
+import json
+
+MAX_LIMIT = 10000
+# Latest interval start a cursor may hold, so the next page starts at a date
+MAX_AFTER = int(
+    datetime.datetime(
+        9999, 12, 31, 23, 59, 58, tzinfo=datetime.timezone.utc
+    ).timestamp()
+)
+
+
+def encode_cursor(after: int) -> str:
+    """
+    Encode the interval start, in epoch seconds, of the last reading on a page
+    """
+    payload = json.dumps({"after": after}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Return the interval start encoded in a cursor.
+
+    Raises:
+        ValueError: If the cursor was not issued by encode_cursor
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        after = json.loads(payload)["after"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    # bool is an int, but not one encode_cursor writes
+    if type(after) is not int or not 0 <= after <= MAX_AFTER:
+        raise ValueError("Invalid cursor")
+    return after
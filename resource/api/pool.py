@@ -0,0 +1,160 @@
+"""
+Multi-meter aggregation in a pool of worker processes.
+
+Resampling, statistics and emissions over many meters and long ranges are
+CPU-bound, and run in a web worker they would hold its threadpool and the GIL
+its event loop needs. Instead the series of a request are split by meter, and
+each meter's share is aggregated in a bounded pool of processes. Each worker
+opens the reading store itself with store.get_store() as it starts, so only the
+request and the aggregated arrays cross between processes: with the columnar
+backend the workers memory map the same files, with sqlite read the same
+database, and with tiered storage reuse the cold months already written, see
+api/tiers.py. The json backend is parsed again by each worker. On Lambda, which
+has no /dev/shm for the queues of a process pool, the pool runs threads in the
+web process instead.
+
+The pool holds at most AGGREGATION_WORKERS + AGGREGATION_QUEUE meters' work at
+a time, and raises PoolBusy for a request that does not fit so the client can
+retry later, rather than letting the queue grow without bound. A request for
+more meters than that is admitted only when the pool is idle.
+"""
+
+import datetime
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable
+
+from . import carbon, conf, statistics, store
+from .exceptions import PoolBusy
+from .logger import get_logger
+
+logger = get_logger()
+
+# Weight of each finished partition in the moving average of their latency
+LATENCY_WEIGHT = 0.2
+
+
+def aggregate_meter(
+    meter_id: str,
+    measures: list[str],
+    start: datetime.datetime,
+    end: datetime.datetime,
+    aggregation: str,
+    resolution: str,
+    percentiles: tuple[float, ...],
+) -> list[dict]:
+    """
+    Aggregate readings of one meter's measures within [start, end), in a
+    worker process. Returns for each measure its unit, total energy, whether
+    the range is complete and the result of the aggregation: for resample the
+    aggregated Series, whose arrays are cheap to send back.
+
+    Raises:
+        ValueError: If asked to resample to half-hours, which would send every
+            reading back rather than aggregate them
+    """
+    if aggregation == "resample" and resolution == "halfhour":
+        raise ValueError("resample requires a resolution of hour or longer")
+    readings = store.get_store()
+    results = []
+    for measure in measures:
+        if aggregation == "resample":
+            data = readings.aggregate(meter_id, measure, start, end, resolution)
+        else:
+            data = readings.between(meter_id, measure, start, end)
+        if aggregation == "resample":
+            result = data
+        elif aggregation == "statistics":
+            result = statistics.load_profile(data, percentiles)
+        else:
+            source = carbon.get_intensity_source()
+            result = carbon.emissions(data, source, resolution, start, end)
+        results.append(
+            {
+                "measure": measure,
+                "unit": data.unit,
+                "energy": float(data.energy.sum()),
+                "complete": readings.complete(meter_id, measure, start, end),
+                "result": result,
+            }
+        )
+    return results
+
+
+class AggregationPool:
+    """
+    A pool of worker processes, or threads, that admits a bounded number of
+    partitions
+    """
+
+    def __init__(self, workers: int, queue: int, threads: bool = False):
+        self.workers = workers
+        self.capacity = workers + queue
+        self.pending = 0
+        # Moving average of the seconds from submitting a partition to its result
+        self.latency = 1.0
+        self._lock = threading.Lock()
+        self.executor: Executor
+        if threads:
+            self.executor = ThreadPoolExecutor(
+                workers, thread_name_prefix="aggregation"
+            )
+        else:
+            # Workers start afresh rather than fork a process running threads,
+            # and open the store before the first partition arrives
+            self.executor = ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=store.get_store,
+            )
+
+    def retry_after(self) -> int:
+        """
+        Seconds a client turned away should wait, about the time for a
+        partition to finish and make room
+        """
+        return max(1, math.ceil(self.latency))
+
+    def submit(self, fn: Callable, partitions: list[tuple]) -> list[Future]:
+        """
+        Run fn on each partition's arguments in the workers
+
+        Raises:
+            PoolBusy: If the partitions do not fit in the pool
+        """
+        with self._lock:
+            if self.pending and self.pending + len(partitions) > self.capacity:
+                raise PoolBusy(
+                    f"{self.pending} of {self.capacity} partitions pending",
+                    self.retry_after(),
+                )
+            self.pending += len(partitions)
+        submitted = time.monotonic()
+        futures = []
+        for args in partitions:
+            future = self.executor.submit(fn, *args)
+            future.add_done_callback(lambda _: self._done(submitted))
+            futures.append(future)
+        return futures
+
+    def _done(self, submitted: float):
+        with self._lock:
+            self.pending -= 1
+            latency = time.monotonic() - submitted
+            self.latency += LATENCY_WEIGHT * (latency - self.latency)
+
+
+@lru_cache(maxsize=None)
+def get_pool() -> AggregationPool:
+    """
+    Return the aggregation pool of this process, starting it on first use
+    """
+    if conf.LAMBDA:
+        logger.info("Aggregating in threads, as Lambda cannot run a process pool")
+    return AggregationPool(
+        conf.AGGREGATION_WORKERS, conf.AGGREGATION_QUEUE, threads=conf.LAMBDA
+    )
@@ -14,25 +14,20 @@ from .logger import get_logger
 logging = get_logger()
 
 
+def to_iso(timestamp: datetime.datetime) -> str:
+    return f"{timestamp.strftime('%Y-%m-%dT%H:%M')}Z"
+
+
 def _date_to_iso(date: datetime.date) -> str:
+    if isinstance(date, datetime.datetime):
+        return to_iso(date)
     return f"{date.isoformat()}T00:00Z"
 
 
-def create_provenance_records(
-    from_date: datetime.date,
-    to_date: datetime.date,
-    permission_granted: datetime.datetime,
-    permission_expires: datetime.datetime,
-    service_url: str,
-    account: str,
-    fapi_id: str,
-    cap_member: str,
-) -> bytes:
-
+def _signer() -> SignerInMemory:
     certificate_provider = CertificatesProviderSelfContainedRecord(
         get_certificate(conf.SIGNING_ROOT_CA_CERTIFICATE)
     )
-    logging.info(f"Creating provenance records for account: {account}")
     logging.info(f"Certs: {certificate_provider}")
     logging.info(f"Root CA: {conf.SIGNING_ROOT_CA_CERTIFICATE}")
     logging.info(get_certificate(conf.SIGNING_ROOT_CA_CERTIFICATE))
@@ -44,12 +39,30 @@ def create_provenance_records(
     private_key = get_key(conf.SIGNING_KEY)
     logging.info(f"Private key: {private_key}")
     logging.info(f"Key type: {type(private_key)}")
-    signer_edp = SignerInMemory(
+    return SignerInMemory(
         certificate_provider,
         signer_edp_certs,  # list containing certificate and issuer chain
         private_key,  # private key
     )
 
+
+def _sign_transfers(
+    from_date: datetime.date,
+    to_date: datetime.date,
+    permission_granted: datetime.datetime,
+    permission_expires: datetime.datetime,
+    service_url: str,
+    account: str,
+    fapi_id: str,
+    cap_member: str,
+    transfers: list[tuple[dict, bool]],
+) -> bytes:
+    """
+    Sign a record with one permission step, then an origin and a transfer
+    step for each (transfer parameters, complete) pair
+    """
+    signer_edp = _signer()
+
     edp_record = Record(conf.TRUST_FRAMEWORK_URL)
     # - Permission step to record consent by end user
     edp_permission_id = edp_record.add_step(
@@ -66,49 +79,47 @@ def create_provenance_records(
             "expires": f"{permission_expires.isoformat()[0:-7]}Z",
         }
     )
-    origin_id = edp_record.add_step(
-        {
-            "type": "origin",
-            "scheme": conf.SCHEME_BASE_URL,
-            "sourceType": f"{conf.SCHEME_BASE_URL}/source-type/Meter",
-            "origin": "https://www.smartdcc.co.uk/",
-            "originLicence": "https://smartenergycodecompany.co.uk/documents/sec/consolidated-sec/",
-            "external": True,
-            "permissions": [edp_permission_id],
-            "perseus:scheme": {
-                "meteringPeriod": {
-                    "from": _date_to_iso(from_date),
-                    "to": _date_to_iso(to_date),
-                }
-            },
-            "perseus:assurance": {  # TODO add logic to select correct assurance
-                "dataSource": f"{conf.SCHEME_BASE_URL}/assurance/data-source/SmartMeter",
-                "missingData": f"{conf.SCHEME_BASE_URL}/assurance/missing-data/Missing",
-                "processing": f"{conf.SCHEME_BASE_URL}/assurance/processing/SmartDCCOtherUser",
-            },
-        }
-    )
+    for parameters, complete in transfers:
+        missing_data = "Complete" if complete else "Missing"
+        origin_id = edp_record.add_step(
+            {
+                "type": "origin",
+                "scheme": conf.SCHEME_BASE_URL,
+                "sourceType": f"{conf.SCHEME_BASE_URL}/source-type/Meter",
+                "origin": "https://www.smartdcc.co.uk/",
+                "originLicence": "https://smartenergycodecompany.co.uk/documents/sec/consolidated-sec/",
+                "external": True,
+                "permissions": [edp_permission_id],
+                "perseus:scheme": {
+                    "meteringPeriod": {
+                        "from": _date_to_iso(from_date),
+                        "to": _date_to_iso(to_date),
+                    }
+                },
+                "perseus:assurance": {
+                    "dataSource": f"{conf.SCHEME_BASE_URL}/assurance/data-source/SmartMeter",
+                    "missingData": f"{conf.SCHEME_BASE_URL}/assurance/missing-data/{missing_data}",
+                    "processing": f"{conf.SCHEME_BASE_URL}/assurance/processing/SmartDCCOtherUser",
+                },
+            }
+        )
 
-    # - Transfer step to send it to the CAP
-    edp_record.add_step(
-        {
-            "type": "transfer",
-            "scheme": conf.SCHEME_BASE_URL,
-            "of": origin_id,
-            "to": cap_member,
-            "standard": f"{conf.SCHEME_BASE_URL}/standard/energy-consumption-data/2024-12-05",
-            "licence": f"{conf.SCHEME_BASE_URL}/licence/energy-consumption-data/2024-12-05",
-            "service": service_url,
-            "path": "/readings",
-            "parameters": {
-                "measure": "import",
-                "from": _date_to_iso(from_date),
-                "to": _date_to_iso(to_date),
-            },
-            "permissions": [edp_permission_id],
-            "transaction": fapi_id,
-        }
-    )
+        # - Transfer step to send it to the CAP
+        edp_record.add_step(
+            {
+                "type": "transfer",
+                "scheme": conf.SCHEME_BASE_URL,
+                "of": origin_id,
+                "to": cap_member,
+                "standard": f"{conf.SCHEME_BASE_URL}/standard/energy-consumption-data/2024-12-05",
+                "licence": f"{conf.SCHEME_BASE_URL}/licence/energy-consumption-data/2024-12-05",
+                "service": service_url,
+                "path": "/readings",
+                "parameters": parameters,
+                "permissions": [edp_permission_id],
+                "transaction": fapi_id,
+            }
+        )
 
     # EDP signs the steps
     edp_record_signed = edp_record.sign(signer_edp)
@@ -116,3 +127,87 @@ def create_provenance_records(
     # Get encoded data for inclusion in data response
     edp_data_attachment = edp_record_signed.encoded()
     return edp_data_attachment
+
+
+def create_provenance_records(
+    from_date: datetime.date,
+    to_date: datetime.date,
+    permission_granted: datetime.datetime,
+    permission_expires: datetime.datetime,
+    service_url: str,
+    account: str,
+    fapi_id: str,
+    cap_member: str,
+    measure: str = "import",
+    parameters: dict | None = None,
+    complete: bool = False,
+) -> bytes:
+    """
+    Create and sign a provenance record for a transfer of meter data.
+    `parameters` are added to, or replace, the transfer step's parameters,
+    e.g. to narrow the transfer to a single page of readings. `complete`
+    records that no readings are missing from the metering period.
+    """
+    logging.info(f"Creating provenance records for account: {account}")
+    transfer = {
+        "measure": measure,
+        "from": _date_to_iso(from_date),
+        "to": _date_to_iso(to_date),
+        **(parameters or {}),
+    }
+    return _sign_transfers(
+        from_date,
+        to_date,
+        permission_granted,
+        permission_expires,
+        service_url,
+        account,
+        fapi_id,
+        cap_member,
+        [(transfer, complete)],
+    )
+
+
+def create_batch_provenance_records(
+    from_date: datetime.date,
+    to_date: datetime.date,
+    permission_granted: datetime.datetime,
+    permission_expires: datetime.datetime,
+    service_url: str,
+    account: str,
+    fapi_id: str,
+    cap_member: str,
+    series: list[tuple[str, str, bool]],
+    parameters: dict | None = None,
+) -> bytes:
+    """
+    Create and sign one provenance record for several series of meter data
+    sent together, with an origin and transfer step for each (meter id,
+    measure, complete) in `series`. `parameters` are added to each transfer
+    step's parameters.
+    """
+    logging.info(f"Creating batch provenance records for account: {account}")
+    transfers = [
+        (
+            {
+                "id": meter_id,
+                "measure": measure,
+                "from": _date_to_iso(from_date),
+                "to": _date_to_iso(to_date),
+                **(parameters or {}),
+            },
+            complete,
+        )
+        for meter_id, measure, complete in series
+    ]
+    return _sign_transfers(
+        from_date,
+        to_date,
+        permission_granted,
+        permission_expires,
+        service_url,
+        account,
+        fapi_id,
+        cap_member,
+        transfers,
+    )
@@ -0,0 +1,121 @@
+"""
+Registry of meters and the accounts allowed to read them.
+
+The registry is a JSON file loaded once per process:
+
+    {
+        "meters": {
+            "S018011012261305588165": {
+                "type": "electricity",
+                "location": {"ukPostcodeOutcode": "SW8"}
+            }
+        },
+        "accounts": {"account-sub": ["S018011012261305588165"]},
+        "defaultMeters": ["S018011012261305588165"]
+    }
+
+`accounts` maps the `sub` of an access token to its meters. Accounts not
+listed get `defaultMeters`, so the demo meter can be read by any account.
+When loaded, each account's data sources, with the measures the reading store
+holds for each meter, are built once, so listing them or authorising a meter
+is a dictionary lookup.
+"""
+
+import json
+import os
+from functools import lru_cache
+
+from . import conf
+from .logger import get_logger
+from .sqlite_store import SqliteStore
+from .store import ReadingStore, get_store
+
+logger = get_logger()
+
+
+class Registry:
+    """
+    Meters indexed by account
+    """
+
+    def __init__(
+        self,
+        meters: dict[str, dict],
+        accounts: dict[str, list[str]],
+        default_meters: list[str],
+        readings: ReadingStore | SqliteStore,
+    ):
+        self._meters = meters
+        self._datasources = {
+            meter_id: {
+                "id": meter_id,
+                "type": meter["type"],
+                "location": meter["location"],
+                "availableMeasures": readings.measures(meter_id),
+            }
+            for meter_id, meter in meters.items()
+        }
+        self._accounts = {
+            account: self._index(meter_ids) for account, meter_ids in accounts.items()
+        }
+        self._default = self._index(default_meters)
+
+    def _index(self, meter_ids: list[str]) -> tuple[list[dict], frozenset[str]]:
+        unknown = set(meter_ids) - self._meters.keys()
+        if unknown:
+            raise ValueError(f"Unknown meters in registry: {', '.join(unknown)}")
+        return [self._datasources[m] for m in meter_ids], frozenset(meter_ids)
+
+    def datasources(self, account: str) -> list[dict]:
+        """
+        Return the data sources an account may read
+        """
+        return self._accounts.get(account, self._default)[0]
+
+    def authorised(self, account: str, meter_id: str) -> bool:
+        return meter_id in self._accounts.get(account, self._default)[1]
+
+    def location(self, meter_id: str) -> dict:
+        return self._meters[meter_id]["location"]
+
+
+def load_registry(path: str, readings: ReadingStore | SqliteStore) -> Registry:
+    with open(path) as f:
+        data = json.load(f)
+    registry = Registry(
+        data["meters"],
+        data.get("accounts", {}),
+        data.get("defaultMeters", []),
+        readings,
+    )
+    logger.info(
+        f"Loaded {len(data['meters'])} meters for "
+        f"{len(data.get('accounts', {}))} accounts from {path}"
+    )
+    return registry
+
+
+def register_meters(path: str, meters: dict[str, dict]):
+    """
+    Add meters to a registry file, or replace them if already there, as
+    default meters that any account not listed may read
+    """
+    with open(path) as f:
+        data = json.load(f)
+    data["meters"].update(meters)
+    defaults = data.setdefault("defaultMeters", [])
+    defaults.extend(m for m in meters if m not in defaults)
+    # Write then rename so the file is never read part written
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+@lru_cache(maxsize=None)
+def get_registry() -> Registry:
+    """
+    Return the meter registry for this process, loading it on first use
+    """
+    return load_registry(conf.METER_REGISTRY_FILE, get_store())
@@ -0,0 +1,254 @@
+"""
+Columnar meter reading series.
+
+A series holds the readings for one meter and measure as columns - int64 epoch
+seconds for timestamps and float64 for values - sorted by interval start, so a
+from/to query is a binary search followed by a slice of each column.
+"""
+
+import datetime
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator
+
+import numpy as np
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """
+    Parse an ISO 8601 reading timestamp such as 2012-02-20T13:00:00Z
+    """
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def to_epoch(value: datetime.datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return int(value.timestamp())
+
+
+def from_epoch(value: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(int(value), datetime.timezone.utc)
+
+
+def format_timestamps(epochs: np.ndarray) -> list[str]:
+    """
+    Format epoch seconds as ISO 8601 UTC strings, e.g. 2012-02-20T13:00:00Z
+    """
+    formatted = np.datetime_as_string(epochs.astype("datetime64[s]"), unit="s")
+    return np.char.add(formatted, "Z").tolist()
+
+
+def date_range(
+    from_date: datetime.date, to_date: datetime.date
+) -> tuple[datetime.datetime, datetime.datetime]:
+    """
+    Convert the from/to dates of a request to the UTC datetimes that bound it.
+    Both dates are taken at midnight, matching the metering period recorded in
+    the provenance record, so `to` is exclusive.
+    """
+    return (
+        datetime.datetime.combine(from_date, datetime.time(), datetime.timezone.utc),
+        datetime.datetime.combine(to_date, datetime.time(), datetime.timezone.utc),
+    )
+
+
+class Series:
+    """
+    Readings for one meter and measure, as columns sorted by interval start.
+
+    Slicing a series returns views of its columns, so a series backed by
+    memory-mapped files is sliced without copying.
+    """
+
+    COLUMNS = ("start", "end", "taken_at", "energy", "cumulative")
+
+    def __init__(
+        self,
+        start: np.ndarray,
+        end: np.ndarray,
+        taken_at: np.ndarray,
+        energy: np.ndarray,
+        cumulative: np.ndarray,
+        type: str = "Electricity",
+        unit: str = "WHR",
+    ):
+        self.start = start
+        self.end = end
+        self.taken_at = taken_at
+        self.energy = energy
+        self.cumulative = cumulative
+        self.type = type
+        self.unit = unit
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @classmethod
+    def empty(cls, type: str = "Electricity", unit: str = "WHR") -> "Series":
+        epochs = np.empty(0, dtype=np.int64)
+        values = np.empty(0, dtype=np.float64)
+        return cls(epochs, epochs, epochs, values, values, type, unit)
+
+    @classmethod
+    def from_readings(cls, readings: list[dict]) -> "Series":
+        """
+        Build a series from readings in the shape served by the API
+        """
+        if not readings:
+            return cls.empty()
+
+        def epochs(field: str) -> np.ndarray:
+            return np.array(
+                [to_epoch(parse_timestamp(r[field])) for r in readings],
+                dtype=np.int64,
+            )
+
+        def values(field: str) -> np.ndarray:
+            return np.array([r[field]["value"] for r in readings], dtype=np.float64)
+
+        series = cls(
+            epochs("from"),
+            epochs("to"),
+            epochs("takenAt"),
+            values("energy"),
+            values("cumulative"),
+            readings[0]["type"],
+            readings[0]["energy"]["unitCode"],
+        )
+        return series.sorted()
+
+    @classmethod
+    def join(
+        cls, parts: list["Series"], type: str = "Electricity", unit: str = "WHR"
+    ) -> "Series":
+        """
+        Concatenate series that are already in order and do not overlap
+        """
+        if not parts:
+            return cls.empty(type, unit)
+        return cls(
+            *(
+                np.concatenate([getattr(part, column) for part in parts])
+                for column in cls.COLUMNS
+            ),
+            parts[0].type,
+            parts[0].unit,
+        )
+
+    def take(self, index) -> "Series":
+        """
+        Return the rows selected by a slice (a view) or an index array (a copy)
+        """
+        return Series(
+            *(getattr(self, column)[index] for column in self.COLUMNS),
+            self.type,
+            self.unit,
+        )
+
+    def sorted(self) -> "Series":
+        """
+        Return the series sorted by interval start with duplicate starts
+        removed, keeping the last row given for each start.
+        """
+        # Reverse so that np.unique, which keeps the first occurrence, keeps
+        # the last row supplied for each start
+        reverse = slice(None, None, -1)
+        _, index = np.unique(self.start[reverse], return_index=True)
+        return self.take(reverse).take(index)
+
+    def concat(self, other: "Series") -> "Series":
+        """
+        Merge another series into this one, rows in `other` replacing rows
+        with the same interval start.
+        """
+        return Series(
+            *(
+                np.concatenate([getattr(self, column), getattr(other, column)])
+                for column in self.COLUMNS
+            ),
+            self.type,
+            self.unit,
+        ).sorted()
+
+    def index_range(self, start: int, end: int) -> tuple[int, int]:
+        """
+        Return the row positions of readings whose interval falls within
+        [start, end), given as epoch seconds.
+        """
+        lo = int(np.searchsorted(self.start, start, side="left"))
+        hi = int(np.searchsorted(self.start, end, side="left"))
+        # The last reading may start before `end` but run past it
+        if hi > lo and self.end[hi - 1] > end:
+            hi -= 1
+        return lo, hi
+
+    def window(self, start: int, end: int) -> "Series":
+        """
+        Return the readings within [start, end), given as epoch seconds
+        """
+        return self.take(slice(*self.index_range(start, end)))
+
+    def between(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        limit: int | None = None,
+    ) -> "Series":
+        """
+        Return the first `limit` (default all) readings within [start, end)
+        """
+        lo, hi = self.index_range(to_epoch(start), to_epoch(end))
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return self.take(slice(lo, hi))
+
+    def to_readings(self) -> list[dict]:
+        """
+        Return the rows in the shape served by the API
+        """
+        return [reading for batch in self.iter_batches() for reading in batch]
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[list[dict]]:
+        """
+        Yield the rows in the shape served by the API, formatting at most
+        batch_size rows at a time.
+        """
+        for i in range(0, len(self), batch_size):
+            batch = self.take(slice(i, i + batch_size))
+            yield [
+                {
+                    "type": self.type,
+                    "from": start,
+                    "to": end,
+                    "takenAt": taken_at,
+                    "energy": {"value": energy, "unitCode": self.unit},
+                    "cumulative": {"value": cumulative, "unitCode": self.unit},
+                }
+                for start, end, taken_at, energy, cumulative in zip(
+                    format_timestamps(batch.start),
+                    format_timestamps(batch.end),
+                    format_timestamps(batch.taken_at),
+                    batch.energy.tolist(),
+                    batch.cumulative.tolist(),
+                )
+            ]
+
+
+# Return the readings of a series within [start, end), given as epoch seconds
+RawReader = Callable[[int, int], Series]
+
+
+class SeriesIndex(ABC):
+    """
+    Base class for indexes derived from a series and kept alongside it by the
+    reading store, see api/indexes.py
+    """
+
+    @abstractmethod
+    def __init__(self, series: Series): ...
+
+    @abstractmethod
+    def update(self, added: Series, raw: RawReader):
+        """
+        Bring the index up to date after readings are added to the series
+        """
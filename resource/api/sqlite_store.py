@@ -0,0 +1,497 @@
+"""
+SQLite backed meter reading store.
+
+Readings live on disk in a WITHOUT ROWID table clustered on
+(meter_id, measure, interval_start), so the table is itself a covering index
+for range queries: a from/to query is one index seek followed by a sequential
+read, and memory use is bounded by the size of the answer rather than the data
+set. The database runs in WAL mode so readers are not blocked by ingestion, and
+each thread keeps its own connection.
+
+No derived index is kept in memory. Totals, gaps, availability and resampling
+are SQL aggregates over the rows in range, so they see writes by any process,
+such as api.ingest loading a file, and never load a whole series.
+
+Each series has a random generation, set when it is first written, and a
+version counting the writes to it. Every reading records the version that
+last wrote it, so ETags, watermarks and the readings changed since a watermark
+are answered from the database, and stay valid across writes by any process.
+
+Load a JSON readings file with:
+
+    python -m api.sqlite_store data/sample_data.json data/readings.db METER_ID import
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from .aggregation import period_ends
+from .availability import INTERVAL, missing_ranges
+from .indexes import Indexes
+from .series import Series, to_epoch
+from .sync import decode_watermark, encode_watermark
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    meter_id TEXT NOT NULL,
+    measure TEXT NOT NULL,
+    type TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    generation TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (meter_id, measure)
+);
+CREATE TABLE IF NOT EXISTS readings (
+    meter_id TEXT NOT NULL,
+    measure TEXT NOT NULL,
+    interval_start INTEGER NOT NULL,
+    interval_end INTEGER NOT NULL,
+    taken_at INTEGER NOT NULL,
+    energy REAL NOT NULL,
+    cumulative REAL NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (meter_id, measure, interval_start)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS readings_version
+ON readings (meter_id, measure, version);
+"""
+COLUMNS = "interval_start, interval_end, taken_at, energy, cumulative"
+# Rows of a series within a range, as returned by between
+RANGE = (
+    "meter_id = ? AND measure = ? AND interval_start >= ? AND interval_start < ? "
+    "AND interval_end <= ?"
+)
+# Start of the period each reading starts in, by resolution
+PERIODS = {
+    "hour": "interval_start - interval_start % 3600",
+    "day": "interval_start - interval_start % 86400",
+    "month": "CAST(strftime('%s', interval_start, 'unixepoch', 'start of month') "
+    "AS INTEGER)",
+    "year": "CAST(strftime('%s', interval_start, 'unixepoch', 'start of year') "
+    "AS INTEGER)",
+}
+
+ROW_DTYPE = np.dtype(
+    [
+        ("start", np.int64),
+        ("end", np.int64),
+        ("taken_at", np.int64),
+        ("energy", np.float64),
+        ("cumulative", np.float64),
+    ]
+)
+
+
+class SqliteStore(Indexes):
+    """
+    Readings indexed by (meter id, measure, interval start) in a SQLite file
+    """
+
+    INDEXES = {}
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self.connection().executescript(SCHEMA)
+        # The version last published of each subscribed series
+        self._published: dict[tuple[str, str], tuple[str, int]] = {}
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Return this thread's connection, opening it on first use
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def add(self, meter_id: str, measure: str, series: Series):
+        """
+        Add readings to a series, replacing any existing reading with the same
+        interval start.
+        """
+        with self.connection() as connection:
+            (version,) = connection.execute(
+                "INSERT INTO series VALUES (?, ?, ?, ?, ?, 1) "
+                "ON CONFLICT (meter_id, measure) "
+                "DO UPDATE SET type = excluded.type, unit = excluded.unit, "
+                "version = version + 1 RETURNING version",
+                (meter_id, measure, series.type, series.unit, os.urandom(8).hex()),
+            ).fetchone()
+            connection.executemany(
+                "INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (meter_id, measure, *row, version)
+                    for row in zip(
+                        *(getattr(series, column).tolist() for column in Series.COLUMNS)
+                    )
+                ),
+            )
+        # Subscribers are sent the readings by poll, as they are for readings
+        # written by other processes
+
+    def _meta(self, meter_id: str, measure: str) -> tuple[str, str] | None:
+        return (
+            self.connection()
+            .execute(
+                "SELECT type, unit FROM series WHERE meter_id = ? AND measure = ?",
+                (meter_id, measure),
+            )
+            .fetchone()
+        )
+
+    def has_series(self, meter_id: str, measure: str) -> bool:
+        return self._meta(meter_id, measure) is not None
+
+    def measures(self, meter_id: str) -> list[str]:
+        rows = self.connection().execute(
+            "SELECT measure FROM series WHERE meter_id = ? ORDER BY rowid",
+            (meter_id,),
+        )
+        return [measure for (measure,) in rows]
+
+    def _select(
+        self,
+        meter_id: str,
+        measure: str,
+        start: int | None,
+        end: int | None,
+        limit: int | None = None,
+        after: int | None = None,
+        until: int | None = None,
+    ) -> Series:
+        meta = self._meta(meter_id, measure)
+        if meta is None:
+            return Series.empty()
+        query = f"SELECT {COLUMNS} FROM readings WHERE meter_id = ? AND measure = ?"
+        params: list = [meter_id, measure]
+        if start is not None and end is not None:
+            query += " AND interval_start >= ? AND interval_start < ?"
+            query += " AND interval_end <= ?"
+            params += [start, end, end]
+        if after is not None:
+            query += " AND version > ?"
+            params.append(after)
+        if until is not None:
+            query += " AND version <= ?"
+            params.append(until)
+        query += " ORDER BY interval_start"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = np.array(self.connection().execute(query, params).fetchall(), ROW_DTYPE)
+        return Series(*(rows[column] for column in Series.COLUMNS), *meta)
+
+    def series(self, meter_id: str, measure: str) -> Series:
+        return self._select(meter_id, measure, None, None)
+
+    def latest(self, meter_id: str, measure: str) -> Series:
+        """
+        Return the reading with the latest interval start, if there is one
+        """
+        meta = self._meta(meter_id, measure)
+        if meta is None:
+            return Series.empty()
+        rows = self.connection().execute(
+            f"SELECT {COLUMNS} FROM readings WHERE meter_id = ? AND measure = ? "
+            "ORDER BY interval_start DESC LIMIT 1",
+            (meter_id, measure),
+        )
+        rows = np.array(rows.fetchall(), ROW_DTYPE)
+        return Series(*(rows[column] for column in Series.COLUMNS), *meta)
+
+    def between(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        limit: int | None = None,
+    ) -> Series:
+        """
+        Return the first `limit` (default all) readings whose interval falls
+        within [start, end)
+        """
+        return self._select(meter_id, measure, to_epoch(start), to_epoch(end), limit)
+
+    def readings(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> list[dict]:
+        return self.between(meter_id, measure, start, end).to_readings()
+
+    def aggregate(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        resolution: str,
+    ) -> Series:
+        """
+        Return readings within [start, end) aggregated to a resolution, as
+        aggregation.resample would, grouped by period in SQL
+        """
+        meta = self._meta(meter_id, measure)
+        if resolution == "halfhour" or meta is None:
+            return self.between(meter_id, measure, start, end)
+        first, last = to_epoch(start), to_epoch(end)
+        # The bare columns come from the row with the latest interval start,
+        # and rows are read into ROW_DTYPE with the period start as start
+        rows = self.connection().execute(
+            f"SELECT {PERIODS[resolution]} AS period, MAX(interval_start), "
+            "taken_at, SUM(energy), cumulative "
+            f"FROM readings WHERE {RANGE} GROUP BY period ORDER BY period",
+            (meter_id, measure, first, last, last),
+        )
+        rows = np.array(rows.fetchall(), ROW_DTYPE)
+        starts = np.asarray(rows["start"])
+        return Series(
+            np.maximum(starts, first),
+            np.minimum(period_ends(starts, resolution), last),
+            rows["taken_at"],
+            rows["energy"],
+            rows["cumulative"],
+            *meta,
+        )
+
+    def total(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> dict:
+        """
+        Return the energy used within [start, end), as PrefixSums.total does,
+        with the gaps between readings found by a window over the range
+        """
+        first, last = to_epoch(start), to_epoch(end)
+        params = (meter_id, measure, first, last, last)
+        energy, intervals, lowest, highest = (
+            self.connection()
+            .execute(
+                "SELECT TOTAL(energy), COUNT(*), MIN(interval_start), "
+                f"MAX(interval_end) FROM readings WHERE {RANGE}",
+                params,
+            )
+            .fetchone()
+        )
+        gaps = []
+        if not intervals:
+            gaps.append((first, last))
+        else:
+            if lowest > first:
+                gaps.append((first, lowest))
+            gaps.extend(
+                self.connection().execute(
+                    "SELECT previous, interval_start FROM ("
+                    "SELECT interval_start, LAG(interval_end) OVER "
+                    "(ORDER BY interval_start) AS previous "
+                    f"FROM readings WHERE {RANGE}"
+                    ") WHERE interval_start != previous",
+                    params,
+                )
+            )
+            if highest < last:
+                gaps.append((highest, last))
+        meta = self._meta(meter_id, measure)
+        return {
+            "energy": energy,
+            "unit": meta[1] if meta else Series.empty().unit,
+            "intervals": intervals,
+            "expectedIntervals": (last - first) // INTERVAL,
+            "gaps": gaps,
+        }
+
+    def _coverage(
+        self, meter_id: str, measure: str, start: int, end: int
+    ) -> list[tuple[int, int]]:
+        # First and last half-hour of each run of half-hours with a reading
+        rows = self.connection().execute(
+            "SELECT slot, previous, next FROM ("
+            "SELECT slot, LAG(slot) OVER w AS previous, LEAD(slot) OVER w AS next "
+            "FROM (SELECT DISTINCT interval_start / ? AS slot FROM readings "
+            "WHERE meter_id = ? AND measure = ? "
+            "AND interval_start >= ? AND interval_start < ?) "
+            "WINDOW w AS (ORDER BY slot)"
+            ") WHERE previous IS NULL OR slot > previous + 1 "
+            "OR next IS NULL OR next > slot + 1",
+            (INTERVAL, meter_id, measure, start, end),
+        )
+        covered = []
+        for slot, previous, next in rows:
+            if previous is None or slot > previous + 1:
+                covered.append([slot * INTERVAL, None])
+            if next is None or next > slot + 1:
+                covered[-1][1] = (slot + 1) * INTERVAL
+        return [(a, b) for a, b in covered]
+
+    def _count(self, meter_id: str, measure: str, start: int, end: int) -> int:
+        (count,) = (
+            self.connection()
+            .execute(
+                "SELECT COUNT(DISTINCT interval_start / ?) FROM readings "
+                "WHERE meter_id = ? AND measure = ? "
+                "AND interval_start >= ? AND interval_start < ?",
+                (INTERVAL, meter_id, measure, start, end),
+            )
+            .fetchone()
+        )
+        return count
+
+    def availability(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> dict:
+        """
+        Return the covered and missing ranges within [start, end), which must
+        be on half-hours
+        """
+        first, last = to_epoch(start), to_epoch(end)
+        covered = self._coverage(meter_id, measure, first, last)
+        return {
+            "intervals": self._count(meter_id, measure, first, last),
+            "expectedIntervals": max(last - first, 0) // INTERVAL,
+            "covered": covered,
+            "missing": missing_ranges(covered, first, last) if last > first else [],
+        }
+
+    def complete(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> bool:
+        """
+        Return True if every half-hour within [start, end) has a reading
+        """
+        first, last = to_epoch(start), to_epoch(end)
+        expected = max(last - first, 0) // INTERVAL
+        return self._count(meter_id, measure, first, last) == expected
+
+    def _version(self, meter_id: str, measure: str) -> tuple[str, int]:
+        return (
+            self.connection()
+            .execute(
+                "SELECT generation, version FROM series "
+                "WHERE meter_id = ? AND measure = ?",
+                (meter_id, measure),
+            )
+            .fetchone()
+        ) or ("", 0)
+
+    def watch(self, meter_id: str, measure: str):
+        self._published[(meter_id, measure)] = self._version(meter_id, measure)
+
+    def poll(self):
+        """
+        Publish the readings of subscribed series written since they were last
+        published, by this or any other process, when PRAGMA data_version says
+        another connection has written to the database
+        """
+        (data_version,) = self.connection().execute("PRAGMA data_version").fetchone()
+        # Kept per connection, as each has its own data_version
+        if data_version == getattr(self._local, "data_version", None):
+            return
+        self._local.data_version = data_version
+        for key in self.broadcaster.keys():
+            generation, version = self._version(*key)
+            published, after = self._published.get(key, ("", 0))
+            if generation != published:
+                after = 0
+            if version == after:
+                continue
+            series = self._select(*key, None, None, after=after, until=version)
+            self._published[key] = (generation, version)
+            if len(series):
+                self.broadcaster.publish(
+                    *key, series, encode_watermark(generation, version)
+                )
+
+    def watermark(self, meter_id: str, measure: str) -> str:
+        """
+        Return the watermark of the series as it is now, see api/sync.py
+        """
+        return encode_watermark(*self._version(meter_id, measure))
+
+    def etag(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> str:
+        """
+        Return an ETag that changes when readings within [start, end) change,
+        from the latest version to write a reading in the range
+        """
+        generation, _ = self._version(meter_id, measure)
+        (version,) = (
+            self.connection()
+            .execute(
+                "SELECT MAX(version) FROM readings WHERE meter_id = ? AND measure = ? "
+                "AND interval_start >= ? AND interval_start < ?",
+                (meter_id, measure, to_epoch(start), to_epoch(end)),
+            )
+            .fetchone()
+        )
+        return f'W/"{generation}-{version or 0}"'
+
+    def changes(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        watermark: str,
+    ) -> Series:
+        """
+        Return the readings within [start, end) written after a watermark, or
+        all of them if the watermark is from another generation.
+
+        Raises:
+            ValueError: If the watermark is invalid
+        """
+        generation, version = decode_watermark(watermark)
+        current, latest = self._version(meter_id, measure)
+        if generation != current or not 0 <= version <= latest:
+            return self.between(meter_id, measure, start, end)
+        return self._select(
+            meter_id, measure, to_epoch(start), to_epoch(end), after=version
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load a JSON readings file into a SQLite readings database"
+    )
+    parser.add_argument("source", help="JSON list of readings")
+    parser.add_argument("database", help="SQLite readings database")
+    parser.add_argument("meter_id")
+    parser.add_argument("measures", nargs="+")
+    args = parser.parse_args()
+
+    with open(args.source) as f:
+        series = Series.from_readings(json.load(f))
+    store = SqliteStore(args.database)
+    for measure in args.measures:
+        store.add(args.meter_id, measure, series)
+    print(f"Wrote {len(series)} readings for {args.meter_id} to {args.database}")
@@ -0,0 +1,68 @@
+"""
+Load-profile statistics over a range of half-hourly readings.
+
+Every statistic is a NumPy reduction over the energy column: the peak is an
+argmax, baseload and percentiles come from one np.percentile call, and the
+time-of-day profile is a pair of np.bincount calls keyed on each reading's
+half-hour of the day.
+"""
+
+import numpy as np
+
+from .series import Series
+
+INTERVAL = 1800
+INTERVALS_PER_DAY = 86400 // INTERVAL
+
+# Baseload is the energy the meter rarely drops below, a low percentile rather
+# than the minimum so a single missing or zero reading does not set it
+BASELOAD_PERCENTILE = 10.0
+PERCENTILES = (5.0, 25.0, 50.0, 75.0, 95.0)
+
+
+def time_of_day(starts: np.ndarray) -> np.ndarray:
+    """
+    Return the half-hour of the day (0-47, UTC) each interval starts in
+    """
+    return (starts % 86400) // INTERVAL
+
+
+def load_profile(series: Series, percentiles: tuple[float, ...] = PERCENTILES) -> dict:
+    """
+    Summarise the readings of a series, or return None for each statistic of
+    an empty series
+    """
+    if len(series) == 0:
+        return {
+            "intervals": 0,
+            "peak": None,
+            "baseload": None,
+            "mean": None,
+            "percentiles": [],
+            "profile": [],
+        }
+    energy = np.asarray(series.energy)
+    peak = int(np.argmax(energy))
+    values = np.percentile(energy, [BASELOAD_PERCENTILE, *percentiles])
+    slots = time_of_day(np.asarray(series.start))
+    counts = np.bincount(slots, minlength=INTERVALS_PER_DAY)
+    sums = np.bincount(slots, weights=energy, minlength=INTERVALS_PER_DAY)
+    present = np.flatnonzero(counts)
+    return {
+        "intervals": len(series),
+        "peak": {
+            "from": int(series.start[peak]),
+            "to": int(series.end[peak]),
+            "energy": float(energy[peak]),
+        },
+        "baseload": float(values[0]),
+        "mean": float(energy.mean()),
+        "percentiles": list(zip(percentiles, values[1:].tolist())),
+        "profile": list(
+            zip(
+                (present * INTERVAL).tolist(),
+                (sums[present] / counts[present]).tolist(),
+                counts[present].tolist(),
+            )
+        ),
+    }
@@ -0,0 +1,294 @@
+"""
+Meter reading store.
+
+Readings are loaded once per process and indexed by (meter id, measure), each
+series sorted by interval start so that a from/to query is a binary search and
+a slice rather than a parse of the full data file.
+"""
+
+import datetime
+import json
+from functools import lru_cache
+
+from pydantic import TypeAdapter
+
+from . import columnar
+from . import conf
+from . import models
+from .aggregation import resample
+from .availability import Availability
+from .chunks import ChunkedSeries
+from .logger import get_logger
+from .indexes import Indexes
+from .rollups import Pyramid
+from .series import Series, SeriesIndex, from_epoch, to_epoch
+from .sqlite_store import SqliteStore
+from .sync import Versions
+from .tiers import HotIndex, Tiers, TieredSeries
+from .totals import PrefixSums, combine
+
+logger = get_logger()
+
+# Readings are checked against the response model once, as they are loaded
+READINGS = TypeAdapter(list[models.Reading])
+
+
+class ReadingStore(Indexes):
+    """
+    Readings indexed by (meter id, measure, interval start).
+
+    With a chunk_size, each series is held compressed in chunks of that many
+    readings, see api/chunks.py. With tiers, only recent readings are held in
+    memory and older months on disk, see api/tiers.py.
+    """
+
+    def __init__(self, chunk_size: int = 0, tiers: Tiers | None = None):
+        super().__init__()
+        self.chunk_size = chunk_size
+        self.tiers = tiers
+        self._series: dict[tuple[str, str], Series | ChunkedSeries | TieredSeries] = {}
+        # The columnar directory the store was loaded from, polled for
+        # readings written by other processes, see watch_files
+        self.directory: str | None = None
+        self._files: dict[tuple[str, str], tuple] = {}
+
+    def add(self, meter_id: str, measure: str, series: Series):
+        """
+        Add readings to a series, replacing any existing reading with the same
+        interval start.
+        """
+        key = (meter_id, measure)
+        if key in self._series:
+            self._series[key] = self._series[key].concat(series)
+            self.update_indexes(meter_id, measure, series)
+            return
+        stored: Series | ChunkedSeries | TieredSeries = series
+        if self.tiers:
+            stored = self.tiers.split(meter_id, measure, series)
+        elif self.chunk_size:
+            stored = ChunkedSeries.from_series(series, self.chunk_size)
+        self._series[key] = stored
+        # Indexes are built as series are loaded and kept in step after that
+        self.build_indexes(meter_id, measure)
+
+    def watch_files(self, meter_id: str, measure: str, series: Series):
+        """
+        Note the signature, length and last reading of a series as read from
+        its columnar files, to find the readings written after them
+        """
+        path = columnar.series_path(self.directory, meter_id, measure)
+        last = int(series.start[-1]) if len(series) else None
+        self._files[(meter_id, measure)] = (columnar.signature(path), len(series), last)
+
+    def poll(self):
+        """
+        Add the readings of subscribed series whose columnar files have been
+        written since they were loaded or last polled
+        """
+        if self.directory is None:
+            return
+        for key in self.broadcaster.keys():
+            path = columnar.series_path(self.directory, *key)
+            signature, length, last = self._files.get(key, (None, 0, None))
+            if columnar.signature(path) in (None, signature):
+                continue
+            series = columnar.read_series(path)
+            if len({len(getattr(series, column)) for column in Series.COLUMNS}) > 1:
+                # Caught between column writes, so try again next poll
+                continue
+            self.watch_files(*key, series)
+            if length and len(series) >= length and series.start[length - 1] == last:
+                # Appended to, as by api.ingest, so add only the new readings
+                series = series.take(slice(length, None))
+            if len(series):
+                self.add(*key, series)
+
+    def build_indexes(self, meter_id: str, measure: str):
+        stored = self._series[(meter_id, measure)]
+        if not isinstance(stored, TieredSeries):
+            super().build_indexes(meter_id, measure)
+            return
+        # The rollups and totals cover the hot readings, the cold months
+        # keeping their own, and the rest are built a month at a time
+        raw = self.raw_reader(meter_id, measure)
+        availability = Availability(Series.empty(stored.type, stored.unit))
+
+        def parts():
+            for part in stored.parts():
+                availability.update(part, raw)
+                yield part
+
+        versions = Versions.from_parts(parts())
+
+        def tiered() -> TieredSeries:
+            current = self._series[(meter_id, measure)]
+            assert isinstance(current, TieredSeries)
+            return current
+
+        with self._lock:
+            self._indexes[("rollups", meter_id, measure)] = HotIndex(Pyramid, tiered)
+            self._indexes[("totals", meter_id, measure)] = HotIndex(PrefixSums, tiered)
+            self._indexes[("availability", meter_id, measure)] = availability
+            self._indexes[("versions", meter_id, measure)] = versions
+
+    def _hot(self, name: str, meter_id: str, measure: str) -> SeriesIndex:
+        index = self.index(name, meter_id, measure)
+        assert isinstance(index, HotIndex)
+        return index.index
+
+    def aggregate(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        resolution: str,
+    ) -> Series:
+        stored = self._series.get((meter_id, measure))
+        if not isinstance(stored, TieredSeries) or resolution == "halfhour":
+            return super().aggregate(meter_id, measure, start, end, resolution)
+        # The cutoff is at a month start, so only years span both tiers, and
+        # are made from the months of each
+        level = "month" if resolution == "year" else resolution
+        first, last = to_epoch(start), to_epoch(end)
+        cutoff = stored.cutoff if stored.cutoff is not None else first
+        parts = []
+        with self._lock:
+            if first < cutoff:
+                parts.append(stored.rollup(level, first, min(last, cutoff)))
+            if last > cutoff:
+                pyramid = self._hot("rollups", meter_id, measure)
+                assert isinstance(pyramid, Pyramid)
+                parts.append(
+                    pyramid.resample(
+                        level,
+                        from_epoch(max(first, cutoff)),
+                        end,
+                        self.raw_reader(meter_id, measure),
+                    )
+                )
+        data = Series.join(
+            [part for part in parts if len(part)], stored.type, stored.unit
+        )
+        return resample(data, resolution, start, end)
+
+    def total(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> dict:
+        stored = self._series.get((meter_id, measure))
+        if not isinstance(stored, TieredSeries):
+            return super().total(meter_id, measure, start, end)
+        first, last = to_epoch(start), to_epoch(end)
+        cutoff = stored.cutoff if stored.cutoff is not None else first
+        with self._lock:
+            sums = self._hot("totals", meter_id, measure)
+            assert isinstance(sums, PrefixSums)
+            if last <= first or first >= cutoff:
+                return sums.total(first, last)
+            totals = [stored.total(first, min(last, cutoff))]
+            if last > cutoff:
+                totals.append(sums.total(cutoff, last))
+        return combine(totals)
+
+    def has_series(self, meter_id: str, measure: str) -> bool:
+        return (meter_id, measure) in self._series
+
+    def measures(self, meter_id: str) -> list[str]:
+        return [measure for meter, measure in self._series if meter == meter_id]
+
+    def series(self, meter_id: str, measure: str) -> Series:
+        stored = self._series.get((meter_id, measure))
+        if stored is None:
+            return Series.empty()
+        if isinstance(stored, (ChunkedSeries, TieredSeries)):
+            return stored.to_series()
+        return stored
+
+    def between(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        limit: int | None = None,
+    ) -> Series:
+        """
+        Return the first `limit` (default all) readings whose interval falls
+        within [start, end)
+        """
+        stored = self._series.get((meter_id, measure))
+        if stored is None:
+            return Series.empty()
+        return stored.between(start, end, limit)
+
+    def readings(
+        self,
+        meter_id: str,
+        measure: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> list[dict]:
+        return self.between(meter_id, measure, start, end).to_readings()
+
+
+def load_json(
+    path: str,
+    meter_id: str,
+    measures: list[str],
+    chunk_size: int = 0,
+    tiers: Tiers | None = None,
+) -> ReadingStore:
+    """
+    Load a JSON list of readings, as served by the API, for a single meter.
+    The same file backs each of the given measures.
+    """
+    with open(path) as f:
+        readings = json.load(f)
+    READINGS.validate_python(readings)
+    series = Series.from_readings(readings)
+    store = ReadingStore(chunk_size, tiers)
+    for measure in measures:
+        store.add(meter_id, measure, series)
+    logger.info(f"Loaded {len(series)} readings for {meter_id} from {path}")
+    return store
+
+
+def load_columnar(directory: str, tiers: Tiers | None = None) -> ReadingStore:
+    """
+    Load every series in a columnar readings directory. The columns are memory
+    mapped, so worker processes share the same pages.
+    """
+    store = ReadingStore(tiers=tiers)
+    store.directory = directory
+    for (meter_id, measure), series in columnar.read_all(directory):
+        store.watch_files(meter_id, measure, series)
+        store.add(meter_id, measure, series)
+    logger.info(f"Loaded columnar readings from {directory}")
+    return store
+
+
+@lru_cache(maxsize=None)
+def get_store() -> ReadingStore | SqliteStore:
+    """
+    Return the reading store for this process, loading it on first use
+    """
+    if conf.READINGS_BACKEND == "sqlite":
+        return SqliteStore(conf.READINGS_DATABASE)
+    tiers = None
+    if conf.READINGS_TIER_DIR:
+        tiers = Tiers(
+            conf.READINGS_TIER_DIR, conf.READINGS_HOT_DAYS, conf.READINGS_PROMOTED_BYTES
+        )
+    if conf.READINGS_BACKEND == "columnar":
+        return load_columnar(conf.READINGS_DIR, tiers)
+    return load_json(
+        conf.READINGS_FILE,
+        conf.DEMO_METER_ID,
+        conf.DEMO_MEASURES,
+        conf.READINGS_CHUNK_SIZE,
+        tiers,
+    )
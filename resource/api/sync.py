@@ -0,0 +1,163 @@
+"""
+Data versions of each reading series, for incremental sync.
+
+Each series has a generation, a digest of its readings as loaded, and a version
+counting the batches of readings added or corrected since. A watermark records
+both, so a client holding one can ask for just the readings changed after it.
+Readings added at each version are kept by interval start, so the latest
+version to change a range, which is its ETag, and the readings changed in a
+range since a watermark are found without reading the series.
+
+Versions start again from 0 whenever the series is loaded, and a watermark from
+another generation asks for the whole range. Two processes loading the same
+readings agree on the generation, so watermarks can be used with any of them
+until readings are added. The SQLite store keeps the generation and versions
+in the database instead, see api/sqlite_store.py, so they survive every write.
+"""
+
+import base64
+import hashlib
+import json
+from typing import Iterable
+
+import numpy as np
+
+from .series import RawReader, Series, SeriesIndex
+
+
+def encode_watermark(generation: str, version: int) -> str:
+    payload = json.dumps(
+        {"generation": generation, "version": version}, separators=(",", ":")
+    ).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_watermark(watermark: str) -> tuple[str, int]:
+    """
+    Return the generation and version encoded in a watermark.
+
+    Raises:
+        ValueError: If the watermark was not issued by encode_watermark
+    """
+    try:
+        payload = base64.urlsafe_b64decode(watermark + "=" * (-len(watermark) % 4))
+        decoded = json.loads(payload)
+        generation, version = decoded["generation"], decoded["version"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid watermark")
+    if not isinstance(generation, str) or not isinstance(version, int):
+        raise ValueError("Invalid watermark")
+    return generation, version
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Return True if an If-None-Match header lists the ETag, compared weakly
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def generation(parts: Iterable[Series]) -> str:
+    """
+    Return a digest of the readings of a series, given in order in one or more
+    parts, which is the same however the series is split
+    """
+    digests = {column: hashlib.blake2b(digest_size=8) for column in Series.COLUMNS}
+    for part in parts:
+        for column, digest in digests.items():
+            digest.update(np.ascontiguousarray(getattr(part, column)).tobytes())
+    combined = b"".join(digest.digest() for digest in digests.values())
+    return hashlib.blake2b(combined, digest_size=8).hexdigest()
+
+
+def representation_etag(etag: str, media_type: str, encoding: str | None) -> str:
+    """
+    Return the ETag of a range sent in one format and content encoding, so
+    each representation of the range has its own
+    """
+    suffix = media_type.split("/")[-1]
+    if encoding:
+        suffix += f"+{encoding}"
+    return f'{etag[:-1]}-{suffix}"'
+
+
+def _touches(starts: np.ndarray, start: int, end: int) -> bool:
+    """
+    Return True if any of the sorted interval starts fall in [start, end)
+    """
+    i = np.searchsorted(starts, start)
+    return bool(i < len(starts) and starts[i] < end)
+
+
+class Versions(SeriesIndex):
+    """
+    Generation and version of one series, with the interval starts of the
+    readings added at each version
+    """
+
+    def __init__(self, series: Series):
+        self.generation = generation([series])
+        self.version = 0
+        # Version i + 1 added the readings starting at added[i]
+        self.added: list[np.ndarray] = []
+        self.lowest: list[int] = []
+        self.highest: list[int] = []
+
+    @classmethod
+    def from_parts(cls, parts: Iterable[Series]) -> "Versions":
+        """
+        Return the versions of a series read in parts, in order
+        """
+        versions = cls(Series.empty())
+        versions.generation = generation(parts)
+        return versions
+
+    def update(self, added: Series, raw: RawReader):
+        if len(added) == 0:
+            return
+        starts = np.unique(added.start)
+        self.version += 1
+        self.added.append(starts)
+        self.lowest.append(int(starts[0]))
+        self.highest.append(int(starts[-1]))
+
+    def watermark(self) -> str:
+        return encode_watermark(self.generation, self.version)
+
+    def _versions(self, start: int, end: int, after: int = 0) -> list[int]:
+        """
+        Return the indexes into added of the versions after `after` that
+        changed a reading starting in [start, end)
+        """
+        lowest = np.array(self.lowest[after:], dtype=np.int64)
+        highest = np.array(self.highest[after:], dtype=np.int64)
+        candidates = np.flatnonzero((lowest < end) & (highest >= start)) + after
+        return [i for i in candidates.tolist() if _touches(self.added[i], start, end)]
+
+    def etag(self, start: int, end: int) -> str:
+        """
+        Return a weak ETag for the readings starting in [start, end), which
+        changes only when readings in the range are added or corrected
+        """
+        changed = self._versions(start, end)
+        version = changed[-1] + 1 if changed else 0
+        return f'W/"{self.generation}-{version}"'
+
+    def changed(self, watermark: str, start: int, end: int) -> np.ndarray | None:
+        """
+        Return the interval starts in [start, end) of readings added or
+        corrected after a watermark, or None if the watermark is from another
+        generation and the whole range must be read again.
+
+        Raises:
+            ValueError: If the watermark is invalid
+        """
+        generation, version = decode_watermark(watermark)
+        if generation != self.generation or not 0 <= version <= self.version:
+            return None
+        changed = [self.added[i] for i in self._versions(start, end, version)]
+        starts = np.unique(np.concatenate([np.zeros(0, np.int64), *changed]))
+        return starts[(starts >= start) & (starts < end)]
@@ -0,0 +1,388 @@
+"""
+Tiered reading storage: recent readings in memory, older history on disk.
+
+Each series is split at a cutoff, the start of the month READINGS_HOT_DAYS
+before its latest reading. Readings from the cutoff on are the hot tier, held
+in memory as a Series. Readings before it are the cold tier, a file per
+calendar month compressed as in api/chunks.py, with only each month's bounds
+and file name in memory. A from/to query reads the cold months it overlaps and
+stitches them to the hot readings, so the readings held in memory stay flat as
+history grows while queries over recent readings never touch the disk. As new
+readings move the cutoff on, the months that fall behind it are written out to
+the cold tier.
+
+The indexes of a tiered series are tiered too. Its rollups and prefix sums,
+see api/rollups.py and api/totals.py, cover only the hot readings, wrapped in
+a HotIndex that rebuilds them when the cutoff moves. Each cold month keeps its
+readings aggregated to a single row and its total with any gaps, so monthly
+and yearly aggregates and totals over the history read whole months from
+memory and decode only the months at the edges of the range, while hourly and
+daily aggregates decode the months they span. The availability bitmap, one
+bit per half-hour, and the versions are kept for the whole series, built a
+month at a time so the history is never decoded at once.
+
+Cold month files are named by a digest of their contents in the one directory,
+READINGS_TIER_DIR, shared by every process. A process loading the same
+readings as another finds their months already written rather than writing
+them again, and after a restart reuses the files of the last run. The file of
+a month replaced by corrections is left in place, as another process may still
+be reading it; clear the directory while no server is running to reclaim them.
+
+A cold month read PROMOTE_AFTER times is promoted to an LRU of decoded months
+shared by every series, bounded by READINGS_PROMOTED_BYTES. The Tiers of a
+store count the queries answered from memory alone and the cold months read
+from the LRU or from disk, reported by the /status endpoint.
+"""
+
+import collections
+import datetime
+import hashlib
+import os
+import threading
+from typing import Callable, Iterator, NamedTuple
+
+import numpy as np
+
+from .aggregation import group_bounds, period_ends, period_starts, resample
+from .chunks import Chunk
+from .rollups import whole_periods
+from .series import RawReader, Series, SeriesIndex, from_epoch, to_epoch
+from .totals import PrefixSums, combine
+
+# Reads of a cold month before it is kept decoded in memory
+PROMOTE_AFTER = 2
+
+
+def _nbytes(series: Series) -> int:
+    return sum(getattr(series, column).nbytes for column in Series.COLUMNS)
+
+
+def _month_end(start: int) -> int:
+    return int(period_ends(np.array([start], dtype=np.int64), "month")[0])
+
+
+class Month(NamedTuple):
+    """
+    A cold month: its file, reading count, readings aggregated to one row and
+    total over the month, see PrefixSums.total
+    """
+
+    path: str
+    count: int
+    row: Series
+    total: dict
+
+
+class Tiers:
+    """
+    Settings and promoted months shared by the tiered series of a store, and
+    counts of the reads served by each tier
+    """
+
+    def __init__(self, directory: str, hot_days: int, promoted_bytes: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.hot_seconds = hot_days * 86400
+        self.promoted_bytes = promoted_bytes
+        self.size = 0
+        self.queries = 0
+        self.hot_only = 0
+        self.promoted_hits = 0
+        self.disk_reads = 0
+        self._promoted: collections.OrderedDict[str, Series] = collections.OrderedDict()
+        self._reads: collections.Counter[str] = collections.Counter()
+        self._lock = threading.Lock()
+
+    def split(self, meter_id: str, measure: str, series: Series) -> "TieredSeries":
+        """
+        Return a series held in tiers, writing its cold months to disk
+        """
+        directory = os.path.join(self.directory, meter_id, measure)
+        os.makedirs(directory, exist_ok=True)
+        empty = TieredSeries(self, directory, Series.empty(series.type, series.unit))
+        return empty.concat(series)
+
+    def read(self, path: str, type: str, unit: str) -> Series:
+        """
+        Return the readings of a cold month, promoting it if read often
+        """
+        with self._lock:
+            series = self._promoted.get(path)
+            if series is not None:
+                self._promoted.move_to_end(path)
+                self.promoted_hits += 1
+                return series
+            self.disk_reads += 1
+            self._reads[path] += 1
+            promote = self._reads[path] >= PROMOTE_AFTER
+        series = load_month(path, type, unit)
+        if promote and _nbytes(series) <= self.promoted_bytes:
+            with self._lock:
+                if path not in self._promoted:
+                    self._promoted[path] = series
+                    self.size += _nbytes(series)
+                while self.size > self.promoted_bytes:
+                    _, dropped = self._promoted.popitem(last=False)
+                    self.size -= _nbytes(dropped)
+        return series
+
+    def query(self, cold: bool):
+        with self._lock:
+            self.queries += 1
+            self.hot_only += not cold
+
+    def forget(self, path: str):
+        """
+        Drop a cold month that has been replaced from memory, leaving its file
+        for any other process still reading it
+        """
+        with self._lock:
+            series = self._promoted.pop(path, None)
+            if series is not None:
+                self.size -= _nbytes(series)
+            self._reads.pop(path, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            cold_reads = self.promoted_hits + self.disk_reads
+            return {
+                "queries": self.queries,
+                "hotOnly": self.hot_only,
+                "hotHitRate": self.hot_only / self.queries if self.queries else None,
+                "coldReads": cold_reads,
+                "promotedHits": self.promoted_hits,
+                "promotedHitRate": (
+                    self.promoted_hits / cold_reads if cold_reads else None
+                ),
+                "promotedMonths": len(self._promoted),
+                "promotedBytes": self.size,
+            }
+
+
+def load_month(path: str, type: str, unit: str) -> Series:
+    with open(path, "rb") as f:
+        return Chunk.from_bytes(f.read()).decode(type, unit)
+
+
+class TieredSeries:
+    """
+    A series with its recent readings in memory and its history in a file
+    per month, answering the same range queries as Series
+    """
+
+    def __init__(
+        self,
+        tiers: Tiers,
+        directory: str,
+        hot: Series,
+        months: dict[int, Month] | None = None,
+    ):
+        self.tiers = tiers
+        self.directory = directory
+        self.hot = hot
+        self.type = hot.type
+        self.unit = hot.unit
+        # Start of each cold month, in order
+        self.months = months or {}
+        self.starts = np.array(list(self.months), dtype=np.int64)
+        self.ends = period_ends(self.starts, "month")
+        self.cutoff = int(self.ends[-1]) if len(self.ends) else None
+
+    def __len__(self) -> int:
+        return len(self.hot) + sum(month.count for month in self.months.values())
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes of readings held in memory
+        """
+        return _nbytes(self.hot)
+
+    def _cold(self, lo: int, hi: int) -> Series:
+        paths = [month.path for month in list(self.months.values())[lo:hi]]
+        return Series.join(
+            [self.tiers.read(path, self.type, self.unit) for path in paths],
+            self.type,
+            self.unit,
+        )
+
+    def parts(self) -> Iterator[Series]:
+        """
+        Yield the readings a cold month at a time, then the hot readings
+        """
+        for month in self.months.values():
+            yield load_month(month.path, self.type, self.unit)
+        yield self.hot
+
+    def to_series(self) -> Series:
+        return Series.join(list(self.parts()), self.type, self.unit)
+
+    def between(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        limit: int | None = None,
+    ) -> Series:
+        """
+        Read the cold months overlapping [start, end) and stitch them to the
+        hot readings in range
+        """
+        lo = int(np.searchsorted(self.ends, to_epoch(start), side="right"))
+        hi = int(np.searchsorted(self.starts, to_epoch(end), side="left"))
+        if limit is not None and hi > lo:
+            # Months after the first are wholly in range, so read only as
+            # many as hold the limit
+            counts = [month.count for month in self.months.values()][lo + 1 : hi]
+            hi = min(hi, lo + 2 + int(np.searchsorted(np.cumsum(counts), limit)))
+        self.tiers.query(cold=hi > lo)
+        cold = self._cold(lo, hi).between(start, end, limit)
+        if limit is not None:
+            if len(cold) >= limit:
+                return cold
+            limit -= len(cold)
+        hot = self.hot.between(start, end, limit)
+        return Series.join([cold, hot], self.type, self.unit) if len(cold) else hot
+
+    def _window(self, start: int, end: int) -> Series:
+        return self.between(from_epoch(start), from_epoch(end))
+
+    def rollup(self, resolution: str, start: int, end: int) -> Series:
+        """
+        Return the cold readings within [start, end) aggregated to an hour,
+        day or month resolution. Whole months are taken from their rows, so
+        only the months at the edges of the range are read.
+        """
+        if resolution != "month":
+            return resample(self._window(start, end), resolution)
+        first, last = whole_periods(start, end, "month")
+        if first >= last:
+            return resample(self._window(start, end), "month")
+        parts = [
+            resample(self._window(start, first), "month"),
+            *(month.row for key, month in self.months.items() if first <= key < last),
+            resample(self._window(last, end), "month"),
+        ]
+        return Series.join([part for part in parts if len(part)], self.type, self.unit)
+
+    def total(self, start: int, end: int) -> dict:
+        """
+        Return the total of the cold readings within [start, end), as
+        PrefixSums.total would, from the totals of whole months and the
+        readings of the months at the edges of the range
+        """
+        first, last = whole_periods(start, end, "month")
+        if first >= last:
+            first = last = end
+        totals = []
+        if start < first:
+            totals.append(PrefixSums(self._window(start, first)).total(start, first))
+        month = first
+        while month < last:
+            month_end = _month_end(month)
+            if month in self.months:
+                totals.append(self.months[month].total)
+            else:
+                empty = Series.empty(self.type, self.unit)
+                totals.append(PrefixSums(empty).total(month, month_end))
+            month = month_end
+        if last < end:
+            totals.append(PrefixSums(self._window(last, end)).total(last, end))
+        return combine(totals)
+
+    def _write(self, series: Series) -> dict[int, Month]:
+        # One file per calendar month, named by its contents so a corrected
+        # month is written beside the file it replaces, and a month already
+        # written by another process is not written again
+        keys = period_starts(series.start, "month")
+        months = {}
+        for first, last in zip(*group_bounds(keys)):
+            month = series.take(slice(first, last + 1))
+            content = Chunk(month).to_bytes()
+            name = np.datetime_as_string(keys[first].astype("datetime64[s]"), "M")
+            digest = hashlib.blake2b(content, digest_size=8).hexdigest()
+            path = os.path.join(self.directory, f"{name}.{digest}.chunk")
+            if not os.path.exists(path):
+                # Write then rename so readers never see a partial file
+                part = f"{path}.{os.urandom(4).hex()}.part"
+                with open(part, "wb") as f:
+                    f.write(content)
+                os.replace(part, path)
+            start = int(keys[first])
+            months[start] = Month(
+                path,
+                len(month),
+                resample(month, "month"),
+                PrefixSums(month).total(start, _month_end(start)),
+            )
+        return months
+
+    def concat(self, other: Series) -> "TieredSeries":
+        """
+        Merge readings into the series. Readings before the cutoff rewrite the
+        cold months they fall in, and months that the latest reading moves
+        behind the hot window are written out to the cold tier.
+        """
+        if len(other) == 0:
+            return self
+        other = other.sorted()
+        split = 0
+        if self.cutoff is not None:
+            split = int(np.searchsorted(other.start, self.cutoff, side="left"))
+        hot = self.hot.concat(other.take(slice(split, None)))
+        months = dict(self.months)
+        replaced = []
+        if split:
+            corrections = other.take(slice(0, split))
+            keys = period_starts(corrections.start, "month")
+            changed = []
+            for first, last in zip(*group_bounds(keys)):
+                month = corrections.take(slice(first, last + 1))
+                if int(keys[first]) in months:
+                    path = months[int(keys[first])].path
+                    replaced.append(path)
+                    month = load_month(path, self.type, self.unit).concat(month)
+                changed.append(month)
+            months.update(self._write(Series.join(changed, self.type, self.unit)))
+        # Keep at least hot_seconds of readings in memory, from a month start
+        latest = int(hot.end.max()) if len(hot) else None
+        if latest is not None:
+            cutoff = int(
+                period_starts(np.array([latest - self.tiers.hot_seconds]), "month")[0]
+            )
+            index = int(np.searchsorted(hot.start, cutoff, side="left"))
+            if index:
+                months.update(self._write(hot.take(slice(0, index))))
+                # A copy rather than a view, so the demoted readings are freed
+                hot = hot.take(np.arange(index, len(hot)))
+        series = TieredSeries(
+            self.tiers, self.directory, hot, dict(sorted(months.items()))
+        )
+        for path in replaced:
+            self.tiers.forget(path)
+        return series
+
+
+class HotIndex(SeriesIndex):
+    """
+    An index over the hot readings of a tiered series, rebuilt from them when
+    the cutoff moves so it never holds the history
+    """
+
+    def __init__(self, index: type[SeriesIndex], tiered: Callable[[], TieredSeries]):
+        self.kind = index
+        # The tiered series is replaced as readings are added, so is looked up
+        self.tiered = tiered
+        self._build()
+
+    def _build(self):
+        tiered = self.tiered()
+        self.cutoff = tiered.cutoff
+        self.index = self.kind(tiered.hot)
+
+    def update(self, added: Series, raw: RawReader):
+        if self.tiered().cutoff != self.cutoff:
+            self._build()
+            return
+        if self.cutoff is not None:
+            added = added.take(added.start >= self.cutoff)
+        self.index.update(added, raw)
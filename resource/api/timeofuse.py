@@ -0,0 +1,120 @@
+"""
+Time-of-use band totals of meter readings.
+
+Each reading's half-hour of the day and whether it falls on a weekend are
+computed from its interval start into one small code per reading, in a single
+pass over the readings in range. Bucketing them into bands is then a gather
+through a 96-entry table mapping codes to (band, day type), and the totals per
+band and period are a single np.bincount.
+
+Bands are configured as comma separated name=HH:MM-HH:MM ranges in UTC, for
+example "overnight=00:00-07:00,peak=16:00-19:00". A range may wrap midnight,
+and half-hours not in any range fall into the default band.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from . import conf
+from .aggregation import group_bounds, period_ends, period_starts
+from .series import Series
+from .statistics import INTERVAL, INTERVALS_PER_DAY, time_of_day
+
+DAY_TYPES = ("weekday", "weekend")
+RESOLUTIONS = ("day", "month")
+
+
+def is_weekend(starts: np.ndarray) -> np.ndarray:
+    # 1 January 1970 was a Thursday, so day 0 is weekday 3 counting from Monday
+    return (starts // 86400 + 3) % 7 >= 5
+
+
+def interval_codes(starts: np.ndarray) -> np.ndarray:
+    """
+    Return the half-hour of the day of each interval start, plus
+    INTERVALS_PER_DAY if it is on a weekend
+    """
+    return (time_of_day(starts) + INTERVALS_PER_DAY * is_weekend(starts)).astype(
+        np.uint8
+    )
+
+
+def _slot(value: str) -> int:
+    hours, minutes = value.split(":")
+    seconds = int(hours) * 3600 + int(minutes) * 60
+    if seconds % INTERVAL or not 0 <= seconds <= 86400:
+        raise ValueError(f"Band time {value} is not on a half-hour")
+    return seconds // INTERVAL
+
+
+class Bands:
+    """
+    Named time-of-use bands covering every half-hour of the day
+    """
+
+    def __init__(self, spec: str, default: str):
+        self.spec = spec
+        self.names = [default]
+        slots = np.zeros(INTERVALS_PER_DAY, dtype=np.intp)
+        for part in filter(None, (p.strip() for p in spec.split(","))):
+            try:
+                name, times = part.split("=")
+                first, last = (_slot(t) for t in times.split("-"))
+            except ValueError as e:
+                raise ValueError(f"Invalid time-of-use band {part}: {e}")
+            if name not in self.names:
+                self.names.append(name)
+            length = (last - first) % INTERVALS_PER_DAY
+            slots[(first + np.arange(length)) % INTERVALS_PER_DAY] = self.names.index(
+                name
+            )
+        # Bucket of each interval code, band * 2 + day type
+        self.buckets = np.concatenate([slots * 2, slots * 2 + 1])
+
+    def totals(
+        self,
+        series: Series,
+        codes: np.ndarray,
+        resolution: str,
+        start: int | None = None,
+        end: int | None = None,
+    ) -> list[dict]:
+        """
+        Sum energy by period of the resolution, band and day type, given the
+        interval codes of the readings. Combinations with no readings are left
+        out, and periods are clipped to [start, end) when given.
+        """
+        if len(series) == 0:
+            return []
+        keys = period_starts(np.asarray(series.start), resolution)
+        first, _ = group_bounds(keys)
+        period = np.cumsum(np.diff(keys, prepend=keys[0]) != 0)
+        width = 2 * len(self.names)
+        bins = period * width + self.buckets[codes]
+        size = len(first) * width
+        energy = np.bincount(bins, weights=series.energy, minlength=size)
+        counts = np.bincount(bins, minlength=size)
+        starts = keys[first]
+        ends = period_ends(starts, resolution)
+        if start is not None:
+            starts = np.maximum(starts, start)
+        if end is not None:
+            ends = np.minimum(ends, end)
+        return [
+            {
+                "from": int(starts[i // width]),
+                "to": int(ends[i // width]),
+                "band": self.names[i % width // 2],
+                "dayType": DAY_TYPES[i % 2],
+                "energy": float(energy[i]),
+                "unit": series.unit,
+                "intervals": int(counts[i]),
+            }
+            for i in np.flatnonzero(counts).tolist()
+        ]
+
+
+@lru_cache(maxsize=None)
+def get_bands() -> Bands:
+    return Bands(conf.TIME_OF_USE_BANDS, conf.TIME_OF_USE_DEFAULT_BAND)
@@ -0,0 +1,110 @@
+"""
+Prefix-sum index for energy totals over arbitrary ranges.
+
+The running sum of energy is kept alongside each series, so the total for any
+range is the difference of two entries found by binary search, however long
+the range. Positions where a reading does not start where the previous one
+ended are kept too, so gaps within a range are reported rather than silently
+bridged.
+"""
+
+import numpy as np
+
+from .series import RawReader, Series, SeriesIndex
+
+INTERVAL = 1800
+
+
+class PrefixSums(SeriesIndex):
+    """
+    Running energy totals for one series
+    """
+
+    def __init__(self, series: Series):
+        self._build(series)
+
+    def _build(self, series: Series):
+        self.unit = series.unit
+        self.start = np.asarray(series.start)
+        self.end = np.asarray(series.end)
+        # sums[i] is the energy of the first i readings
+        self.sums = np.concatenate([[0.0], np.cumsum(series.energy)])
+        # Reading i + 1 does not start where reading i ends
+        self.breaks = np.flatnonzero(self.start[1:] != self.end[:-1])
+
+    def update(self, added: Series, raw: RawReader):
+        if len(added) == 0:
+            return
+        if len(self.start) == 0 or added.start.min() < self.end[-1]:
+            # Readings inserted or corrected within the series shift every
+            # later sum, so rebuild from the whole series
+            first = int(added.start.min())
+            last = int(added.end.max())
+            if len(self.start):
+                first = min(first, int(self.start[0]))
+                last = max(last, int(self.end[-1]))
+            self._build(raw(first, last))
+            return
+        # Readings appended after the end extend the sums
+        offset = len(self.start)
+        if added.start[0] != self.end[-1]:
+            self.breaks = np.append(self.breaks, offset - 1)
+        self.breaks = np.concatenate(
+            [self.breaks, offset + np.flatnonzero(added.start[1:] != added.end[:-1])]
+        )
+        self.sums = np.concatenate([self.sums, self.sums[-1] + np.cumsum(added.energy)])
+        self.start = np.concatenate([self.start, added.start])
+        self.end = np.concatenate([self.end, added.end])
+
+    def total(self, start: int, end: int) -> dict:
+        """
+        Return the energy used in [start, end), given as epoch seconds aligned
+        to half-hours, with the intervals in the range that have no reading.
+        """
+        lo = int(np.searchsorted(self.start, start, side="left"))
+        hi = int(np.searchsorted(self.start, end, side="left"))
+        if hi > lo and self.end[hi - 1] > end:
+            hi -= 1
+        gaps = []
+        if hi == lo:
+            gaps.append((start, end))
+        else:
+            if self.start[lo] > start:
+                gaps.append((start, int(self.start[lo])))
+            b_lo = int(np.searchsorted(self.breaks, lo, side="left"))
+            b_hi = int(np.searchsorted(self.breaks, hi - 1, side="left"))
+            gaps.extend(
+                (int(self.end[i]), int(self.start[i + 1]))
+                for i in self.breaks[b_lo:b_hi]
+            )
+            if self.end[hi - 1] < end:
+                gaps.append((int(self.end[hi - 1]), end))
+        expected = (end - start) // INTERVAL
+        return {
+            "energy": float(self.sums[hi] - self.sums[lo]),
+            "unit": self.unit,
+            "intervals": hi - lo,
+            "expectedIntervals": expected,
+            "gaps": gaps,
+        }
+
+
+def combine(totals: list[dict]) -> dict:
+    """
+    Return the total of consecutive ranges from the total of each, joining
+    gaps that meet where one range ends and the next starts
+    """
+    gaps: list[tuple[int, int]] = []
+    for total in totals:
+        for start, end in total["gaps"]:
+            if gaps and gaps[-1][1] == start:
+                gaps[-1] = (gaps[-1][0], end)
+            else:
+                gaps.append((start, end))
+    return {
+        "energy": sum(total["energy"] for total in totals),
+        "unit": totals[0]["unit"],
+        "intervals": sum(total["intervals"] for total in totals),
+        "expectedIntervals": sum(total["expectedIntervals"] for total in totals),
+        "gaps": gaps,
+    }
@@ -10,6 +10,9 @@ from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives import hashes
 import base64
 from ib1 import directory
+import numpy as np
+
+from api.series import Series
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 CLIENT_ID = "https://directory.core.ib1.org/application/836153"
@@ -91,3 +94,27 @@ def client_certificate(
         .replace("=", "")
     )
     return cert_pem, private_key_pem, private_key, cert_thumbprint
+
+
+def half_hours(
+    starts: list[int] | np.ndarray,
+    energy: float | list[float] | np.ndarray = 1.0,
+    cumulative: list[float] | None = None,
+    epoch: int = 0,
+) -> Series:
+    """
+    Readings for the half-hours numbered in starts from epoch, taken a
+    quarter of an hour in, with cumulative values summed from the energy
+    unless given
+    """
+    start = epoch + np.array(starts, dtype=np.int64) * 1800
+    values = np.broadcast_to(np.array(energy, dtype=np.float64), start.shape).copy()
+    if cumulative is None:
+        cumulative = np.cumsum(values)
+    return Series(
+        start,
+        start + 1800,
+        start + 900,
+        values,
+        np.array(cumulative, dtype=np.float64),
+    )
@@ -0,0 +1,70 @@
+import datetime
+import json
+
+import numpy as np
+import pytest
+
+from api.aggregation import period_ends, period_starts, resample
+from api.series import Series, to_epoch
+from tests import ROOT_DIR
+
+
+@pytest.fixture
+def series() -> Series:
+    with open(f"{ROOT_DIR}/../data/sample_data.json") as f:
+        return Series.from_readings(json.load(f))
+
+
+def epoch(*args) -> int:
+    return to_epoch(datetime.datetime(*args, tzinfo=datetime.timezone.utc))
+
+
+def test_period_starts_and_ends():
+    epochs = np.array([epoch(2024, 2, 29, 23, 30), epoch(2024, 12, 31, 23, 30)])
+
+    assert period_starts(epochs, "hour").tolist() == [
+        epoch(2024, 2, 29, 23),
+        epoch(2024, 12, 31, 23),
+    ]
+    assert period_starts(epochs, "day").tolist() == [
+        epoch(2024, 2, 29),
+        epoch(2024, 12, 31),
+    ]
+    months = period_starts(epochs, "month")
+    assert months.tolist() == [epoch(2024, 2, 1), epoch(2024, 12, 1)]
+    assert period_ends(months, "month").tolist() == [
+        epoch(2024, 3, 1),
+        epoch(2025, 1, 1),
+    ]
+    assert period_ends(period_starts(epochs, "year"), "year").tolist() == [
+        epoch(2025, 1, 1),
+        epoch(2025, 1, 1),
+    ]
+
+
+def test_resample_daily(series):
+    daily = resample(series, "day")
+
+    assert len(daily) == 3
+    readings = daily.to_readings()
+    assert readings[1]["from"] == "2012-02-21T00:00:00Z"
+    assert readings[1]["to"] == "2012-02-22T00:00:00Z"
+    assert daily.energy.sum() == pytest.approx(series.energy.sum())
+    day = (series.start >= epoch(2012, 2, 21)) & (series.start < epoch(2012, 2, 22))
+    assert daily.energy[1] == pytest.approx(series.energy[day].sum())
+    assert daily.cumulative[1] == series.cumulative[day][-1]
+    assert daily.taken_at[1] == series.taken_at[day][-1]
+
+
+def test_resample_clips_to_range(series):
+    start = datetime.datetime(2012, 2, 21, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2012, 2, 22, 12, tzinfo=datetime.timezone.utc)
+
+    monthly = resample(series.between(start, end), "month", start, end)
+
+    assert monthly.to_readings()[0]["from"] == "2012-02-21T00:00:00Z"
+    assert monthly.to_readings()[0]["to"] == "2012-02-22T12:00:00Z"
+
+
+def test_resample_halfhour_is_unchanged(series):
+    assert resample(series, "halfhour") is series
@@ -1,13 +1,28 @@
+import asyncio
+import base64
 import datetime
+import json
 from urllib.parse import quote
 
 from cryptography.hazmat.primitives import serialization
+import msgpack
+import numpy as np
+import pyarrow as pa
+from ib1 import directory
 import pytest
 from fastapi.testclient import TestClient
 
 from tests import client_certificate, ROOT_DIR  # noqa
-from api.main import app, DEMO_METER_ID
+from api.main import app, event_stream
+from api import compression
 from api import conf
+from api.conf import DEMO_METER_ID
+from api import exceptions
+from api import exports
+from api.pagination import encode_cursor
+from api import series
+from api import store
+from api.registry import Registry
 
 client = TestClient(app)
 
@@ -34,7 +49,7 @@ def get_private_key():
 def api_consumption_url():
     from_date = datetime.date.today().isoformat()
     to_date = datetime.date.today().isoformat()
-    return f"/datasources/{DEMO_METER_ID}/anymeasure?from={from_date}&to={to_date}"
+    return f"/datasources/{DEMO_METER_ID}/import?from={from_date}&to={to_date}"
 
 
 def test_consumption_no_token(api_consumption_url):
@@ -142,4 +157,1173 @@ def test_consumption(
         service_url=mocker.ANY,
         fapi_id="123",
         cap_member=mocker.ANY,
+        measure="import",
+        parameters=None,
+        complete=True,
     )
+
+
+def test_consumption_date_range(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    Only readings within the requested from/to dates are returned
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mocker.patch("api.provenance.create_provenance_records").return_value = {}
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-21&to=2012-02-22",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert len(data) == 48
+    assert data[0]["from"] == "2012-02-21T00:00:00Z"
+    assert data[-1]["to"] == "2012-02-22T00:00:00Z"
+
+
+def test_consumption_unknown_measure(
+    mock_check_token,
+):  # noqa
+    """
+    A measure the meter does not have returns 404
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/gas?from=2012-02-21&to=2012-02-22",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "query, headers",
+    [
+        ("&stream=true", {}),
+        ("", {"Accept": "application/x-ndjson"}),
+    ],
+)
+def test_consumption_ndjson(
+    mock_check_token,
+    mocker,
+    query,
+    headers,
+):  # noqa
+    """
+    Streaming returns a leading provenance frame then one reading per line
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mocker.patch("api.provenance.create_provenance_records").return_value = {
+        "record": 1
+    }
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-21&to=2012-02-22{query}",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+            **headers,
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {
+        "location": {"ukPostcodeOutcode": "SW8"},
+        "provenance": {"record": 1},
+        "watermark": mocker.ANY,
+    }
+    assert len(lines) == 49
+    assert lines[1]["from"] == "2012-02-21T00:00:00Z"
+
+
+def test_consumption_pages(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    limit and cursor page through a range, each page with its own provenance
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mock_create_provenance_records = mocker.patch(
+        "api.provenance.create_provenance_records"
+    )
+    mock_create_provenance_records.return_value = {}
+    url = f"/datasources/{DEMO_METER_ID}/import?from=2012-02-21&to=2012-02-22&limit=20"
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(
+            url + (f"&cursor={cursor}" if cursor else ""), headers=headers
+        )
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = pages[-1].get("nextCursor")
+        if not cursor:
+            break
+
+    assert [len(page["data"]) for page in pages] == [20, 20, 8]
+    readings = [reading for page in pages for reading in page["data"]]
+    assert len({reading["from"] for reading in readings}) == 48
+    assert mock_create_provenance_records.call_count == 3
+    assert mock_create_provenance_records.call_args_list[1].kwargs["parameters"] == {
+        "limit": 20,
+        "cursor": mocker.ANY,
+        "from": "2012-02-21T10:00Z",
+        "to": "2012-02-21T20:00Z",
+    }
+
+
+@pytest.mark.parametrize(
+    "cursor", ["notacursor", encode_cursor(True), encode_cursor(10**30)]
+)
+def test_consumption_invalid_cursor(
+    mock_check_token,
+    cursor,
+):  # noqa
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-21&to=2012-02-22"
+        f"&limit=20&cursor={cursor}",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == 400
+
+
+def test_consumption_cursor_requires_limit(
+    mock_check_token,
+):  # noqa
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    cursor = encode_cursor(1329782400)
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-21&to=2012-02-22"
+        f"&cursor={cursor}",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "cursor requires limit"
+
+
+def test_consumption_resolution(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    resolution aggregates readings into wider periods
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mock_create_provenance_records = mocker.patch(
+        "api.provenance.create_provenance_records"
+    )
+    mock_create_provenance_records.return_value = {}
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-20&to=2012-02-23"
+        "&resolution=day",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert [reading["from"] for reading in data] == [
+        "2012-02-20T00:00:00Z",
+        "2012-02-21T00:00:00Z",
+        "2012-02-22T00:00:00Z",
+    ]
+    assert data[2]["cumulative"]["value"] == 56621.9997
+    assert mock_create_provenance_records.call_args.kwargs["parameters"] == {
+        "resolution": "day"
+    }
+
+
+def test_total(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    The total endpoint sums energy over a half-hour aligned range
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mocker.patch("api.provenance.create_provenance_records").return_value = {}
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import/total"
+        "?from=2012-02-20T12:00:00Z&to=2012-02-20T14:30:00Z",
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["energy"] == {"value": 976.0 + 834.0 + 577.0, "unitCode": "WHR"}
+    assert data["intervals"] == 3
+    assert data["expectedIntervals"] == 5
+    assert data["gaps"] == [
+        {"from": "2012-02-20T12:00:00Z", "to": "2012-02-20T13:00:00Z"}
+    ]
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import/total"
+        "?from=2012-02-20T12:10:00Z&to=2012-02-20T14:30:00Z",
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+
+def test_emissions(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    The emissions endpoint weights each reading by the carbon intensity
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mock_create_provenance_records = mocker.patch(
+        "api.provenance.create_provenance_records"
+    )
+    mock_create_provenance_records.return_value = {}
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import/emissions?from=2012-02-20&to=2012-02-23",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [period["from"] for period in data["data"]] == [
+        "2012-02-20T00:00:00Z",
+        "2012-02-21T00:00:00Z",
+        "2012-02-22T00:00:00Z",
+    ]
+    assert data["unmatchedIntervals"] == 0
+    assert data["emissions"]["unitCode"] == "GRM"
+    assert data["emissions"]["value"] == pytest.approx(
+        sum(period["emissions"]["value"] for period in data["data"])
+    )
+    assert 0 < data["emissions"]["value"] < data["energy"]["value"]
+    assert mock_create_provenance_records.call_args.kwargs["parameters"] == {
+        "aggregation": "emissions",
+        "resolution": "day",
+    }
+
+
+def test_statistics(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    The statistics endpoint summarises the load profile over a range
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mocker.patch("api.provenance.create_provenance_records").return_value = {}
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import/statistics"
+        "?from=2012-02-20&to=2012-02-23&percentiles=50&percentiles=90",
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["intervals"] == 100
+    assert data["peak"]["energy"]["value"] >= data["percentiles"][1]["energy"]["value"]
+    assert [p["percentile"] for p in data["percentiles"]] == [50.0, 90.0]
+    assert len(data["profile"]) == 48
+    assert data["profile"][0]["time"] == "00:00"
+    assert sum(p["intervals"] for p in data["profile"]) == 100
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import/statistics"
+        "?from=2012-02-20&to=2012-02-23&percentiles=101",
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+
+def test_consumption_bands(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    bands totals energy by time-of-use band for each period
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mock_create_provenance_records = mocker.patch(
+        "api.provenance.create_provenance_records"
+    )
+    mock_create_provenance_records.return_value = {}
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-20&to=2012-02-23"
+        "&resolution=month&bands=true",
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert [(row["band"], row["dayType"]) for row in data] == [
+        ("off-peak", "weekday"),
+        ("overnight", "weekday"),
+        ("peak", "weekday"),
+    ]
+    assert data[0]["from"] == "2012-02-20T00:00:00Z"
+    assert data[0]["to"] == "2012-02-23T00:00:00Z"
+    assert sum(row["intervals"] for row in data) == 100
+    assert mock_create_provenance_records.call_args.kwargs["parameters"] == {
+        "resolution": "month",
+        "bands": conf.TIME_OF_USE_BANDS,
+    }
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-20&to=2012-02-23&bands=true",
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+
+def test_availability(
+    mock_check_token,
+):  # noqa
+    """
+    The availability endpoint lists covered and missing ranges per measure
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/availability?from=2012-02-20&to=2012-02-23",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [m["measure"] for m in data["measures"]] == ["import", "export"]
+    availability = data["measures"][0]
+    assert availability["intervals"] == 100
+    assert availability["expectedIntervals"] == 144
+    assert availability["covered"] == [
+        {"from": "2012-02-20T13:00:00Z", "to": "2012-02-22T15:00:00Z"}
+    ]
+    assert availability["missing"] == [
+        {"from": "2012-02-20T00:00:00Z", "to": "2012-02-20T13:00:00Z"},
+        {"from": "2012-02-22T15:00:00Z", "to": "2012-02-23T00:00:00Z"},
+    ]
+
+
+@pytest.mark.parametrize(
+    "query, status_code, missing",
+    [
+        # Only the stored bitmap is read, however wide the range
+        ("from=0001-01-01&to=9999-12-31", 200, 2),
+        ("from=2012-02-23&to=2012-02-23", 400, None),
+        ("from=2012-02-23&to=2012-02-20", 400, None),
+    ],
+)
+def test_availability_range(
+    mock_check_token,
+    query,
+    status_code,
+    missing,
+):  # noqa
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/availability?{query}",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == status_code
+    if missing is not None:
+        assert len(response.json()["measures"][0]["missing"]) == missing
+
+
+def test_consumption_missing_data_assurance(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    Provenance records whether readings are missing from the requested range
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mock_create_provenance_records = mocker.patch(
+        "api.provenance.create_provenance_records"
+    )
+    mock_create_provenance_records.return_value = {}
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+
+    client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-21&to=2012-02-22",
+        headers=headers,
+    )
+    assert mock_create_provenance_records.call_args.kwargs["complete"] is True
+
+    client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-20&to=2012-02-22",
+        headers=headers,
+    )
+    assert mock_create_provenance_records.call_args.kwargs["complete"] is False
+
+
+def test_consumption_other_account(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    Meters not registered to the token's account are not found
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    registry = Registry(
+        {"other": {"type": "electricity", "location": {}}},
+        {"account123": ["other"]},
+        [],
+        store.get_store(),
+    )
+    mocker.patch("api.main.registry.get_registry").return_value = registry
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-20&to=2012-02-23",
+        headers=headers,
+    )
+    assert response.status_code == 404
+
+    response = client.get("/datasources", headers=headers)
+    assert [datasource["id"] for datasource in response.json()["data"]] == ["other"]
+
+
+def test_batch(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    The batch endpoint returns several series with one provenance record
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mock_create_batch_provenance_records = mocker.patch(
+        "api.provenance.create_batch_provenance_records"
+    )
+    mock_create_batch_provenance_records.return_value = {}
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+    body = {
+        "from": "2012-02-21",
+        "to": "2012-02-22",
+        "series": [
+            {"id": DEMO_METER_ID, "measure": "import"},
+            {"id": DEMO_METER_ID, "measure": "export"},
+        ],
+    }
+
+    response = client.post("/datasources/batch", json=body, headers=headers)
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert [(s["id"], s["measure"]) for s in data] == [
+        (DEMO_METER_ID, "import"),
+        (DEMO_METER_ID, "export"),
+    ]
+    assert [len(s["data"]) for s in data] == [48, 48]
+    mock_create_batch_provenance_records.assert_called_once()
+    assert mock_create_batch_provenance_records.call_args.kwargs["series"] == [
+        (DEMO_METER_ID, "import", True),
+        (DEMO_METER_ID, "export", True),
+    ]
+
+    body["series"].append({"id": DEMO_METER_ID, "measure": "import"})
+    response = client.post("/datasources/batch", json=body, headers=headers)
+    assert response.status_code == 400
+
+    body["series"] = [{"id": "unknown", "measure": "import"}]
+    response = client.post("/datasources/batch", json=body, headers=headers)
+    assert response.status_code == 404
+
+
+def test_consumption_incremental_sync(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    Unchanged ranges answer 304, and since returns only the readings changed
+    after a watermark, with provenance covering just those
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mock_create_provenance_records = mocker.patch(
+        "api.provenance.create_provenance_records"
+    )
+    mock_create_provenance_records.return_value = {}
+    readings = store.ReadingStore()
+    readings.add(
+        DEMO_METER_ID, "import", store.get_store().series(DEMO_METER_ID, "import")
+    )
+    mocker.patch("api.main.store.get_store").return_value = readings
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+    url = f"/datasources/{DEMO_METER_ID}/import?from=2012-02-21&to=2012-02-22"
+
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    watermark = response.json()["watermark"]
+
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["Vary"] == "Accept, Accept-Encoding"
+    assert mock_create_provenance_records.call_count == 1
+
+    # CSV is another representation of the range, with its own ETag
+    csv_headers = {**headers, "Accept": "text/csv", "If-None-Match": etag}
+    response = client.get(url, headers=csv_headers)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    response = client.get(
+        url, headers={**csv_headers, "If-None-Match": response.headers["ETag"]}
+    )
+    assert response.status_code == 304
+
+    # Correct one reading in the range
+    corrected = readings.between(
+        DEMO_METER_ID,
+        "import",
+        datetime.datetime(2012, 2, 21, 10, tzinfo=datetime.timezone.utc),
+        datetime.datetime(2012, 2, 21, 10, 30, tzinfo=datetime.timezone.utc),
+    )
+    corrected.energy = corrected.energy + 1
+    readings.add(DEMO_METER_ID, "import", corrected)
+
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    response = client.get(f"{url}&since={watermark}", headers=headers)
+    assert response.status_code == 200
+    assert [reading["from"] for reading in response.json()["data"]] == [
+        "2012-02-21T10:00:00Z"
+    ]
+    assert mock_create_provenance_records.call_args.kwargs["parameters"] == {
+        "since": watermark,
+        "from": "2012-02-21T10:00Z",
+        "to": "2012-02-21T10:30Z",
+    }
+
+    response = client.get(f"{url}&since=notawatermark", headers=headers)
+    assert response.status_code == 400
+    response = client.get(f"{url}&since={watermark}&limit=10", headers=headers)
+    assert response.status_code == 400
+
+
+def test_events(
+    monkeypatch,
+    mocker,
+):  # noqa
+    """
+    Subscribers receive readings as they are added, then a provenance event
+    attesting them
+    """
+    monkeypatch.setattr(conf, "EVENTS_PROVENANCE_SECONDS", 0)
+    mock_create_provenance_records = mocker.patch(
+        "api.provenance.create_provenance_records"
+    )
+    mock_create_provenance_records.return_value = {"record": 1}
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    auth_result = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+        directory.parse_cert(quote(pem)),
+    )
+    readings = store.ReadingStore()
+    data = store.get_store().series(DEMO_METER_ID, "import")
+    readings.add(DEMO_METER_ID, "import", data.take(slice(0, 10)))
+
+    def parse(event: bytes) -> dict:
+        fields = dict(
+            line.split(": ", 1) for line in event.decode().split("\n") if line
+        )
+        return {**fields, "data": json.loads(fields["data"])}
+
+    async def run():
+        stream = event_stream(readings, auth_result, DEMO_METER_ID, "import")
+        subscribed = parse(await anext(stream))
+        readings.add(DEMO_METER_ID, "import", data.take(slice(10, 12)))
+        added = parse(await anext(stream))
+        provenance = parse(await anext(stream))
+        await stream.aclose()
+        return subscribed, added, provenance
+
+    subscribed, added, provenance = asyncio.run(run())
+
+    assert subscribed["event"] == "subscribed"
+    assert added["event"] == "readings"
+    assert [r["from"] for r in added["data"]["data"]] == [
+        r["from"] for r in data.take(slice(10, 12)).to_readings()
+    ]
+    assert added["id"] != subscribed["id"]
+    assert provenance == {
+        "event": "provenance",
+        "id": added["id"],
+        "data": {"provenance": {"record": 1}},
+    }
+    assert mock_create_provenance_records.call_args.kwargs["parameters"] == {
+        "since": subscribed["id"],
+        "watermark": added["id"],
+    }
+    assert not readings.broadcaster.subscribed(DEMO_METER_ID, "import")
+
+
+def test_events_unknown_measure(
+    mock_check_token,
+):  # noqa
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/unknown/events",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == 404
+
+
+def test_export(
+    mock_check_token,
+    mocker,
+    tmp_path,
+):  # noqa
+    """
+    An export job is submitted, polled until complete, then downloaded
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mock_create_provenance_records = mocker.patch(
+        "api.provenance.create_provenance_records"
+    )
+    mock_create_provenance_records.return_value = {"record": 1}
+    jobs = exports.Exports(str(tmp_path))
+    mocker.patch("api.main.exports.get_exports").return_value = jobs
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+    body = {"id": DEMO_METER_ID, "measure": "import", "from": "2012-02-20"}
+
+    response = client.post(
+        "/exports", json={**body, "to": "2012-02-20"}, headers=headers
+    )
+    assert response.status_code == 400
+
+    response = client.post(
+        "/exports", json={**body, "to": "2012-02-22"}, headers=headers
+    )
+    assert response.status_code == 202
+    location = response.headers["Location"]
+    jobs.executor.shutdown(wait=True)
+
+    response = client.get(location, headers=headers)
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "complete"
+    assert job["from"] == "2012-02-20"
+    assert job["provenance"] == {"record": 1}
+    assert mock_create_provenance_records.call_args.kwargs["parameters"] == {
+        "id": DEMO_METER_ID,
+        "format": "csv",
+    }
+
+    response = client.get(job["download"], headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "from,to,takenAt,energy,cumulative"
+    assert len(lines) == 1 + job["rows"]
+
+    mock_check_token.return_value = (
+        {"sub": "other"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    response = client.get(location, headers=headers)
+    assert response.status_code == 404
+
+
+def test_export_refused_on_lambda(
+    mock_check_token,
+    mocker,
+):  # noqa
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mocker.patch.object(conf, "LAMBDA", True)
+    mock_get_exports = mocker.patch("api.main.exports.get_exports")
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+
+    response = client.post(
+        "/exports",
+        json={
+            "id": DEMO_METER_ID,
+            "measure": "import",
+            "from": "2012-02-20",
+            "to": "2012-02-22",
+        },
+        headers=headers,
+    )
+    assert response.status_code == 501
+    response = client.get("/exports/abc", headers=headers)
+    assert response.status_code == 501
+    response = client.get("/exports/abc/file", headers=headers)
+    assert response.status_code == 501
+    mock_get_exports.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "media_type",
+    ["application/vnd.apache.arrow.stream", "text/csv", "application/vnd.msgpack"],
+)
+def test_consumption_columnar_formats(
+    mock_check_token,
+    mocker,
+    media_type,
+):  # noqa
+    """
+    Meter data is sent as Arrow, CSV or MessagePack when asked for, with
+    provenance
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mocker.patch("api.provenance.create_provenance_records").return_value = {
+        "record": 1
+    }
+
+    response = client.get(
+        f"/datasources/{DEMO_METER_ID}/import?from=2012-02-21&to=2012-02-22&limit=20",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+            "Accept": media_type,
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(media_type)
+    if media_type == "text/csv":
+        lines = response.text.splitlines()
+        starts = [line.split(",")[0] for line in lines[1:]]
+        provenance = json.loads(
+            base64.urlsafe_b64decode(response.headers["Provenance"] + "==")
+        )
+        cursor = response.headers["Next-Cursor"]
+    elif media_type == "application/vnd.msgpack":
+        data = msgpack.unpackb(response.content)
+        starts = series.format_timestamps(np.array(data["from"]))
+        provenance = data["provenance"]
+        cursor = data["nextCursor"]
+    else:
+        table = pa.ipc.open_stream(response.content).read_all()
+        starts = [
+            t.strftime("%Y-%m-%dT%H:%M:%SZ") for t in table.column("from").to_pylist()
+        ]
+        provenance = json.loads(table.schema.metadata[b"provenance"])
+        cursor = json.loads(table.schema.metadata[b"nextCursor"])
+    assert len(starts) == 20
+    assert starts[0] == "2012-02-21T00:00:00Z"
+    assert provenance == {"record": 1}
+    assert cursor
+
+
+def test_consumption_compressed(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    Meter data is compressed when the client accepts it, repeated requests
+    reusing the compressed readings with freshly signed provenance
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mocker.patch("api.provenance.create_provenance_records").side_effect = [
+        {"record": n} for n in range(4)
+    ]
+    compression.get_slice_cache.cache_clear()
+    url = f"/datasources/{DEMO_METER_ID}/import?from=2012-02-21&to=2012-02-22&limit=20"
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+
+    responses = [
+        client.get(url, headers={**headers, "Accept-Encoding": encoding})
+        for encoding in ["gzip", "gzip", "br", "identity"]
+    ]
+
+    assert [r.headers.get("Content-Encoding") for r in responses] == [
+        "gzip",
+        "gzip",
+        "br",
+        None,
+    ]
+    assert all(r.headers["Vary"] == "Accept, Accept-Encoding" for r in responses)
+    # Each encoding has its own ETag
+    etags = [r.headers["ETag"] for r in responses]
+    assert etags[0] == etags[1]
+    assert len(set(etags)) == 3
+    bodies = [r.json() for r in responses]
+    assert [body["provenance"] for body in bodies] == [{"record": n} for n in range(4)]
+    # The same readings and fields, however they were sent
+    for body in bodies:
+        assert {**body, "provenance": None} == {**bodies[-1], "provenance": None}
+    assert len(bodies[0]["data"]) == 20
+    assert bodies[0]["nextCursor"]
+    cache = compression.get_slice_cache()
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_aggregate(
+    mock_check_token,
+    mocker,
+):  # noqa
+    """
+    Aggregations over several series run in the worker processes, with
+    totals for each measure and one provenance record
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    mock_create_batch_provenance_records = mocker.patch(
+        "api.provenance.create_batch_provenance_records"
+    )
+    mock_create_batch_provenance_records.return_value = {}
+    headers = {
+        "Authorization": "Bearer token",
+        "x-amzn-mtls-clientcert-leaf": quote(pem),
+    }
+    body = {
+        "from": "2012-02-21",
+        "to": "2012-02-22",
+        "series": [
+            {"id": DEMO_METER_ID, "measure": "export"},
+            {"id": DEMO_METER_ID, "measure": "import"},
+        ],
+        "aggregation": "emissions",
+    }
+
+    response = client.post("/datasources/aggregate", json=body, headers=headers)
+
+    assert response.status_code == 200
+    result = response.json()
+    assert [(s["id"], s["measure"]) for s in result["data"]] == [
+        (DEMO_METER_ID, "export"),
+        (DEMO_METER_ID, "import"),
+    ]
+    emissions = result["data"][1]["emissions"]
+    assert len(emissions["data"]) == 1
+    (total,) = [t for t in result["totals"] if t["measure"] == "import"]
+    assert total["series"] == 1
+    assert total["emissions"] == emissions["emissions"]
+    assert mock_create_batch_provenance_records.call_args.kwargs["parameters"] == {
+        "aggregation": "emissions",
+        "resolution": "day",
+    }
+
+    body["aggregation"] = "statistics"
+    response = client.post("/datasources/aggregate", json=body, headers=headers)
+    assert response.status_code == 200
+    statistics = response.json()["data"][0]["statistics"]
+    assert statistics["intervals"] == 48
+
+    body["aggregation"] = "resample"
+    response = client.post("/datasources/aggregate", json=body, headers=headers)
+    assert response.status_code == 200
+    assert [len(s["readings"]) for s in response.json()["data"]] == [1, 1]
+
+    response = client.post(
+        "/datasources/aggregate",
+        json={**body, "resolution": "halfhour"},
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+    mocker.patch(
+        "api.pool.get_pool"
+    ).return_value.submit.side_effect = exceptions.PoolBusy("busy", 3)
+    response = client.post("/datasources/aggregate", json=body, headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+
+def test_status(mocker, mock_check_token):
+    """
+    Status reports the tier and compressed response cache hit rates
+    """
+    mock_check_token.return_value = (
+        {"sub": "account123"},
+        {"x-fapi-interaction-id": "123"},
+    )
+    pem, _, _, _ = client_certificate(
+        roles=[conf.PROVIDER_ROLE],
+        member="https://directory.ib1.org/member/123456",
+        add_application=True,
+    )
+    tiers = mocker.Mock()
+    tiers.stats.return_value = {"hotHitRate": 0.5}
+    mocker.patch("api.store.get_store").return_value = store.ReadingStore(tiers=tiers)
+
+    assert client.get("/status").status_code == 401
+    response = client.get(
+        "/status",
+        headers={
+            "Authorization": "Bearer token",
+            "x-amzn-mtls-clientcert-leaf": quote(pem),
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.json()["readingTiers"] == {"hotHitRate": 0.5}
+    assert set(response.json()["compressionCache"]) == {
+        "hits",
+        "misses",
+        "hitRate",
+        "entries",
+        "bytes",
+    }
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from api.availability import INTERVAL, Availability
+from api.series import Series
+from tests import half_hours
+
+
+def intervals(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    return [(a // INTERVAL, b // INTERVAL) for a, b in ranges]
+
+
+@pytest.fixture
+def bitmap() -> Availability:
+    return Availability(half_hours([10, 11, 12, 20, 30]))
+
+
+def test_count(bitmap):
+    assert bitmap.count(0, 100 * INTERVAL) == 5
+    assert bitmap.count(11 * INTERVAL, 21 * INTERVAL) == 3
+    assert bitmap.count(12 * INTERVAL, 13 * INTERVAL) == 1
+    assert bitmap.count(13 * INTERVAL, 20 * INTERVAL) == 0
+    assert bitmap.count(40 * INTERVAL, 50 * INTERVAL) == 0
+
+
+def test_count_matches_readings():
+    rng = np.random.default_rng(0)
+    starts = np.flatnonzero(rng.random(2000) < 0.7)
+    bitmap = Availability(half_hours(starts.tolist()))
+
+    for lo, hi in rng.integers(-10, 2010, size=(50, 2)):
+        lo, hi = sorted((int(lo), int(hi)))
+        expected = int(((starts >= lo) & (starts < hi)).sum())
+        assert bitmap.count(lo * INTERVAL, hi * INTERVAL) == expected
+
+
+def test_ranges(bitmap):
+    covered, missing = bitmap.ranges(0, 40 * INTERVAL)
+
+    assert intervals(covered) == [(10, 13), (20, 21), (30, 31)]
+    assert intervals(missing) == [(0, 10), (13, 20), (21, 30), (31, 40)]
+
+
+def test_ranges_within_covered(bitmap):
+    covered, missing = bitmap.ranges(11 * INTERVAL, 12 * INTERVAL)
+
+    assert intervals(covered) == [(11, 12)]
+    assert missing == []
+
+
+def test_update(bitmap):
+    bitmap.update(half_hours([2, 13, 50]), lambda start, end: None)
+
+    assert bitmap.count(0, 100 * INTERVAL) == 8
+    covered, _ = bitmap.ranges(0, 60 * INTERVAL)
+    assert intervals(covered) == [(2, 3), (10, 14), (20, 21), (30, 31), (50, 51)]
+
+
+def test_empty():
+    bitmap = Availability(Series.empty())
+
+    assert bitmap.count(0, 10 * INTERVAL) == 0
+    assert bitmap.ranges(0, 2 * INTERVAL) == ([], [(0, 2 * INTERVAL)])
+
+
+def test_ranges_wider_than_bitmap(bitmap):
+    # The range is clipped to the bitmap before anything is allocated
+    covered, missing = bitmap.ranges(-(10**15) * INTERVAL, 10**15 * INTERVAL)
+
+    assert intervals(covered) == [(10, 13), (20, 21), (30, 31)]
+    assert intervals(missing) == [(-(10**15), 10), (13, 20), (21, 30), (31, 10**15)]
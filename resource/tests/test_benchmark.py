@@ -0,0 +1,17 @@
+import json
+
+import numpy as np
+
+from api import benchmark
+from api.series import Series
+
+
+def test_paths_agree():
+    start = np.arange(48, dtype=np.int64) * 1800
+    values = np.linspace(0, 1, 48)
+    data = Series(start, start + 1800, start + 900, values, np.cumsum(values))
+
+    assert json.loads(benchmark.direct(data)) == json.loads(
+        benchmark.response_model(data)
+    )
+    assert benchmark.per_reading(benchmark.direct, data, 2) > 0
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api import columnar, conf
+from api.broadcast import Broadcaster
+from api.exceptions import SubscriberLagged
+from api.ingest import ColumnarWriter
+from api.sqlite_store import SqliteStore
+from api.store import load_columnar
+from tests import half_hours
+
+
+def test_publish_without_subscribers():
+    broadcaster = Broadcaster()
+
+    broadcaster.publish("meter", "import", half_hours([1]), "w1")
+
+    assert not broadcaster.subscribed("meter", "import")
+
+
+def test_fan_out():
+    async def run():
+        broadcaster = Broadcaster()
+        with broadcaster.subscribe("meter", "import") as first:
+            with broadcaster.subscribe("meter", "import") as second:
+                broadcaster.publish("meter", "import", half_hours([1]), "w1")
+                broadcaster.publish("meter", "export", half_hours([2]), "w2")
+                broadcaster.publish("meter", "import", half_hours([3]), "w3")
+                assert [w for _, w in await first.get(1)] == ["w1", "w3"]
+                assert [w for _, w in await second.get(1)] == ["w1", "w3"]
+                assert await first.get(0.01) == []
+        assert not broadcaster.subscribed("meter", "import")
+
+    asyncio.run(run())
+
+
+def test_wakes_from_another_thread():
+    async def run():
+        broadcaster = Broadcaster()
+        with broadcaster.subscribe("meter", "import") as subscription:
+            waiting = asyncio.create_task(subscription.get(5))
+            await asyncio.sleep(0.01)
+            threading.Thread(
+                target=broadcaster.publish,
+                args=("meter", "import", half_hours([1]), "w1"),
+            ).start()
+            batches = await waiting
+        assert [w for _, w in batches] == ["w1"]
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_lags():
+    async def run():
+        broadcaster = Broadcaster(capacity=2)
+        with broadcaster.subscribe("meter", "import") as slow:
+            with broadcaster.subscribe("meter", "import") as fast:
+                for n in range(3):
+                    broadcaster.publish("meter", "import", half_hours([n]), f"w{n}")
+                    assert len(await fast.get(1)) == 1
+                with pytest.raises(SubscriberLagged):
+                    await slow.get(1)
+
+    asyncio.run(run())
+
+
+def test_publishes_sqlite_writes_from_another_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(conf, "EVENTS_POLL_SECONDS", 0.01)
+    path = str(tmp_path / "readings.db")
+    served = SqliteStore(path)
+    served.add("meter", "import", half_hours([1, 2]))
+
+    async def run():
+        with served.subscribe("meter", "import") as subscription:
+            # As api.ingest would, from another process
+            SqliteStore(path).add("meter", "import", half_hours([3, 4]))
+            return await subscription.get(5)
+
+    batches = asyncio.run(run())
+
+    assert [w for _, w in batches] == [served.watermark("meter", "import")]
+    assert batches[0][0].start.tolist() == [3 * 1800, 4 * 1800]
+
+
+def test_subscribe_does_not_wait_for_a_poll(tmp_path, monkeypatch):
+    monkeypatch.setattr(conf, "EVENTS_POLL_SECONDS", 0.01)
+    served = SqliteStore(str(tmp_path / "readings.db"))
+    served.add("meter", "import", half_hours([1, 2]))
+    polling, polled = threading.Event(), threading.Event()
+
+    def poll():
+        polling.set()
+        time.sleep(0.5)
+        polled.set()
+
+    monkeypatch.setattr(served, "poll", poll)
+
+    async def run():
+        with served.subscribe("meter", "import"):
+            assert polling.wait(5)
+            with served.subscribe("meter", "export"):
+                return polled.is_set()
+
+    assert not asyncio.run(run())
+
+
+def test_publishes_columnar_writes_from_another_process(tmp_path):
+    root = str(tmp_path)
+    columnar.write_series(half_hours([1, 2]), columnar.series_path(root, "m", "import"))
+    served = load_columnar(root)
+
+    async def run():
+        with served.subscribe("m", "import") as subscription:
+            served.poll()
+            assert subscription.pending() == []
+            # As api.ingest would, from another process
+            writer = ColumnarWriter(root, "m", "import")
+            writer.write(half_hours([3, 4]))
+            writer.close()
+            served.poll()
+            return subscription.pending()
+
+    batches = asyncio.run(run())
+
+    assert [data.start.tolist() for data, _ in batches] == [[3 * 1800, 4 * 1800]]
+    assert served.series("m", "import").start.tolist() == [1800, 3600, 5400, 7200]
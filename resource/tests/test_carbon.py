@@ -0,0 +1,59 @@
+import datetime
+
+import numpy as np
+
+from api import carbon
+from api.series import Series
+from tests import half_hours
+
+
+def utc(epoch: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc)
+
+
+def test_lookup():
+    source = carbon.IntensitySource(
+        np.array([3600, 0, 1800], dtype=np.int64), np.array([300.0, 100.0, 200.0])
+    )
+
+    intensity, found = source.lookup(np.array([1800, 5400, 0, -1800]))
+
+    assert intensity.tolist() == [200.0, 0.0, 100.0, 0.0]
+    assert found.tolist() == [True, False, True, False]
+
+
+def test_emissions():
+    source = carbon.IntensitySource(
+        np.arange(4, dtype=np.int64) * 1800, np.array([100.0, 200.0, 300.0, 400.0])
+    )
+    # The last reading has no intensity
+    readings = half_hours([0, 1, 3, 4], [1000.0, 500.0, 2000.0, 1000.0])
+
+    result = carbon.emissions(readings, source, "hour", utc(0), utc(5 * 1800))
+
+    assert result["energy"] == 3500.0
+    assert result["emissions"] == 100.0 + 100.0 + 800.0
+    assert result["unmatched"] == 1
+    assert result["periods"] == [
+        {"from": 0, "to": 3600, "energy": 1500.0, "emissions": 200.0},
+        {"from": 3600, "to": 7200, "energy": 2000.0, "emissions": 800.0},
+        {"from": 7200, "to": 9000, "energy": 0.0, "emissions": 0.0},
+    ]
+
+
+def test_emissions_empty():
+    source = carbon.IntensitySource(np.array([0], dtype=np.int64), np.array([100.0]))
+
+    result = carbon.emissions(Series.empty(), source, "day", utc(0), utc(86400))
+
+    assert result == {"energy": 0.0, "emissions": 0.0, "unmatched": 0, "periods": []}
+
+
+def test_load_csv():
+    source = carbon.get_intensity_source()
+
+    assert len(source.start) == 192
+    assert source.start[0] == int(
+        datetime.datetime(2012, 2, 20, tzinfo=datetime.timezone.utc).timestamp()
+    )
+    assert np.all(np.diff(source.start) == 1800)
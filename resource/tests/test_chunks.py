@@ -0,0 +1,125 @@
+import datetime
+import json
+
+import numpy as np
+import pytest
+
+from api.chunks import (
+    Chunk,
+    ChunkedSeries,
+    decode_timestamps,
+    decode_values,
+    encode_timestamps,
+    encode_values,
+)
+from api.series import Series
+from api.store import ReadingStore
+from tests import ROOT_DIR
+
+
+@pytest.fixture
+def series() -> Series:
+    with open(f"{ROOT_DIR}/../data/sample_data.json") as f:
+        return Series.from_readings(json.load(f))
+
+
+def test_timestamps_round_trip():
+    values = np.array([0, 1800, 3600, 5400, 9000, 10800], dtype=np.int64)
+    encoded = encode_timestamps(values)
+
+    assert np.array_equal(decode_timestamps(*encoded, len(values)), values)
+
+
+def test_regular_timestamps_narrow_to_int8():
+    values = np.arange(0, 1800 * 1000, 1800, dtype=np.int64)
+    encoded = encode_timestamps(values)
+
+    assert encoded[2] == np.dtype(np.int8).str
+    assert len(encoded[3]) < 100
+
+
+def test_values_round_trip(series):
+    decoded = decode_values(encode_values(series.cumulative))
+
+    assert np.array_equal(decoded, series.cumulative)
+
+
+def test_chunk_bytes_round_trip(series):
+    chunk = Chunk.from_bytes(Chunk(series).to_bytes())
+
+    assert (chunk.count, chunk.min_start, chunk.max_end) == (
+        len(series),
+        series.start[0],
+        series.end[-1],
+    )
+    assert chunk.decode(series.type, series.unit).to_readings() == series.to_readings()
+
+
+def test_chunked_series_round_trip(series):
+    chunked = ChunkedSeries.from_series(series, 16)
+
+    assert len(chunked.chunks) == 7
+    assert len(chunked) == len(series)
+    assert chunked.to_series().to_readings() == series.to_readings()
+
+
+def test_chunked_between_decodes_overlapping_chunks(series, mocker):
+    chunked = ChunkedSeries.from_series(series, 16)
+    start = datetime.datetime(2012, 2, 21, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2012, 2, 21, 6, tzinfo=datetime.timezone.utc)
+    decode = mocker.spy(chunked.chunks[0].__class__, "decode")
+
+    result = chunked.between(start, end)
+
+    assert result.to_readings() == series.between(start, end).to_readings()
+    assert decode.call_count == 2
+
+
+def test_chunked_concat_replaces_and_appends(series):
+    chunked = ChunkedSeries.from_series(series.take(slice(0, 90)), 16)
+    update = series.take(slice(80, 100))
+    update.energy = update.energy + 1
+
+    merged = chunked.concat(update)
+
+    expected = series.take(slice(0, 80)).concat(update)
+    assert merged.to_series().to_readings() == expected.to_readings()
+    # Chunks before the update are reused as they are
+    assert merged.chunks[:5] == chunked.chunks[:5]
+
+
+def test_store_with_chunk_size(series):
+    store = ReadingStore(chunk_size=32)
+    store.add("meter", "import", series)
+    start = datetime.datetime(2012, 2, 21, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2012, 2, 22, tzinfo=datetime.timezone.utc)
+
+    assert len(store.between("meter", "import", start, end)) == 48
+    assert len(store.series("meter", "import")) == 100
+
+
+def test_chunked_between_limit(series):
+    chunked = ChunkedSeries.from_series(series, 16)
+    start = datetime.datetime(2012, 2, 21, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2012, 2, 22, tzinfo=datetime.timezone.utc)
+
+    result = chunked.between(start, end, limit=20)
+
+    assert result.to_readings() == series.between(start, end, 20).to_readings()
+
+
+def test_chunked_between_limit_with_part_full_chunks(series):
+    # As concat leaves them, chunks in the middle hold fewer than chunk_size
+    chunked = ChunkedSeries(
+        [Chunk(series.take(slice(i, i + 5))) for i in range(0, 40, 5)],
+        series.type,
+        series.unit,
+        10,
+    )
+    start = datetime.datetime(2012, 2, 20, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2012, 2, 23, tzinfo=datetime.timezone.utc)
+
+    result = chunked.between(start, end, limit=21)
+
+    assert len(result) == 21
+    assert result.to_readings() == series.between(start, end, 21).to_readings()
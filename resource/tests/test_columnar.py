@@ -0,0 +1,74 @@
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+from api import columnar
+from api.series import Series
+from api.store import load_columnar
+from tests import ROOT_DIR
+
+SAMPLE_DATA = f"{ROOT_DIR}/../data/sample_data.json"
+
+
+def sample_series() -> Series:
+    with open(SAMPLE_DATA) as f:
+        return Series.from_readings(json.load(f))
+
+
+def test_write_read_series(tmp_path):
+    series = sample_series()
+    path = columnar.series_path(str(tmp_path), "meter", "import")
+    columnar.write_series(series, path)
+
+    loaded = columnar.read_series(path)
+
+    assert isinstance(loaded.start, np.memmap)
+    assert loaded.type == "Electricity"
+    assert loaded.unit == "WHR"
+    assert loaded.to_readings() == series.to_readings()
+
+
+def test_slice_is_zero_copy(tmp_path):
+    path = columnar.series_path(str(tmp_path), "meter", "import")
+    columnar.write_series(sample_series(), path)
+    loaded = columnar.read_series(path)
+
+    lo, hi = loaded.index_range(int(loaded.start[10]), int(loaded.start[20]))
+    sliced = loaded.take(slice(lo, hi))
+
+    assert len(sliced) == 10
+    assert np.shares_memory(sliced.energy, loaded.energy)
+
+
+def test_load_columnar(tmp_path):
+    series = sample_series()
+    for measure in ["import", "export"]:
+        columnar.write_series(
+            series, columnar.series_path(str(tmp_path), "meter", measure)
+        )
+
+    store = load_columnar(str(tmp_path))
+
+    assert store.measures("meter") == ["export", "import"]
+    assert len(store.series("meter", "import")) == len(series)
+
+
+def test_convert_json(tmp_path):
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "api.columnar",
+            SAMPLE_DATA,
+            str(tmp_path),
+            "meter",
+            "import",
+        ],
+        cwd=f"{ROOT_DIR}/..",
+        check=True,
+    )
+
+    store = load_columnar(str(tmp_path))
+    assert len(store.series("meter", "import")) == 100
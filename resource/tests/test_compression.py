@@ -0,0 +1,75 @@
+import gzip
+import os
+
+import brotli
+import pytest
+import zstandard
+
+from api import compression
+
+
+def decompress(encoding: str, content: bytes) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(content)
+    if encoding == "br":
+        return brotli.decompress(content)
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    data = decompressor.decompress(content)
+    assert decompressor.eof
+    return data
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate, br, zstd", "zstd"),
+        ("gzip, br", "br"),
+        ("gzip;q=1, br;q=0.5", "gzip"),
+        ("*", "zstd"),
+        ("deflate, identity", None),
+        ("gzip;q=0", None),
+        (None, None),
+    ],
+)
+def test_negotiate(accept_encoding, expected):
+    assert compression.negotiate(accept_encoding) == expected
+
+
+@pytest.mark.parametrize("encoding", compression.ENCODINGS)
+@pytest.mark.parametrize(
+    "data, tail",
+    [
+        (b"", b""),
+        (b"", b'{"data":[]}'),
+        (b'{"data":[{"type":"Electricity"}' * 5000, b"]}"),
+        # A tail longer than the largest stored block of each format
+        (b'{"data":[1,2,3]', b',"provenance":"' + os.urandom(100_000).hex().encode()),
+    ],
+)
+def test_prefix_with_tail(encoding, data, tail):
+    prefix = compression.Prefix(encoding, data)
+
+    assert decompress(encoding, prefix.finish(tail)) == data + tail
+    # The prefix is reused for each tail
+    assert decompress(encoding, prefix.finish(b"}")) == data + b"}"
+
+
+def test_slice_cache():
+    cache = compression.SliceCache(150)
+    first = compression.Prefix("gzip", os.urandom(40))
+    second = compression.Prefix("gzip", os.urandom(40))
+
+    cache.put("first", first, {"nextCursor": None})
+    cache.put("second", second, {})
+
+    assert cache.get("first") == (first, {"nextCursor": None})
+    assert cache.get("third") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    # The least recently used prefix is dropped to make room
+    cache.put("third", compression.Prefix("gzip", os.urandom(40)), {})
+    assert len(cache) == 2
+    assert cache.get("second") is None
+    assert cache.size <= 150
+    # A prefix larger than the whole cache is not kept
+    cache.put("large", compression.Prefix("gzip", os.urandom(200)), {})
+    assert cache.get("large") is None
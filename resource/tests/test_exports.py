@@ -0,0 +1,144 @@
+import datetime
+import os
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+from api import exports
+from api.ingest import read_csv
+from api.series import Series, to_epoch
+from api.store import ReadingStore
+
+START = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def readings() -> ReadingStore:
+    # About 100 days of half-hours, so an export spans several chunks
+    start = to_epoch(START) + np.arange(4800, dtype=np.int64) * 1800
+    values = np.linspace(0, 1, len(start))
+    readings = ReadingStore()
+    readings.add(
+        "meter",
+        "import",
+        Series(start, start + 1800, start + 900, values, np.cumsum(values)),
+    )
+    return readings
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    jobs = exports.Exports(str(tmp_path))
+    yield jobs
+    jobs.executor.shutdown()
+
+
+def submit(jobs, readings, format="csv", sign=lambda complete: {"complete": complete}):
+    return jobs.submit(
+        readings,
+        "account",
+        "meter",
+        "import",
+        datetime.date(2020, 1, 1),
+        datetime.date(2020, 3, 1),
+        format,
+        sign,
+    )
+
+
+def wait(jobs, job: dict) -> dict:
+    jobs.executor.submit(lambda: None).result()
+    return jobs.get(job["jobId"])
+
+
+def test_csv_export(jobs, readings):
+    job = submit(jobs, readings)
+    assert job["status"] == exports.QUEUED
+
+    job = wait(jobs, job)
+
+    assert job["status"] == exports.COMPLETE
+    assert job["rows"] == 60 * 48
+    assert job["provenance"] == {"complete": True}
+    (exported,) = read_csv(jobs.file(job))
+    expected = readings.between(
+        "meter", "import", START, START + datetime.timedelta(days=60)
+    )
+    assert exported.start.tolist() == expected.start.tolist()
+    assert exported.energy.tolist() == expected.energy.tolist()
+
+
+def test_parquet_export(jobs, readings):
+    job = wait(jobs, submit(jobs, readings, "parquet"))
+
+    assert job["status"] == exports.COMPLETE
+    table = pq.read_table(jobs.file(job))
+    assert table.num_rows == 60 * 48
+    assert table.schema.metadata[b"unitCode"] == b"WHR"
+    assert pq.ParquetFile(jobs.file(job)).num_row_groups == 2
+
+
+def test_repeated_request_reuses_job(jobs, readings):
+    job = wait(jobs, submit(jobs, readings))
+
+    assert submit(jobs, readings)["jobId"] == job["jobId"]
+    # Readings added after the range leave it unchanged, a correction does not
+    for n, same in [(4800, True), (100, False)]:
+        start = np.array([to_epoch(START) + n * 1800])
+        readings.add(
+            "meter",
+            "import",
+            Series(start, start + 1800, start, np.ones(1), np.ones(1)),
+        )
+        assert (submit(jobs, readings)["jobId"] == job["jobId"]) is same
+
+
+def test_failed_export(jobs, readings):
+    def sign(complete: bool) -> dict:
+        raise RuntimeError("No signing key")
+
+    job = wait(jobs, submit(jobs, readings, sign=sign))
+
+    assert job["status"] == exports.FAILED
+    assert job["error"] == "No signing key"
+    # A failed job is run again when submitted again
+    assert submit(jobs, readings)["status"] == exports.QUEUED
+
+
+def test_synchronous_export(tmp_path, readings):
+    jobs = exports.Exports(str(tmp_path), workers=0)
+
+    job = submit(jobs, readings)
+
+    assert jobs.executor is None
+    assert job["status"] == exports.COMPLETE
+    assert job["rows"] == 60 * 48
+
+
+def test_stale_job_runs_again(jobs, readings, monkeypatch):
+    job = submit(jobs, readings)
+    wait(jobs, job)
+    # As if the process writing the job had died while it was running
+    jobs._save({**job, "status": exports.RUNNING})
+    assert submit(jobs, readings)["status"] == exports.RUNNING
+
+    monkeypatch.setattr(exports.conf, "EXPORT_STALE_SECONDS", -1)
+    job = submit(jobs, readings)
+
+    assert job["status"] == exports.QUEUED
+    assert wait(jobs, job)["status"] == exports.COMPLETE
+
+
+def test_concurrent_writes_of_a_job(tmp_path, readings):
+    jobs = exports.Exports(str(tmp_path), workers=4)
+    job = submit(jobs, readings)
+    start, end = START, START + datetime.timedelta(days=60)
+    for _ in range(3):
+        jobs.executor.submit(jobs._run, job, readings, start, end, lambda complete: {})
+    jobs.executor.shutdown()
+
+    assert jobs.get(job["jobId"])["status"] == exports.COMPLETE
+    (exported,) = read_csv(jobs.file(job))
+    assert len(exported) == 60 * 48
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
@@ -0,0 +1,112 @@
+import base64
+import json
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+from pydantic import TypeAdapter
+
+from api import formats, models
+from api.series import Series
+
+
+def series() -> Series:
+    start = np.arange(3, dtype=np.int64) * 1800
+    values = np.array([0.5, 1.25, 2.0])
+    return Series(start, start + 1800, start + 900, values, np.cumsum(values))
+
+
+def test_negotiate():
+    assert formats.negotiate(None, formats.COLUMNAR) is None
+    assert formats.negotiate("application/json", formats.COLUMNAR) is None
+    assert formats.negotiate("*/*", formats.COLUMNAR) is None
+    assert formats.negotiate("text/csv;q=0", formats.COLUMNAR) is None
+    assert (
+        formats.negotiate("application/json, text/csv;q=0.1", formats.COLUMNAR) is None
+    )
+    assert formats.negotiate("application/json;q=0.5, text/csv", formats.COLUMNAR) == (
+        formats.CSV
+    )
+    assert formats.negotiate("text/csv", formats.COLUMNAR) == formats.CSV
+    assert formats.negotiate("text/*, application/json;q=0.5", formats.COLUMNAR) == (
+        formats.CSV
+    )
+    assert (
+        formats.negotiate(
+            f"{formats.MSGPACK}, {formats.ARROW_STREAM}", formats.COLUMNAR
+        )
+        == formats.MSGPACK
+    )
+    assert (
+        formats.negotiate(
+            f"{formats.MSGPACK};q=0.8, {formats.ARROW_STREAM}", formats.COLUMNAR
+        )
+        == formats.ARROW_STREAM
+    )
+
+
+def test_json_meter_data():
+    data = series()
+    fields = {"location": {"lat": 51.5}, "provenance": {"record": 1}}
+
+    content = json.loads(formats.json_meter_data(data, fields))
+
+    # The same as the response model would write from a dict per reading
+    model = TypeAdapter(models.MeterData)
+    expected = model.dump_python(
+        model.validate_python({"data": data.to_readings(), **fields}),
+        mode="json",
+        by_alias=True,
+        exclude_none=True,
+    )
+    assert content == expected
+    assert json.loads(formats.json_meter_data(Series.empty(), {})) == {"data": []}
+
+
+def test_json_readings_not_finite():
+    data = series()
+    data.energy[1] = np.nan
+
+    (reading,) = json.loads(formats.json_readings(data.take(slice(1, 2))))
+
+    assert reading["energy"] == {"value": None, "unitCode": "WHR"}
+
+
+def test_ndjson():
+    lines = b"".join(formats.ndjson({"watermark": "w"}, series(), 2)).splitlines()
+
+    assert json.loads(lines[0]) == {"watermark": "w"}
+    assert [json.loads(line) for line in lines[1:]] == series().to_readings()
+
+
+def test_csv_lines():
+    assert formats.csv_lines(series()).splitlines()[1] == (
+        "1970-01-01T00:30:00Z,1970-01-01T01:00:00Z,1970-01-01T00:45:00Z,1.25,1.75"
+    )
+
+
+def test_arrow_stream():
+    content = formats.arrow_stream(series(), {"provenance": {"record": 1}})
+
+    table = pa.ipc.open_stream(content).read_all()
+    assert table.column("energy").to_pylist() == [0.5, 1.25, 2.0]
+    assert table.column("from").type == pa.timestamp("s", tz="UTC")
+    assert json.loads(table.schema.metadata[b"provenance"]) == {"record": 1}
+    assert table.schema.metadata[b"unitCode"] == b"WHR"
+
+
+def test_msgpack_columns():
+    content = formats.msgpack_columns(series(), {"provenance": {"record": 1}})
+
+    data = msgpack.unpackb(content)
+    assert data["from"] == [0, 1800, 3600]
+    assert data["cumulative"] == [0.5, 1.75, 3.75]
+    assert data["provenance"] == {"record": 1}
+
+
+def test_encode_header():
+    encoded = formats.encode_header({"record": 1})
+
+    assert "=" not in encoded
+    decoded = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+    assert json.loads(decoded) == {"record": 1}
@@ -0,0 +1,221 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pytest
+
+from api.columnar import read_series, series_path
+from api.exceptions import IngestError
+from api.ingest import (
+    ColumnarWriter,
+    SqliteWriter,
+    Validator,
+    ingest,
+    parse_epochs,
+    read_csv,
+    read_jsonl,
+)
+from api.sqlite_store import SqliteStore
+from tests import half_hours
+
+HOUR = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+EPOCH = int(HOUR.timestamp())
+
+
+def write_csv(path, rows: list[tuple]) -> str:
+    lines = ["from,to,takenAt,energy,cumulative"]
+    for start, energy, cumulative in rows:
+        a = datetime.datetime.fromtimestamp(EPOCH + start * 1800, datetime.UTC)
+        b = a + datetime.timedelta(minutes=30)
+        lines.append(
+            f"{a:%Y-%m-%dT%H:%M:%SZ},{b:%Y-%m-%dT%H:%M:%SZ},,{energy},{cumulative}"
+        )
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_parse_epochs():
+    assert parse_epochs(["2024-01-01T00:00:00Z", "2024-01-01T00:30:00Z"]).tolist() == [
+        EPOCH,
+        EPOCH + 1800,
+    ]
+    assert parse_epochs(["2024-01-01T01:00:00+01:00"]).tolist() == [EPOCH]
+
+
+def test_read_csv(tmp_path):
+    path = write_csv(
+        tmp_path / "readings.csv", [(0, 1.0, 1.0), (1, 2.0, ""), (2, 3.0, 6.0)]
+    )
+
+    batches = list(read_csv(path, batch_size=2))
+
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert batches[0].start.tolist() == [EPOCH, EPOCH + 1800]
+    assert batches[0].taken_at.tolist() == batches[0].end.tolist()
+    assert np.isnan(batches[0].cumulative[1])
+
+
+def test_read_jsonl(tmp_path):
+    path = tmp_path / "readings.jsonl"
+    reading = {
+        "type": "Electricity",
+        "from": "2024-01-01T00:00:00Z",
+        "to": "2024-01-01T00:30:00Z",
+        "takenAt": "2024-01-01T00:30:00Z",
+        "energy": {"value": 1.5, "unitCode": "WHR"},
+    }
+    path.write_text(json.dumps(reading) + "\n\n")
+
+    (batch,) = read_jsonl(str(path))
+
+    assert batch.start.tolist() == [EPOCH]
+    assert batch.energy.tolist() == [1.5]
+    assert np.isnan(batch.cumulative[0])
+
+
+def test_validator_gaps_across_batches():
+    validator = Validator()
+
+    validator.check(half_hours([0, 1], [1, 1], [1, 2]))
+    validator.check(half_hours([3, 4], [1, 1], [3, 4]))
+
+    assert validator.rows == 4
+    assert validator.gaps == 1
+    assert validator.recomputed == 0
+
+
+@pytest.mark.parametrize(
+    "batch,row",
+    [
+        (half_hours([0, 1, 1], [1, 1, 1], [1, 2, 3]), 3),
+        (half_hours([0, 1], [1, np.nan], [1, 2]), 2),
+    ],
+)
+def test_validator_rejects(batch, row):
+    with pytest.raises(IngestError, match=f"Row {row}:"):
+        Validator().check(batch)
+
+
+def test_validator_rejects_overlap_across_batches():
+    validator = Validator()
+    validator.check(half_hours([0, 1], [1, 1], [1, 2]))
+
+    with pytest.raises(IngestError, match="Row 3:"):
+        validator.check(half_hours([1], [1], [3]))
+
+
+def test_validator_recomputes_cumulative():
+    validator = Validator()
+
+    first = validator.check(half_hours([0, 1, 2], [1, 2, 3], [10, np.nan, 15]))
+    # Decreasing, then good again, then missing
+    second = validator.check(half_hours([3, 4, 5], [1, 1, 1], [5, 17, np.nan]))
+
+    assert first.cumulative.tolist() == [10, 12, 15]
+    assert second.cumulative.tolist() == [16, 17, 18]
+    assert validator.recomputed == 3
+
+
+def test_validator_keeps_cumulative_above_recomputed_values():
+    validator = Validator()
+
+    # The given 11 and 12 are above the 10 given before them, but below the
+    # 15 recomputed for the missing value
+    batch = validator.check(
+        half_hours([0, 1, 2, 3], [1, 5, 1, 1], [10, np.nan, 11, 12])
+    )
+    later = validator.check(half_hours([4], [1], [16]))
+
+    assert batch.cumulative.tolist() == [10, 15, 16, 17]
+    assert later.cumulative.tolist() == [18]
+    assert validator.recomputed == 4
+
+
+def test_validator_recomputes_leading_missing_cumulative():
+    batch = Validator().check(half_hours([0, 1], [1, 2], [np.nan, np.nan]))
+
+    assert batch.cumulative.tolist() == [1, 3]
+
+
+def test_ingest_sqlite(tmp_path):
+    path = write_csv(
+        tmp_path / "readings.csv",
+        [(i, 1.0, i + 1.0) for i in range(5)],
+    )
+    database = str(tmp_path / "readings.db")
+
+    validator, elapsed = ingest(
+        read_csv(path, batch_size=2), SqliteWriter(database, "meter", "import")
+    )
+
+    assert validator.rows == 5
+    assert elapsed >= 0
+    series = SqliteStore(database).series("meter", "import")
+    assert series.cumulative.tolist() == [1, 2, 3, 4, 5]
+
+
+def test_ingest_columnar_merges(tmp_path):
+    root = str(tmp_path / "columnar")
+    ingest(
+        [half_hours([0, 1], [1, 1], [1, 2])],
+        ColumnarWriter(root, "meter", "import"),
+    )
+
+    ingest(
+        [half_hours([2, 3], [1, 1], [3, 4])],
+        ColumnarWriter(root, "meter", "import"),
+    )
+
+    series = read_series(series_path(root, "meter", "import"))
+    assert series.cumulative.tolist() == [1, 2, 3, 4]
+
+
+def test_ingest_columnar_writes_batches_as_they_arrive(tmp_path):
+    root = str(tmp_path / "columnar")
+    writer = ColumnarWriter(root, "meter", "import")
+
+    writer.write(half_hours([0, 1], [1, 1], [1, 2]))
+    writer.write(half_hours([2], [1], [3]))
+
+    assert not hasattr(writer, "batches")
+    assert (
+        os.path.getsize(
+            os.path.join(series_path(root, "meter", "import"), ".energy.part")
+        )
+        == 3 * 8
+    )
+    writer.close()
+    series = read_series(series_path(root, "meter", "import"))
+    assert series.start.tolist() == [i * 1800 for i in range(3)]
+    assert sorted(os.listdir(series_path(root, "meter", "import"))) == [
+        "cumulative.npy",
+        "end.npy",
+        "energy.npy",
+        "meta.json",
+        "start.npy",
+        "taken_at.npy",
+    ]
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "columnar"])
+def test_ingest_validates_against_stored_readings(tmp_path, backend):
+    target = str(tmp_path / ("readings.db" if backend == "sqlite" else "columnar"))
+    writer = ColumnarWriter if backend == "columnar" else SqliteWriter
+    ingest([half_hours([0, 1], [1, 1], [1, 2])], writer(target, "meter", "import"))
+
+    # Starts before the last stored reading ends
+    with pytest.raises(IngestError, match="Row 1:"):
+        ingest([half_hours([1, 2], [1, 1], [2, 3])], writer(target, "meter", "import"))
+
+    # The missing cumulative value carries on from the stored one
+    validator, _ = ingest(
+        [half_hours([3, 4], [1, 1], [np.nan, 4])], writer(target, "meter", "import")
+    )
+    assert validator.gaps == 1
+    assert validator.recomputed == 1
+    if backend == "sqlite":
+        series = SqliteStore(target).series("meter", "import")
+    else:
+        series = read_series(series_path(target, "meter", "import"))
+    assert series.cumulative.tolist() == [1, 2, 3, 4]
@@ -0,0 +1,35 @@
+import base64
+
+import pytest
+
+from api.pagination import MAX_AFTER, decode_cursor, encode_cursor
+
+
+def raw_cursor(payload: bytes) -> str:
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(1329782400)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == 1329782400
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "",
+        "notacursor",
+        encode_cursor(1)[:-2],
+        "e30",
+        encode_cursor(True),
+        encode_cursor(-1),
+        encode_cursor(MAX_AFTER + 1),
+        encode_cursor(10**30),
+        raw_cursor(b'{"after":1.5}'),
+    ],
+)
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,75 @@
+import datetime
+import time
+
+import pytest
+
+from api import carbon, pool, statistics, store
+from api.conf import DEMO_METER_ID
+from api.exceptions import PoolBusy
+from api.series import date_range
+
+START, END = date_range(datetime.date(2012, 2, 21), datetime.date(2012, 2, 22))
+
+
+@pytest.fixture
+def workers():
+    workers = pool.AggregationPool(1, 1)
+    yield workers
+    workers.executor.shutdown()
+
+
+@pytest.mark.parametrize("aggregation", ["resample", "statistics", "emissions"])
+def test_aggregate_meter(aggregation):
+    (result,) = pool.aggregate_meter(
+        DEMO_METER_ID, ["import"], START, END, aggregation, "hour", (50.0,)
+    )
+
+    data = store.get_store().between(DEMO_METER_ID, "import", START, END)
+    assert result["measure"] == "import"
+    assert result["unit"] == data.unit
+    assert result["energy"] == pytest.approx(data.energy.sum())
+    assert result["complete"]
+    if aggregation == "resample":
+        assert len(result["result"]) == 24
+        assert result["result"].to_readings()[1]["from"] == "2012-02-21T01:00:00Z"
+        assert result["result"].energy.sum() == pytest.approx(result["energy"])
+    elif aggregation == "statistics":
+        assert result["result"] == statistics.load_profile(data, (50.0,))
+    else:
+        source = carbon.get_intensity_source()
+        assert result["result"] == carbon.emissions(data, source, "hour", START, END)
+
+
+def test_resample_to_halfhours():
+    with pytest.raises(ValueError):
+        pool.aggregate_meter(
+            DEMO_METER_ID, ["import"], START, END, "resample", "halfhour", ()
+        )
+
+
+def test_threads():
+    # As on Lambda, where there is no /dev/shm for a process pool
+    workers = pool.AggregationPool(1, 1, threads=True)
+
+    (future,) = workers.submit(
+        pool.aggregate_meter,
+        [(DEMO_METER_ID, ["import"], START, END, "resample", "day", ())],
+    )
+
+    (result,) = future.result()
+    assert len(result["result"]) == 1
+    workers.executor.shutdown()
+
+
+def test_admission(workers):
+    busy = workers.submit(time.sleep, [(0.5,), (0.5,)])
+
+    with pytest.raises(PoolBusy) as e:
+        workers.submit(time.sleep, [(0,)])
+    assert e.value.retry_after >= 1
+
+    for future in busy:
+        future.result()
+    assert workers.pending == 0
+    # More partitions than the pool holds are admitted when it is idle
+    assert [f.result() for f in workers.submit(abs, [(-1,), (-2,), (-3,)])] == [1, 2, 3]
@@ -1,7 +1,7 @@
 import datetime
 import pytest
 from unittest.mock import MagicMock
-from api.provenance import create_provenance_records
+from api.provenance import create_batch_provenance_records, create_provenance_records
 
 
 @pytest.fixture
@@ -84,3 +84,74 @@ def test_create_provenance_records(
     mock_record_instance.add_step.assert_called()
     mock_record_instance.sign.assert_called()
     mock_record_instance.encoded.assert_called()
+
+
+@pytest.mark.parametrize("complete,assurance", [(True, "Complete"), (False, "Missing")])
+def test_create_provenance_records_missing_data(
+    mock_get_certificate,
+    mock_get_key,
+    mock_record,
+    mock_signer_in_memory,
+    mock_certificates_provider_self_contained_record,
+    mock_x509_load_pem_x509_certificates,
+    complete,
+    assurance,
+):
+    mock_x509_load_pem_x509_certificates.return_value = [MagicMock()]
+    mock_record_instance = mock_record.return_value
+    mock_record_instance.sign.return_value = mock_record_instance
+
+    create_provenance_records(
+        datetime.date(2023, 1, 1),
+        datetime.date(2023, 1, 31),
+        datetime.datetime(2023, 1, 1, 12, 0, 0),
+        datetime.datetime(2023, 12, 31, 12, 0, 0),
+        "https://example.com/service",
+        "account123",
+        "fapi123",
+        "cap_member123",
+        complete=complete,
+    )
+
+    origin = mock_record_instance.add_step.call_args_list[1].args[0]
+    missing_data = origin["perseus:assurance"]["missingData"]
+    assert missing_data.endswith(f"/assurance/missing-data/{assurance}")
+
+
+def test_create_batch_provenance_records(
+    mock_get_certificate,
+    mock_get_key,
+    mock_record,
+    mock_signer_in_memory,
+    mock_certificates_provider_self_contained_record,
+    mock_x509_load_pem_x509_certificates,
+):
+    mock_x509_load_pem_x509_certificates.return_value = [MagicMock()]
+    mock_record_instance = mock_record.return_value
+    mock_record_instance.sign.return_value = mock_record_instance
+    mock_record_instance.encoded.return_value = b"mock_encoded_data"
+
+    result = create_batch_provenance_records(
+        datetime.date(2023, 1, 1),
+        datetime.date(2023, 1, 31),
+        datetime.datetime(2023, 1, 1, 12, 0, 0),
+        datetime.datetime(2023, 12, 31, 12, 0, 0),
+        "https://example.com/service",
+        "account123",
+        "fapi123",
+        "cap_member123",
+        [("meter1", "import", True), ("meter2", "export", False)],
+    )
+
+    assert result == b"mock_encoded_data"
+    mock_record_instance.sign.assert_called_once()
+    steps = [call.args[0] for call in mock_record_instance.add_step.call_args_list]
+    assert [step["type"] for step in steps] == [
+        "permission",
+        "origin",
+        "transfer",
+        "origin",
+        "transfer",
+    ]
+    assert [step["parameters"]["id"] for step in steps[2::2]] == ["meter1", "meter2"]
+    assert steps[3]["perseus:assurance"]["missingData"].endswith("/Missing")
@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+import pytest
+
+from api.registry import Registry, load_registry, register_meters
+from api.series import Series
+from api.store import ReadingStore
+
+METERS = {
+    "m1": {"type": "electricity", "location": {"ukPostcodeOutcode": "SW8"}},
+    "m2": {"type": "electricity", "location": {"ukPostcodeOutcode": "N1"}},
+    "m3": {"type": "gas", "location": {"ukPostcodeOutcode": "E2"}},
+}
+
+
+@pytest.fixture
+def readings() -> ReadingStore:
+    start = np.array([0], dtype=np.int64)
+    series = Series(start, start + 1800, start, np.ones(1), np.ones(1))
+    store = ReadingStore()
+    store.add("m1", "import", series)
+    store.add("m1", "export", series)
+    store.add("m2", "import", series)
+    return store
+
+
+@pytest.fixture
+def registry(readings) -> Registry:
+    return Registry(METERS, {"alice": ["m1", "m2"], "bob": []}, ["m3"], readings)
+
+
+def test_datasources(registry):
+    assert registry.datasources("alice") == [
+        {
+            "id": "m1",
+            "type": "electricity",
+            "location": {"ukPostcodeOutcode": "SW8"},
+            "availableMeasures": ["import", "export"],
+        },
+        {
+            "id": "m2",
+            "type": "electricity",
+            "location": {"ukPostcodeOutcode": "N1"},
+            "availableMeasures": ["import"],
+        },
+    ]
+    assert registry.datasources("bob") == []
+    assert [d["id"] for d in registry.datasources("carol")] == ["m3"]
+
+
+def test_authorised(registry):
+    assert registry.authorised("alice", "m2")
+    assert not registry.authorised("alice", "m3")
+    assert not registry.authorised("bob", "m1")
+    assert registry.authorised("carol", "m3")
+
+
+def test_unknown_meter(readings):
+    with pytest.raises(ValueError):
+        Registry(METERS, {"alice": ["m4"]}, [], readings)
+
+
+def test_load_registry(tmp_path, readings):
+    path = tmp_path / "meters.json"
+    path.write_text(json.dumps({"meters": METERS, "accounts": {"alice": ["m1"]}}))
+
+    registry = load_registry(str(path), readings)
+
+    assert registry.location("m1") == {"ukPostcodeOutcode": "SW8"}
+    assert registry.authorised("alice", "m1")
+    assert registry.datasources("bob") == []
+
+
+def test_register_meters(tmp_path, readings):
+    path = tmp_path / "meters.json"
+    path.write_text(
+        json.dumps({"meters": {"m1": METERS["m1"]}, "defaultMeters": ["m1"]})
+    )
+
+    register_meters(str(path), {"m1": METERS["m1"], "m2": METERS["m2"]})
+
+    registry = load_registry(str(path), readings)
+    assert [d["id"] for d in registry.datasources("anyone")] == ["m1", "m2"]
+    assert registry.location("m2") == {"ukPostcodeOutcode": "N1"}
@@ -0,0 +1,104 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from api.aggregation import resample
+from api.rollups import Pyramid
+from api.series import Series, to_epoch
+from api.store import ReadingStore
+from tests import half_hours
+
+
+def utc(*args) -> datetime.datetime:
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def series() -> Series:
+    # Two and a bit years with a gap of a few days
+    count = 48 * 800
+    energy = np.random.default_rng(1).integers(0, 1000, count)
+    series = half_hours(
+        np.arange(count), energy, epoch=to_epoch(utc(2021, 11, 3, 5, 30))
+    )
+    gap = (series.start >= to_epoch(utc(2022, 6, 1))) & (
+        series.start < to_epoch(utc(2022, 6, 4))
+    )
+    return series.take(~gap)
+
+
+def raw_reader(series: Series):
+    return lambda start, end: series.window(start, end)
+
+
+@pytest.mark.parametrize("resolution", ["hour", "day", "month", "year"])
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (utc(2021, 1, 1), utc(2025, 1, 1)),
+        (utc(2021, 12, 15), utc(2023, 2, 3)),
+        (utc(2022, 3, 5, 7, 30), utc(2022, 3, 5, 9)),
+        (utc(2022, 5, 31, 22, 30), utc(2022, 7, 1, 0, 30)),
+        # No whole period of the coarser resolutions, but across a boundary
+        (utc(2022, 2, 15), utc(2022, 3, 15)),
+        (utc(2021, 12, 15), utc(2022, 2, 21)),
+        (utc(2022, 3, 5, 12, 30), utc(2022, 3, 6, 6)),
+        (utc(2022, 3, 5, 7, 30), utc(2022, 3, 5, 8, 30)),
+    ],
+)
+def test_resample_matches_raw_aggregation(series, resolution, start, end):
+    pyramid = Pyramid(series)
+
+    result = pyramid.resample(resolution, start, end, raw_reader(series))
+
+    expected = resample(series.between(start, end), resolution, start, end)
+    assert result.to_readings() == pytest.approx(expected.to_readings())
+
+
+def test_plan_uses_coarsest_levels(series):
+    pyramid = Pyramid(series)
+    start, end = to_epoch(utc(2021, 11, 30, 23)), to_epoch(utc(2024, 2, 1, 0, 30))
+
+    plan = pyramid.plan(start, end)
+
+    assert [level for level, _, _ in plan] == [
+        "hour",
+        "month",
+        "year",
+        "month",
+        "halfhour",
+    ]
+    assert plan[0][1] == start
+    assert plan[-1][2] == end
+    assert all(a[2] == b[1] for a, b in zip(plan, plan[1:]))
+
+
+def test_update_keeps_rollups_in_step(series):
+    head = series.window(0, to_epoch(utc(2023, 1, 1)))
+    tail = series.window(to_epoch(utc(2023, 1, 1)), to_epoch(utc(2030, 1, 1)))
+    correction = head.take(slice(1000, 1010))
+    correction.energy = correction.energy + 5
+    pyramid = Pyramid(head)
+
+    merged = head.concat(tail).concat(correction)
+    pyramid.update(tail, raw_reader(merged))
+    pyramid.update(correction, raw_reader(merged))
+
+    rebuilt = Pyramid(merged)
+    for level in ["hour", "day", "month", "year"]:
+        assert pyramid.levels[level].to_readings() == pytest.approx(
+            rebuilt.levels[level].to_readings()
+        )
+
+
+def test_store_aggregate(series):
+    store = ReadingStore()
+    store.add("meter", "import", series.window(0, to_epoch(utc(2022, 1, 1))))
+    store.add("meter", "import", series.window(to_epoch(utc(2022, 1, 1)), 2**40))
+    start, end = utc(2021, 1, 1), utc(2024, 1, 1)
+
+    result = store.aggregate("meter", "import", start, end, "month")
+
+    expected = resample(series.between(start, end), "month", start, end)
+    assert result.to_readings() == pytest.approx(expected.to_readings())
@@ -0,0 +1,171 @@
+import datetime
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from api import conf
+from api import store as store_module
+from api.series import Series, to_epoch
+from api.sqlite_store import SqliteStore
+from api.store import ReadingStore
+from tests import ROOT_DIR
+
+
+@pytest.fixture
+def series() -> Series:
+    with open(f"{ROOT_DIR}/../data/sample_data.json") as f:
+        return Series.from_readings(json.load(f))
+
+
+@pytest.fixture
+def store(tmp_path, series) -> SqliteStore:
+    store = SqliteStore(str(tmp_path / "readings.db"))
+    store.add("meter", "import", series)
+    store.add("meter", "export", series)
+    return store
+
+
+def test_between(store, series):
+    start = datetime.datetime(2012, 2, 21, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2012, 2, 22, tzinfo=datetime.timezone.utc)
+
+    result = store.between("meter", "import", start, end)
+
+    assert len(result) == 48
+    assert result.to_readings() == series.between(start, end).to_readings()
+
+
+def test_series_metadata(store, series):
+    assert store.has_series("meter", "import")
+    assert not store.has_series("meter", "gas")
+    assert store.measures("meter") == ["import", "export"]
+    assert store.series("meter", "import").to_readings() == series.to_readings()
+    assert len(store.series("meter", "gas")) == 0
+
+
+def test_add_replaces_existing_interval(store, series):
+    update = series.take(slice(0, 1))
+    update.energy = update.energy + 1
+    store.add("meter", "import", update)
+
+    result = store.series("meter", "import")
+
+    assert len(result) == len(series)
+    assert result.energy[0] == series.energy[0] + 1
+    assert store.measures("meter") == ["import", "export"]
+
+
+def test_range_query_uses_primary_key(store):
+    plan = (
+        store.connection()
+        .execute(
+            "EXPLAIN QUERY PLAN SELECT interval_start, energy FROM readings "
+            "WHERE meter_id = ? AND measure = ? "
+            "AND interval_start >= ? AND interval_start < ?",
+            ("meter", "import", 0, 1),
+        )
+        .fetchall()
+    )
+
+    assert "SEARCH readings USING PRIMARY KEY" in plan[0][-1]
+
+
+def test_connection_per_thread(store):
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(store.connection()))
+    thread.start()
+    thread.join()
+
+    assert connections[0] is not store.connection()
+    assert store.connection().execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+
+def test_get_store_sqlite(monkeypatch, store):
+    monkeypatch.setattr(conf, "READINGS_BACKEND", "sqlite")
+    monkeypatch.setattr(conf, "READINGS_DATABASE", store.path)
+    store_module.get_store.cache_clear()
+    try:
+        assert isinstance(store_module.get_store(), SqliteStore)
+    finally:
+        store_module.get_store.cache_clear()
+
+
+def test_between_limit(store, series):
+    start = datetime.datetime(2012, 2, 21, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2012, 2, 22, tzinfo=datetime.timezone.utc)
+
+    result = store.between("meter", "import", start, end, limit=5)
+
+    assert result.to_readings() == series.between(start, end, 5).to_readings()
+
+
+def utc(*args) -> datetime.datetime:
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def history(tmp_path_factory) -> tuple[SqliteStore, ReadingStore]:
+    # Over two years of half-hours with a gap of a few days
+    starts = to_epoch(utc(2021, 11, 3, 5, 30)) + np.arange(48 * 800) * 1800
+    energy = np.random.default_rng(1).integers(0, 1000, len(starts)) * 1.0
+    series = Series(starts, starts + 1800, starts + 900, energy, np.cumsum(energy))
+    series = series.take(
+        (series.start < to_epoch(utc(2022, 6, 1)))
+        | (series.start >= to_epoch(utc(2022, 6, 4)))
+    )
+    sqlite = SqliteStore(str(tmp_path_factory.mktemp("history") / "readings.db"))
+    memory = ReadingStore()
+    for store in (sqlite, memory):
+        store.add("meter", "import", series)
+    return sqlite, memory
+
+
+RANGES = [
+    (utc(2021, 1, 1), utc(2025, 1, 1)),
+    (utc(2021, 12, 15), utc(2023, 2, 3)),
+    (utc(2022, 3, 5, 7, 30), utc(2022, 3, 5, 9)),
+    (utc(2022, 5, 31, 22, 30), utc(2022, 7, 1, 0, 30)),
+]
+
+
+@pytest.mark.parametrize("resolution", ["halfhour", "hour", "day", "month", "year"])
+@pytest.mark.parametrize("start, end", RANGES)
+def test_aggregate_matches_indexes(history, resolution, start, end):
+    sqlite, memory = history
+
+    result = sqlite.aggregate("meter", "import", start, end, resolution)
+
+    expected = memory.aggregate("meter", "import", start, end, resolution)
+    assert result.to_readings() == pytest.approx(expected.to_readings())
+
+
+@pytest.mark.parametrize("start, end", RANGES + [(utc(2030, 1, 1), utc(2030, 1, 2))])
+def test_total_and_availability_match_indexes(history, start, end):
+    sqlite, memory = history
+
+    assert sqlite.total("meter", "import", start, end) == pytest.approx(
+        memory.total("meter", "import", start, end)
+    )
+    assert sqlite.availability("meter", "import", start, end) == (
+        memory.availability("meter", "import", start, end)
+    )
+    assert sqlite.complete("meter", "import", start, end) == (
+        memory.complete("meter", "import", start, end)
+    )
+
+
+def test_queries_do_not_load_the_series(history, mocker):
+    sqlite, _ = history
+    series = mocker.spy(sqlite, "series")
+    start, end = RANGES[1]
+
+    sqlite.etag("meter", "import", start, end)
+    sqlite.complete("meter", "import", start, end)
+    sqlite.total("meter", "import", start, end)
+    sqlite.availability("meter", "import", start, end)
+    sqlite.aggregate("meter", "import", start, end, "month")
+
+    assert series.call_count == 0
+    assert sqlite._indexes == {}
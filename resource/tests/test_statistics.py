@@ -0,0 +1,33 @@
+import numpy as np
+
+from api.series import Series
+from api.statistics import load_profile, time_of_day
+from tests import half_hours
+
+
+def test_time_of_day():
+    starts = np.array([0, 1800, 86400 - 1800, 86400, 86400 + 3600])
+
+    assert time_of_day(starts).tolist() == [0, 1, 47, 0, 2]
+
+
+def test_load_profile():
+    # Two days, the first reading of each day and 01:00 on the second
+    readings = half_hours([0, 1, 48, 50], [1.0, 4.0, 3.0, 2.0])
+
+    result = load_profile(readings, (50.0, 100.0))
+
+    assert result["intervals"] == 4
+    assert result["peak"] == {"from": 1800, "to": 3600, "energy": 4.0}
+    assert result["mean"] == 2.5
+    assert result["baseload"] == np.percentile([1.0, 4.0, 3.0, 2.0], 10)
+    assert result["percentiles"] == [(50.0, 2.5), (100.0, 4.0)]
+    assert result["profile"] == [(0, 2.0, 2), (1800, 4.0, 1), (3600, 2.0, 1)]
+
+
+def test_load_profile_empty():
+    result = load_profile(Series.empty())
+
+    assert result["intervals"] == 0
+    assert result["peak"] is None
+    assert result["profile"] == []
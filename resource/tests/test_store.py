@@ -0,0 +1,103 @@
+import datetime
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pydantic import ValidationError
+
+from api.series import Series, date_range
+from api.store import ReadingStore, load_json
+
+
+def reading(start: str, end: str, value: float) -> dict:
+    return {
+        "type": "Electricity",
+        "from": start,
+        "to": end,
+        "takenAt": end,
+        "energy": {"value": value, "unitCode": "WHR"},
+        "cumulative": {"value": value, "unitCode": "WHR"},
+    }
+
+
+@pytest.fixture
+def readings():
+    return [
+        reading("2024-01-01T23:30:00Z", "2024-01-02T00:00:00Z", 1.0),
+        reading("2024-01-02T00:00:00Z", "2024-01-02T00:30:00Z", 2.0),
+        reading("2024-01-02T00:30:00Z", "2024-01-02T01:00:00Z", 3.0),
+        reading("2024-01-02T23:30:00Z", "2024-01-03T00:00:00Z", 4.0),
+        reading("2024-01-03T00:00:00Z", "2024-01-03T00:30:00Z", 5.0),
+    ]
+
+
+def test_readings_in_range(readings):
+    store = ReadingStore()
+    # Out of order input is indexed by interval start
+    store.add("meter", "import", Series.from_readings(list(reversed(readings))))
+
+    start, end = date_range(datetime.date(2024, 1, 2), datetime.date(2024, 1, 3))
+    result = store.readings("meter", "import", start, end)
+
+    assert [r["energy"]["value"] for r in result] == [2.0, 3.0, 4.0]
+
+
+def test_readings_unknown_series(readings):
+    store = ReadingStore()
+    store.add("meter", "import", Series.from_readings(readings))
+
+    start, end = date_range(datetime.date(2024, 1, 1), datetime.date(2024, 1, 4))
+    assert len(store.between("meter", "export", start, end)) == 0
+    assert store.has_series("meter", "import")
+    assert not store.has_series("other", "import")
+
+
+def test_add_replaces_existing_interval(readings):
+    store = ReadingStore()
+    store.add("meter", "import", Series.from_readings(readings))
+    store.add(
+        "meter",
+        "import",
+        Series.from_readings(
+            [reading("2024-01-02T00:00:00Z", "2024-01-02T00:30:00Z", 20.0)]
+        ),
+    )
+
+    start, end = date_range(datetime.date(2024, 1, 2), datetime.date(2024, 1, 3))
+    result = store.readings("meter", "import", start, end)
+
+    assert [r["energy"]["value"] for r in result] == [20.0, 3.0, 4.0]
+
+
+def test_load_json(tmp_path, readings):
+    path = tmp_path / "readings.json"
+    path.write_text(json.dumps(readings))
+
+    store = load_json(str(path), "meter", ["import", "export"])
+
+    assert store.measures("meter") == ["import", "export"]
+
+
+def test_load_json_invalid(tmp_path, readings):
+    path = tmp_path / "readings.json"
+    del readings[1]["energy"]["unitCode"]
+    path.write_text(json.dumps(readings))
+
+    with pytest.raises(ValidationError):
+        load_json(str(path), "meter", ["import"])
+
+
+def test_index_built_once_across_threads(readings, mocker):
+    store = ReadingStore()
+    store.add("meter", "import", Series.from_readings(readings))
+    store._indexes.clear()
+    series = mocker.spy(store, "series")
+    start, end = date_range(datetime.date(2024, 1, 1), datetime.date(2024, 1, 4))
+
+    with ThreadPoolExecutor(8) as pool:
+        totals = list(
+            pool.map(lambda _: store.total("meter", "import", start, end), range(32))
+        )
+
+    assert series.call_count == 1
+    assert {total["energy"] for total in totals} == {15.0}
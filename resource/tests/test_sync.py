@@ -0,0 +1,151 @@
+import pytest
+
+from api.series import Series, from_epoch
+from api.sqlite_store import SqliteStore
+from api.store import ReadingStore
+from api.sync import (
+    Versions,
+    decode_watermark,
+    encode_watermark,
+    etag_matches,
+)
+from tests import half_hours
+
+INTERVAL = 1800
+
+
+def no_raw(start: int, end: int) -> Series:
+    raise AssertionError("Versions does not read the series")
+
+
+def test_watermark_round_trip():
+    assert decode_watermark(encode_watermark("abc", 3)) == ("abc", 3)
+
+
+@pytest.mark.parametrize(
+    "watermark", ["", "notawatermark", encode_watermark("a", 1)[:-2]]
+)
+def test_invalid_watermark(watermark):
+    with pytest.raises(ValueError):
+        decode_watermark(watermark)
+
+
+def test_etag_matches():
+    assert etag_matches('W/"abc-1"', 'W/"abc-1"')
+    assert etag_matches('"abc-1"', 'W/"abc-1"')
+    assert etag_matches('W/"xyz-0", W/"abc-1"', 'W/"abc-1"')
+    assert etag_matches("*", 'W/"abc-1"')
+    assert not etag_matches('W/"abc-0"', 'W/"abc-1"')
+    assert not etag_matches(None, 'W/"abc-1"')
+
+
+def test_generation_is_digest_of_readings():
+    assert Versions(half_hours([1, 2])).generation == (
+        Versions(half_hours([1, 2])).generation
+    )
+    assert Versions(half_hours([1, 2])).generation != (
+        Versions(half_hours([1, 3])).generation
+    )
+
+
+def test_etag_changes_with_range():
+    versions = Versions(half_hours(list(range(10))))
+    before = versions.etag(0, 10 * INTERVAL)
+
+    versions.update(half_hours([20, 21]), no_raw)
+
+    assert versions.version == 1
+    assert versions.etag(0, 10 * INTERVAL) == before
+    assert versions.etag(0, 30 * INTERVAL) != before
+    # Correcting a reading changes the range holding it
+    versions.update(half_hours([5], 2.0), no_raw)
+    assert versions.etag(0, 10 * INTERVAL) != before
+    assert versions.etag(6 * INTERVAL, 10 * INTERVAL) == before
+
+
+def test_changed():
+    versions = Versions(half_hours(list(range(10))))
+    watermark = versions.watermark()
+    versions.update(half_hours([10, 11]), no_raw)
+    middle = versions.watermark()
+    versions.update(half_hours([3, 12]), no_raw)
+
+    changed = versions.changed(watermark, 0, 100 * INTERVAL)
+    assert (changed // INTERVAL).tolist() == [3, 10, 11, 12]
+    changed = versions.changed(middle, 0, 100 * INTERVAL)
+    assert (changed // INTERVAL).tolist() == [3, 12]
+    changed = versions.changed(middle, 0, 10 * INTERVAL)
+    assert (changed // INTERVAL).tolist() == [3]
+    assert len(versions.changed(versions.watermark(), 0, 100 * INTERVAL)) == 0
+
+
+def test_changed_other_generation():
+    versions = Versions(half_hours(list(range(10))))
+    other = Versions(half_hours(list(range(11)))).watermark()
+
+    assert versions.changed(other, 0, 100 * INTERVAL) is None
+    assert versions.changed(encode_watermark(versions.generation, 5), 0, 10) is None
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def readings(request, tmp_path):
+    if request.param == "sqlite":
+        readings = SqliteStore(str(tmp_path / "readings.db"))
+    else:
+        readings = ReadingStore()
+    readings.add("meter", "import", half_hours(list(range(48))))
+    return readings
+
+
+def test_store_changes(readings):
+    start, end = from_epoch(0), from_epoch(48 * INTERVAL)
+    watermark = readings.watermark("meter", "import")
+    etag = readings.etag("meter", "import", start, end)
+
+    readings.add("meter", "import", half_hours([10, 11], 5.0))
+
+    assert readings.etag("meter", "import", start, end) != etag
+    changes = readings.changes("meter", "import", start, end, watermark)
+    assert (changes.start // INTERVAL).tolist() == [10, 11]
+    assert changes.energy.tolist() == [5.0, 5.0]
+    changes = readings.changes(
+        "meter", "import", start, end, readings.watermark("meter", "import")
+    )
+    assert len(changes) == 0
+
+
+def test_sqlite_external_writes(tmp_path):
+    path = str(tmp_path / "readings.db")
+    readings = SqliteStore(path)
+    readings.add("meter", "import", half_hours(list(range(48))))
+    watermark = readings.watermark("meter", "import")
+
+    # Written by another connection, as api.ingest would
+    SqliteStore(path).add("meter", "import", half_hours([48]))
+
+    assert readings.watermark("meter", "import") != watermark
+    # The other indexes are rebuilt too
+    assert readings.complete(
+        "meter", "import", from_epoch(0), from_epoch(49 * INTERVAL)
+    )
+
+
+def test_sqlite_versions_survive_external_writes(tmp_path):
+    path = str(tmp_path / "readings.db")
+    readings = SqliteStore(path)
+    readings.add("meter", "import", half_hours(list(range(48))))
+    day = (from_epoch(0), from_epoch(48 * INTERVAL))
+    etag = readings.etag("meter", "import", *day)
+    watermark = readings.watermark("meter", "import")
+
+    # Written by another process, as api.ingest would
+    SqliteStore(path).add("meter", "import", half_hours([48, 49]))
+
+    # The ETag of the unchanged day holds, and the watermark still selects
+    # just the readings written after it
+    assert readings.etag("meter", "import", *day) == etag
+    changes = readings.changes(
+        "meter", "import", from_epoch(0), from_epoch(100 * INTERVAL), watermark
+    )
+    assert (changes.start // INTERVAL).tolist() == [48, 49]
+    assert decode_watermark(readings.watermark("meter", "import"))[1] == 2
@@ -0,0 +1,108 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pytest
+
+from api import columnar, synthetic
+from api.ingest import Validator, read_csv, read_jsonl
+from api.registry import load_registry
+from api.sqlite_store import SqliteStore
+from tests import ROOT_DIR
+
+
+@pytest.fixture(scope="module")
+def datasets() -> list:
+    return list(synthetic.generate(2, 1, gap_rate=0.02, seed=1))
+
+
+def test_generate(datasets):
+    assert [measure for _, measure, _ in datasets] == [
+        "import",
+        "export",
+        "import",
+        "export",
+    ]
+    meter_id, _, series = datasets[0]
+    assert len(meter_id) == 22
+    # 2020 is a leap year, about 2% of the half-hours are missing
+    assert 0.95 * 366 * 48 < len(series) < 366 * 48
+    assert np.all(np.diff(series.start) >= 1800)
+    assert np.all(series.end - series.start == 1800)
+
+
+def test_generate_cumulative(datasets):
+    for _, _, series in datasets:
+        contiguous = series.start[1:] == series.end[:-1]
+        step = np.diff(series.cumulative)
+        assert np.allclose(step[contiguous], series.energy[1:][contiguous])
+        # The meter keeps counting through gaps
+        assert np.all(step[~contiguous] - series.energy[1:][~contiguous] > -1e-6)
+
+
+def test_generate_seasonality(datasets):
+    _, _, imports = datasets[0]
+    _, _, exports = datasets[1]
+    month = imports.start.astype("datetime64[s]").astype("datetime64[M]")
+    january = month == np.datetime64("2020-01")
+    july = month == np.datetime64("2020-07")
+    assert imports.energy[january].mean() > imports.energy[july].mean()
+    month = exports.start.astype("datetime64[s]").astype("datetime64[M]")
+    assert (
+        exports.energy[month == np.datetime64("2020-07")].mean()
+        > exports.energy[month == np.datetime64("2020-01")].mean()
+    )
+    # No solar export at midnight
+    assert np.all(exports.energy[exports.start % 86400 == 0] == 0)
+
+
+def test_generate_repeatable():
+    first = list(synthetic.generate(1, 1, seed=3))
+    second = list(synthetic.generate(1, 1, seed=3))
+
+    assert first[0][0] == second[0][0]
+    assert np.array_equal(first[0][2].energy, second[0][2].energy)
+
+
+@pytest.mark.parametrize("format", synthetic.FORMATS)
+def test_write(tmp_path, format):
+    datasets = list(
+        synthetic.generate(
+            1, 1, datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+    )
+    meter_id, measure, expected = datasets[0]
+    output = str(tmp_path / ("readings.db" if format == "sqlite" else "out"))
+
+    count = synthetic.write(iter(datasets), output, format)
+
+    assert count == sum(len(series) for _, _, series in datasets)
+    name = os.path.join(output, f"{meter_id}-{measure}")
+    if format == "columnar":
+        series = columnar.read_series(columnar.series_path(output, meter_id, measure))
+    elif format == "sqlite":
+        series = SqliteStore(output).series(meter_id, measure)
+    else:
+        reader = read_csv if format == "csv" else read_jsonl
+        validator = Validator()
+        batches = [validator.check(b) for b in reader(f"{name}.{format}")]
+        assert validator.recomputed == 0
+        series = batches[0]
+    assert np.array_equal(series.start, expected.start)
+    assert np.allclose(series.cumulative, expected.cumulative)
+
+
+def test_write_registers_meters(tmp_path):
+    registry = tmp_path / "meters.json"
+    with open(f"{ROOT_DIR}/../data/meters.json") as f:
+        registry.write_text(f.read())
+    database = str(tmp_path / "readings.db")
+
+    synthetic.write(synthetic.generate(2, 1), database, "sqlite", str(registry))
+
+    meter_ids = list(json.loads(registry.read_text())["meters"])[1:]
+    assert len(meter_ids) == 2
+    sources = load_registry(str(registry), SqliteStore(database)).datasources("any")
+    assert [source["id"] for source in sources][1:] == meter_ids
+    assert sources[1]["availableMeasures"] == ["import", "export"]
@@ -0,0 +1,196 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from api.series import Series, from_epoch, to_epoch
+from api.store import ReadingStore
+from api.synthetic import generate
+from api.tiers import Tiers
+
+START = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def utc(*args) -> datetime.datetime:
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def series() -> Series:
+    # Two years of half-hours, 2020 and 2021
+    _, _, series = next(generate(1, 2, START))
+    return series
+
+
+@pytest.fixture
+def tiers(tmp_path) -> Tiers:
+    return Tiers(str(tmp_path), hot_days=30, promoted_bytes=1 << 20)
+
+
+def test_split(tiers, series):
+    tiered = tiers.split("meter", "import", series)
+
+    # The hot tier starts at the month 30 days before the last reading
+    assert from_epoch(tiered.cutoff) == utc(2021, 12, 1)
+    assert len(tiered.hot) == np.count_nonzero(series.start >= tiered.cutoff)
+    assert len(tiered.months) == 23
+    assert len(os.listdir(tiered.directory)) == 23
+    assert len(tiered) == len(series)
+    assert tiered.to_series().to_readings() == series.to_readings()
+
+
+@pytest.mark.parametrize(
+    "start, end, limit",
+    [
+        (utc(2021, 12, 5), utc(2021, 12, 20), None),
+        (utc(2020, 3, 15), utc(2020, 6, 2), None),
+        (utc(2021, 11, 20), utc(2022, 1, 1), None),
+        (utc(2019, 1, 1), utc(2023, 1, 1), None),
+        (utc(2020, 3, 15), utc(2021, 1, 1), 100),
+        (utc(2020, 3, 15), utc(2021, 1, 1), 5000),
+        (utc(2021, 11, 30), utc(2022, 1, 1), 100),
+    ],
+)
+def test_between_stitches_tiers(tiers, series, start, end, limit):
+    tiered = tiers.split("meter", "import", series)
+
+    result = tiered.between(start, end, limit)
+
+    assert result.to_readings() == series.between(start, end, limit).to_readings()
+
+
+def test_promotion_and_hit_rates(tiers, series):
+    tiered = tiers.split("meter", "import", series)
+
+    tiered.between(utc(2021, 12, 1), utc(2022, 1, 1))
+    for _ in range(3):
+        tiered.between(utc(2020, 5, 1), utc(2020, 6, 1))
+
+    stats = tiers.stats()
+    assert stats["queries"] == 4
+    assert stats["hotOnly"] == 1
+    assert stats["hotHitRate"] == 0.25
+    # Read from disk twice, then from memory once promoted
+    assert (stats["coldReads"], stats["promotedHits"]) == (3, 1)
+    assert stats["promotedMonths"] == 1
+    assert 0 < stats["promotedBytes"] <= 1 << 20
+
+
+def test_concat_moves_cutoff_and_rewrites_months(tiers, series):
+    tiered = tiers.split(
+        "meter", "import", series.take(series.start < to_epoch(utc(2021, 6, 1)))
+    )
+    months = len(tiered.months)
+    old_month = tiered.months[to_epoch(utc(2020, 3, 1))].path
+    correction = series.take(series.start == to_epoch(utc(2020, 3, 10)))
+    correction.energy = correction.energy + 1
+
+    merged = tiered.concat(
+        series.take(series.start >= to_epoch(utc(2021, 6, 1)))
+    ).concat(correction)
+
+    expected = series.concat(correction)
+    assert merged.to_series().to_readings() == expected.to_readings()
+    assert from_epoch(merged.cutoff) == utc(2021, 12, 1)
+    assert (months, len(merged.months)) == (16, 23)
+    # The replaced month is left on disk for other processes still reading it
+    assert old_month not in [month.path for month in merged.months.values()]
+    assert os.path.exists(old_month)
+    assert (
+        merged.between(utc(2020, 3, 10), utc(2020, 3, 11)).energy[0]
+        == correction.energy[0]
+    )
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (utc(2020, 6, 1), utc(2021, 12, 20)),
+        (utc(2020, 2, 15), utc(2020, 3, 15)),
+        (utc(2019, 12, 15), utc(2022, 2, 1)),
+        (utc(2021, 11, 20, 12), utc(2021, 12, 2, 6)),
+        (utc(2021, 12, 2), utc(2021, 12, 9)),
+        (utc(2020, 4, 1), utc(2020, 5, 1)),
+    ],
+)
+def test_store_with_tiers(tiers, series, start, end):
+    # Gaps within a month, across a month boundary and across the cutoff
+    gaps = [
+        (utc(2020, 3, 3), utc(2020, 3, 4)),
+        (utc(2020, 4, 30, 20), utc(2020, 5, 1, 4)),
+        (utc(2021, 11, 30, 22), utc(2021, 12, 1, 2)),
+    ]
+    for first, last in gaps:
+        series = series.take(
+            (series.start < to_epoch(first)) | (series.start >= to_epoch(last))
+        )
+    tiered = ReadingStore(tiers=tiers)
+    tiered.add("meter", "import", series)
+    plain = ReadingStore()
+    plain.add("meter", "import", series)
+
+    total = tiered.total("meter", "import", start, end)
+    expected = plain.total("meter", "import", start, end)
+    assert total == {**expected, "energy": pytest.approx(expected["energy"])}
+    for resolution in ["hour", "day", "month", "year"]:
+        result = tiered.aggregate("meter", "import", start, end, resolution)
+        expected = plain.aggregate("meter", "import", start, end, resolution)
+        assert result.start.tolist() == expected.start.tolist()
+        assert result.end.tolist() == expected.end.tolist()
+        assert result.taken_at.tolist() == expected.taken_at.tolist()
+        assert result.energy.tolist() == pytest.approx(expected.energy.tolist())
+        assert result.cumulative.tolist() == expected.cumulative.tolist()
+    assert tiered.between("meter", "import", start, end).to_readings() == (
+        plain.between("meter", "import", start, end).to_readings()
+    )
+    assert tiered.watermark("meter", "import") == plain.watermark("meter", "import")
+    assert tiered.availability("meter", "import", start, end) == (
+        plain.availability("meter", "import", start, end)
+    )
+
+
+def test_store_indexes_hold_only_hot_readings(tiers, series):
+    tiered = ReadingStore(tiers=tiers)
+    tiered.add("meter", "import", series)
+    hot = len(tiered._series["meter", "import"].hot)
+
+    sums = tiered._hot("totals", "meter", "import")
+    pyramid = tiered._hot("rollups", "meter", "import")
+    cutoff = tiered._series["meter", "import"].cutoff
+    assert len(sums.start) == hot
+    assert pyramid.levels["hour"].start[0] == cutoff
+
+    # Readings moving the cutoff on rebuild them from the new hot readings
+    start = to_epoch(utc(2022, 1, 1)) + np.arange(48 * 40, dtype=np.int64) * 1800
+    values = np.ones(len(start))
+    added = Series(start, start + 1800, start + 900, values, np.cumsum(values))
+    tiered.add("meter", "import", added)
+    plain = ReadingStore()
+    plain.add("meter", "import", series.concat(added))
+    moved = tiered._series["meter", "import"]
+    assert from_epoch(moved.cutoff) == utc(2022, 1, 1)
+    assert len(tiered._hot("totals", "meter", "import").start) == len(moved.hot)
+    total = tiered.total("meter", "import", utc(2021, 12, 1), utc(2022, 2, 10))
+    expected = plain.total("meter", "import", utc(2021, 12, 1), utc(2022, 2, 10))
+    assert total == {**expected, "energy": pytest.approx(expected["energy"])}
+
+
+def test_hot_tier_does_not_hold_history(tiers, series):
+    tiered = tiers.split("meter", "import", series)
+
+    assert tiered.hot.start.base is None
+    assert tiered.nbytes < 40 * 48 * 40
+
+
+def test_processes_share_cold_months(tmp_path, series):
+    tiered = Tiers(str(tmp_path), 30, 1 << 20).split("meter", "import", series)
+    paths = [month.path for month in tiered.months.values()]
+    modified = [os.stat(path).st_mtime_ns for path in paths]
+
+    # As another process loading the same readings, or this one restarted
+    again = Tiers(str(tmp_path), 30, 1 << 20).split("meter", "import", series)
+
+    assert [month.path for month in again.months.values()] == paths
+    assert [os.stat(path).st_mtime_ns for path in paths] == modified
+    assert len(os.listdir(tiered.directory)) == 23
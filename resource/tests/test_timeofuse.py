@@ -0,0 +1,73 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from api.series import to_epoch
+from api.timeofuse import Bands, interval_codes, is_weekend
+from tests import half_hours
+
+# Monday
+MONDAY = to_epoch(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+
+
+def test_is_weekend():
+    days = MONDAY + np.arange(7) * 86400
+
+    assert is_weekend(days).tolist() == [False] * 5 + [True] * 2
+
+
+def test_interval_codes():
+    starts = MONDAY + np.array([0, 1800, 5 * 86400, 5 * 86400 + 47 * 1800])
+
+    assert interval_codes(starts).tolist() == [0, 1, 48, 95]
+
+
+def test_bands():
+    bands = Bands("overnight=23:00-07:00,peak=16:00-19:00", "off-peak")
+
+    assert bands.names == ["off-peak", "overnight", "peak"]
+    slots = bands.buckets[:48] // 2
+    assert slots[[0, 13, 14, 31, 32, 37, 38, 45, 46, 47]].tolist() == [
+        1, 1, 0, 0, 2, 2, 0, 0, 1, 1,
+    ]  # fmt: skip
+    assert bands.buckets[48:].tolist() == (bands.buckets[:48] + 1).tolist()
+
+
+@pytest.mark.parametrize("spec", ["peak=16:15-19:00", "peak", "peak=16:00"])
+def test_bands_invalid(spec):
+    with pytest.raises(ValueError):
+        Bands(spec, "off-peak")
+
+
+def test_totals():
+    bands = Bands("overnight=00:00-07:00,peak=16:00-19:00", "off-peak")
+    # Monday 00:00, 00:30, 16:00 and 12:00, then Saturday 00:00
+    readings = half_hours(
+        [0, 1, 32, 24, 5 * 48], [1.0, 2.0, 4.0, 8.0, 16.0], epoch=MONDAY
+    )
+    readings = readings.sorted()
+    codes = interval_codes(readings.start)
+
+    rows = bands.totals(readings, codes, "day")
+
+    assert [
+        (row["from"] - MONDAY, row["band"], row["dayType"], row["energy"])
+        for row in rows
+    ] == [
+        (0, "off-peak", "weekday", 8.0),
+        (0, "overnight", "weekday", 3.0),
+        (0, "peak", "weekday", 4.0),
+        (5 * 86400, "overnight", "weekend", 16.0),
+    ]
+    assert rows[1]["intervals"] == 2
+
+    rows = bands.totals(readings, codes, "month", MONDAY, MONDAY + 7 * 86400)
+    assert [(row["band"], row["dayType"], row["energy"]) for row in rows] == [
+        ("off-peak", "weekday", 8.0),
+        ("overnight", "weekday", 3.0),
+        ("overnight", "weekend", 16.0),
+        ("peak", "weekday", 4.0),
+    ]
+    assert rows[0]["from"] == MONDAY
+    assert rows[0]["to"] == MONDAY + 7 * 86400
@@ -0,0 +1,63 @@
+import pytest
+
+from api.series import Series
+from api.totals import PrefixSums
+from tests import half_hours
+
+
+def raw_reader(series: Series):
+    return lambda start, end: series.window(start, end)
+
+
+@pytest.fixture
+def series() -> Series:
+    # Interval 3 and 6 are missing
+    return half_hours([0, 1, 2, 4, 5, 7, 8], [1, 2, 3, 4, 5, 6, 7])
+
+
+def test_total(series):
+    result = PrefixSums(series).total(1 * 1800, 8 * 1800)
+
+    assert result["energy"] == 2 + 3 + 4 + 5 + 6
+    assert result["intervals"] == 5
+    assert result["expectedIntervals"] == 7
+    assert result["gaps"] == [(3 * 1800, 4 * 1800), (6 * 1800, 7 * 1800)]
+
+
+def test_total_edge_gaps(series):
+    result = PrefixSums(series).total(-2 * 1800, 11 * 1800)
+
+    assert result["energy"] == 28
+    assert result["gaps"][0] == (-2 * 1800, 0)
+    assert result["gaps"][-1] == (9 * 1800, 11 * 1800)
+
+
+def test_total_no_readings(series):
+    result = PrefixSums(series).total(20 * 1800, 22 * 1800)
+
+    assert result["energy"] == 0
+    assert result["intervals"] == 0
+    assert result["gaps"] == [(20 * 1800, 22 * 1800)]
+
+
+def test_update_append(series):
+    sums = PrefixSums(series)
+    added = half_hours([10, 11], [10, 20])
+
+    sums.update(added, raw_reader(series.concat(added)))
+
+    result = sums.total(0, 12 * 1800)
+    assert result["energy"] == 28 + 30
+    assert result["gaps"][-1] == (9 * 1800, 10 * 1800)
+    assert len(result["gaps"]) == 3
+
+
+def test_update_fills_gap(series):
+    sums = PrefixSums(series)
+    added = half_hours([3], [100])
+
+    sums.update(added, raw_reader(series.concat(added)))
+
+    result = sums.total(0, 9 * 1800)
+    assert result["energy"] == 128
+    assert result["gaps"] == [(6 * 1800, 7 * 1800)]